@@ -0,0 +1,71 @@
+import inspect
+from functools import wraps
+
+from fastapi import APIRouter, Depends
+from fastapi.routing import APIRoute
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.responses import Response
+
+from app.database import get_async_db
+
+
+def _async_endpoint(route: APIRoute):
+    """Wrap a sync `db: Session` endpoint into an async one.
+
+    The handler body runs through AsyncSession.run_sync(), so its queries are
+    driven by aiosqlite on the event loop instead of in the threadpool. The
+    response model is built inside run_sync as well, because lazy
+    relationship loads are only possible while the sync session is active.
+    """
+    endpoint = route.endpoint
+    adapter = TypeAdapter(route.response_model) if route.response_model is not None else None
+
+    @wraps(endpoint)
+    async def async_endpoint(db: AsyncSession, **kwargs):
+        def call(session):
+            result = endpoint(db=session, **kwargs)
+            if adapter is not None and not isinstance(result, Response):
+                result = adapter.validate_python(result, from_attributes=True)
+            return result
+
+        return await db.run_sync(call)
+
+    signature = inspect.signature(endpoint)
+    async_endpoint.__signature__ = signature.replace(parameters=[
+        parameter.replace(annotation=AsyncSession, default=Depends(get_async_db))
+        if name == "db" else parameter
+        for name, parameter in signature.parameters.items()
+    ])
+    return async_endpoint
+
+
+def async_router(router: APIRouter) -> APIRouter:
+    """Return a copy of `router` whose database endpoints are async."""
+    result = APIRouter()
+    for route in router.routes:
+        if not isinstance(route, APIRoute):
+            result.routes.append(route)
+            continue
+
+        endpoint = route.endpoint
+        if "db" in inspect.signature(endpoint).parameters and not inspect.iscoroutinefunction(endpoint):
+            endpoint = _async_endpoint(route)
+
+        result.add_api_route(
+            route.path,
+            endpoint,
+            response_model=route.response_model,
+            status_code=route.status_code,
+            tags=route.tags,
+            dependencies=route.dependencies,
+            summary=route.summary,
+            description=route.description,
+            responses=route.responses,
+            methods=route.methods,
+            name=route.name,
+            response_class=route.response_class,
+            include_in_schema=route.include_in_schema,
+            route_class_override=type(route),
+        )
+    return result
@@ -0,0 +1,373 @@
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import ReadSessionLocal, read_gate
+from app.models.models import (
+    Album as AlbumModel, Artist as ArtistModel, Track as TrackModel,
+    SalesByAlbum, SalesByArtist, SalesByTrack,
+)
+from app.versions import current_version
+
+# Search-as-you-type over artist, album and track names, answered from memory.
+# Every name is indexed under each of its word starts, so "lotta" finds
+# "Whole Lotta Love", and matches are ranked by units sold, as counted by the
+# sales rollups. The index is built at startup and kept up to date by the
+# write handlers of the artists, albums and tracks routers; popularity is
+# re-read from the rollups every CHINOOK_AUTOCOMPLETE_REFRESH seconds.
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Past the last character any key can start with
+_AFTER = "\U0010ffff"
+
+# Most matches a search returns per type
+MAX_LIMIT = 100
+
+# The top MAX_LIMIT matches of every prefix up to this long are computed
+# when the index is built; those of longer prefixes on first use, and kept
+# for the _CACHED_PREFIXES most recently used
+_PRECOMPUTED_LENGTH = 3
+_CACHED_PREFIXES = 10000
+
+# Names re-ranked per hold of the index lock
+_RERANK_BATCH = 100
+
+
+def normalize(text: str) -> str:
+    """Case- and accent-insensitive form of `text`, as the index compares it."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def _keys(name: str) -> tuple:
+    normalized = normalize(name)
+    return tuple(sorted({normalized[match.start():] for match in _WORD_RE.finditer(normalized)}))
+
+
+class NameIndex:
+    """Names of one table, searchable by prefix and ranked by popularity.
+
+    `_keys` is a sorted array of (key, id) pairs, one per word start of each
+    name, and `_ranked` the (-popularity, id) ranks of every name, sorted.
+    `_top` and `_recent` hold the best ranks per prefix, at most MAX_LIMIT
+    of them; a list shorter than that holds every match. Not thread-safe on
+    its own; AutocompleteIndex serializes access.
+    """
+
+    def __init__(self):
+        self._names = {}
+        self._keys = []
+        self._ranked = []
+        self._top = {}
+        self._recent = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def load(self, rows):
+        """Replace the contents with `rows` of (id, name, popularity)."""
+        self._names = {}
+        for id_, name, popularity in rows:
+            if name:
+                self._names[id_] = (name, (-(popularity or 0), id_), _keys(name))
+        self._keys = sorted((key, id_) for id_, (_, _, keys) in self._names.items() for key in keys)
+        self._ranked = sorted(rank for _, rank, _ in self._names.values())
+        # One pass in popularity order fills every short prefix's list in order
+        self._top = {}
+        self._recent = OrderedDict()
+        for rank in self._ranked:
+            for prefix in self._prefixes(self._names[rank[1]][2], _PRECOMPUTED_LENGTH):
+                best = self._top.setdefault(prefix, [])
+                if len(best) < MAX_LIMIT:
+                    best.append(rank)
+
+    @staticmethod
+    def _prefixes(keys, length=None) -> set:
+        # Including the empty prefix, which matches every name
+        return {key[:end] for key in keys for end in range(min(len(key), length or len(key)) + 1)}
+
+    def add(self, id_: int, name, popularity: int = 0):
+        """Add or rename the row `id_`; a new name keeps the old popularity."""
+        if id_ in self._names:
+            popularity = -self._names[id_][1][0]
+            self.remove(id_)
+        if not name:
+            return
+        rank, keys = (-popularity, id_), _keys(name)
+        self._names[id_] = (name, rank, keys)
+        for key in keys:
+            insort(self._keys, (key, id_))
+        insort(self._ranked, rank)
+        for best in self._cached(keys):
+            if len(best) < MAX_LIMIT or rank < best[-1]:
+                insort(best, rank)
+                del best[MAX_LIMIT:]
+
+    def remove(self, id_: int):
+        entry = self._names.pop(id_, None)
+        if entry is None:
+            return
+        _, rank, keys = entry
+        for key in keys:
+            del self._keys[bisect_left(self._keys, (key, id_))]
+        del self._ranked[bisect_left(self._ranked, rank)]
+        for prefix in self._prefixes(keys):
+            for cache in (self._top, self._recent):
+                best = cache.get(prefix)
+                if best is None or rank not in best:
+                    continue
+                if len(best) == MAX_LIMIT:
+                    # The next best match is unknown; recompute on next use
+                    del cache[prefix]
+                else:
+                    best.remove(rank)
+
+    def changes(self, popularity: dict) -> list:
+        """(id, popularity) of the rows whose popularity differs from
+        `popularity`, {id: popularity}; rows missing from it have none."""
+        return [
+            (id_, popularity.get(id_) or 0)
+            for id_, (_, rank, _) in self._names.items()
+            if -rank[0] != (popularity.get(id_) or 0)
+        ]
+
+    def rerank(self, id_: int, popularity: int):
+        """Move the row `id_` to its new `popularity`."""
+        entry = self._names.get(id_)
+        if entry is None or -entry[1][0] == popularity:
+            return
+        name, old, keys = entry
+        rank = (-popularity, id_)
+        self._names[id_] = (name, rank, keys)
+        del self._ranked[bisect_left(self._ranked, old)]
+        insort(self._ranked, rank)
+        for prefix in self._prefixes(keys):
+            for cache in (self._top, self._recent):
+                best = cache.get(prefix)
+                if best is None:
+                    continue
+                full = len(best) == MAX_LIMIT
+                if old in best:
+                    best.remove(old)
+                    if not full or (best and rank < best[-1]):
+                        insort(best, rank)
+                    else:
+                        # It fell past the end; what follows is unknown
+                        del cache[prefix]
+                elif full and rank < best[-1]:
+                    insort(best, rank)
+                    best.pop()
+
+    def _cached(self, keys):
+        for prefix in self._prefixes(keys):
+            for cache in (self._top, self._recent):
+                if prefix in cache:
+                    yield cache[prefix]
+
+    def search(self, prefix: str, limit: int) -> list:
+        """Up to `limit` (id, name, popularity) matches for the normalized
+        `prefix`, most popular first."""
+        best = self._top.get(prefix)
+        if best is None:
+            best = self._recent.get(prefix)
+            if best is None:
+                best = self._recent[prefix] = self._best(prefix)
+                if len(self._recent) > _CACHED_PREFIXES:
+                    self._recent.popitem(last=False)
+            else:
+                self._recent.move_to_end(prefix)
+        return [(id_, self._names[id_][0], -popularity) for popularity, id_ in best[:limit]]
+
+    def _best(self, prefix: str) -> list:
+        start = bisect_left(self._keys, (prefix,))
+        end = bisect_left(self._keys, (prefix + _AFTER,), start)
+        # Ranking k matching keys costs about k steps; walking the names in
+        # popularity order until MAX_LIMIT match costs about MAX_LIMIT * n / k
+        if (end - start) ** 2 <= MAX_LIMIT * len(self._names):
+            return heapq.nsmallest(MAX_LIMIT, {self._names[id_][1] for _, id_ in self._keys[start:end]})
+        best = []
+        for rank in self._ranked:
+            if any(key.startswith(prefix) for key in self._names[rank[1]][2]):
+                best.append(rank)
+                if len(best) == MAX_LIMIT:
+                    break
+        return best
+
+
+# Per type: the model, its name column and the rollup its popularity comes from
+TYPES = {
+    "artist": (ArtistModel, ArtistModel.Name, SalesByArtist),
+    "album": (AlbumModel, AlbumModel.Title, SalesByAlbum),
+    "track": (TrackModel, TrackModel.Name, SalesByTrack),
+}
+
+
+def _rows(db: Session, kind: str):
+    model, name, sales = TYPES[kind]
+    (pk,) = model.__table__.primary_key.columns
+    (sales_pk,) = sales.__table__.primary_key.columns
+    return db.query(pk, name, sales.Units).outerjoin(sales, sales_pk == pk)
+
+
+class AutocompleteIndex:
+    """A NameIndex per type in TYPES, safe to share between threads.
+
+    With several worker processes (CHINOOK_WORKERS), each worker has its own
+    index and applies its own writes to it. The table version each type was
+    last brought up to date with is recorded; when another worker's write
+    moved it on, a background thread reloads that type while searches keep
+    using the current index. The same thread re-ranks the names by the
+    current sales every `settings.autocomplete_refresh` seconds.
+    """
+
+    def __init__(self):
+        self._indexes = {kind: NameIndex() for kind in TYPES}
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._stale = set()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def build(self, db: Session):
+        for kind in TYPES:
+            self._reload(db, kind)
+
+    def _reload(self, db: Session, kind: str):
+        # Version and rows are read in the same transaction, so they agree
+        version = current_version(db, TYPES[kind][0])
+        index = NameIndex()
+        index.load(_rows(db, kind))
+        with self._lock:
+            self._indexes[kind] = index
+            self._versions[kind] = version
+
+    def refresh(self, db: Session, kinds):
+        """Schedule a reload of the `kinds` that other workers changed."""
+        if settings.workers <= 1:
+            return
+        stale = {
+            kind for kind in kinds
+            if kind not in self._stale and current_version(db, TYPES[kind][0]) != self._versions.get(kind)
+        }
+        if stale:
+            with self._lock:
+                # Kinds stay in _stale until reloaded, so a reload is only
+                # scheduled once however many requests notice
+                self._stale |= stale
+            self._wake.set()
+
+    def start(self):
+        """Start the thread that reloads and re-ranks the index."""
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="autocomplete", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stopping = True
+            self._wake.set()
+            thread.join()
+
+    def _run(self):
+        interval = settings.autocomplete_refresh or None
+        deadline = interval and time.monotonic() + interval
+        while True:
+            self._wake.wait(interval and max(deadline - time.monotonic(), 0))
+            self._wake.clear()
+            if self._stopping:
+                return
+            with self._lock:
+                stale = set(self._stale)
+            rerank = interval is not None and time.monotonic() >= deadline
+            # Through the read gate, like the requests, so they never find
+            # the read pool empty
+            with read_gate, ReadSessionLocal() as db:
+                for kind in sorted(stale):
+                    self._reload(db, kind)
+                    with self._lock:
+                        self._stale.discard(kind)
+                if rerank:
+                    for kind in TYPES:
+                        self._rerank(db, kind)
+                    deadline = time.monotonic() + interval
+
+    def _rerank(self, db: Session, kind: str):
+        sales = TYPES[kind][2]
+        (sales_pk,) = sales.__table__.primary_key.columns
+        popularity = dict(db.query(sales_pk, sales.Units))
+        with self._lock:
+            index = self._indexes[kind]
+            changes = index.changes(popularity)
+        # In batches, so searches don't wait on a long re-rank
+        for start in range(0, len(changes), _RERANK_BATCH):
+            with self._lock:
+                if self._indexes[kind] is not index:
+                    return  # Reloaded meanwhile, with the new sales
+                for id_, units in changes[start:start + _RERANK_BATCH]:
+                    index.rerank(id_, units)
+
+    def written(self, db: Session, *kinds):
+        """Record that a write of this worker, just committed, changed the
+        tables of `kinds` and has been applied to the index.
+
+        Call in the request that made the write: with several workers it
+        still holds the write lock, so the version read here is that write's
+        own. If another worker's write came in between, the recorded version
+        stays behind and refresh() reloads the type.
+        """
+        if settings.workers <= 1:
+            return
+        for kind in kinds:
+            version = current_version(db, TYPES[kind][0])
+            with self._lock:
+                if self._versions.get(kind) in (version - 1, version):
+                    self._versions[kind] = version
+
+    def add(self, db: Session, kind: str, names: dict):
+        """Index created or renamed rows, {id: name}; call after their transaction committed."""
+        with self._lock:
+            for id_, name in names.items():
+                self._indexes[kind].add(id_, name)
+        self.written(db, kind)
+
+    def remove(self, db: Session, kind: str, ids):
+        """Drop deleted rows; call after their transaction committed."""
+        with self._lock:
+            for id_ in ids:
+                self._indexes[kind].remove(id_)
+        self.written(db, kind)
+
+    def search(self, text: str, kinds, limit: int) -> dict:
+        """The top `limit` matches of `text` per kind, as (id, name, popularity)."""
+        prefix = normalize(text).strip()
+        with self._lock:
+            return {kind: self._indexes[kind].search(prefix, limit) for kind in kinds}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {kind: len(index) for kind, index in self._indexes.items()}
+
+
+index = AutocompleteIndex()
+
+
+def setup_autocomplete(engine):
+    """Build the index from the Artist, Album and Track tables and start
+    keeping it up to date."""
+    with Session(engine) as db:
+        index.build(db)
+    index.start()
+
+
+def stop_autocomplete():
+    index.stop()
@@ -0,0 +1,37 @@
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+# Stay well below SQLite's bound-parameter limit (999 before 3.32)
+IN_CHUNK_SIZE = 500
+
+
+def chunked(values, size: int = IN_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def existing_ids(db: Session, column, ids) -> set:
+    """The subset of `ids` present in `column`, using one IN query per chunk."""
+    found = set()
+    for chunk in chunked(set(ids)):
+        found.update(value for (value,) in db.query(column).filter(column.in_(chunk)))
+    return found
+
+
+def insert_rows(db: Session, model, pk_column, rows: list) -> list:
+    """Insert `rows` (dicts of column values) with a single executemany.
+
+    Primary keys are assigned up front from MAX(pk), which is what SQLite
+    would pick for these rowid tables anyway, so the new ids are known
+    without RETURNING and without falling back to one INSERT per row. Must
+    run inside the write transaction that commits the rows.
+    """
+    if not rows:
+        return []
+    start = (db.query(func.max(pk_column)).scalar() or 0) + 1
+    ids = list(range(start, start + len(rows)))
+    for pk, row in zip(ids, rows):
+        row[pk_column.key] = pk
+    db.execute(insert(model), rows)
+    return ids
@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Response
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.models import Artist as ArtistModel, Genre as GenreModel, MediaType as MediaTypeModel
+from app.pagination import NEXT_CURSOR_HEADER
+from app.schemas.schemas import Artist, Genre, MediaType
+from app.versions import current_etag
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by invalidate(), so a load() that overlapped it isn't stored
+        self._generation = 0
+
+    def get_or_load(self, key, load, version=None):
+        """Return the cached value for `key`, calling `load()` on a miss.
+
+        An entry cached under a different `version` counts as a miss. When
+        invalidate() is called while `load()` runs, the value it returns may
+        predate the write that invalidated the cache, so it is returned but
+        not cached.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now and entry[1] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            generation = self._generation
+
+        value = load()
+        with self._lock:
+            if generation != self._generation:
+                return value
+            self._entries[key] = (now + self.ttl, version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# Genre and MediaType are cached as whole tables under a single key; Artist is
+# cached per row and per list page.
+genre_cache = TTLCache(maxsize=1, ttl=settings.cache_ttl)
+media_type_cache = TTLCache(maxsize=1, ttl=settings.cache_ttl)
+artist_cache = TTLCache(maxsize=settings.cache_size, ttl=settings.cache_ttl)
+
+caches = {
+    "genres": genre_cache,
+    "media_types": media_type_cache,
+    "artists": artist_cache,
+}
+
+
+def cache_stats() -> dict:
+    return {name: cache.stats() for name, cache in caches.items()}
+
+
+def shared_version(db: Session, model):
+    """Current version of the table of `model` when worker processes share
+    the database, else None.
+
+    A write only invalidates the caches of the worker that served it; the
+    other workers reload entries cached under an older table version.
+    """
+    if settings.workers <= 1:
+        return None
+    return current_etag(db, [model])
+
+
+def all_genres(db: Session) -> dict:
+    """All genres keyed by GenreId, in GenreId order."""
+    return genre_cache.get_or_load("all", lambda: {
+        genre.GenreId: Genre.model_validate(genre)
+        for genre in db.query(GenreModel).order_by(GenreModel.GenreId)
+    }, shared_version(db, GenreModel))
+
+
+def all_media_types(db: Session) -> dict:
+    """All media types keyed by MediaTypeId, in MediaTypeId order."""
+    return media_type_cache.get_or_load("all", lambda: {
+        media_type.MediaTypeId: MediaType.model_validate(media_type)
+        for media_type in db.query(MediaTypeModel).order_by(MediaTypeModel.MediaTypeId)
+    }, shared_version(db, MediaTypeModel))
+
+
+def get_artist(db: Session, artist_id: int):
+    """The artist with `artist_id`, or None if it doesn't exist."""
+    def load():
+        db_artist = db.query(ArtistModel).filter(ArtistModel.ArtistId == artist_id).first()
+        return Artist.model_validate(db_artist) if db_artist is not None else None
+
+    return artist_cache.get_or_load(("artist", artist_id), load, shared_version(db, ArtistModel))
+
+
+def cached_page(cache: TTLCache, key, response: Response, load, version=None):
+    """Serve a list page from `cache`, including its X-Next-Cursor header.
+
+    `load(page_response)` must return the page items and may set the next
+    cursor header on `page_response`, as app.pagination.paginate() does.
+    `version` is passed on to TTLCache.get_or_load().
+    """
+    def load_page():
+        page_response = Response()
+        items = load(page_response)
+        return items, page_response.headers.get(NEXT_CURSOR_HEADER)
+
+    items, next_cursor = cache.get_or_load(key, load_page, version)
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return items
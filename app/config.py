@@ -0,0 +1,65 @@
+import os
+from pathlib import Path
+
+# The Chinook database bundled at the repository root
+DEFAULT_DB_PATH = Path(__file__).resolve().parent.parent / "chinook.db"
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return default if value is None else int(value)
+
+
+class Settings:
+    """Runtime configuration, read from CHINOOK_* environment variables."""
+
+    def __init__(self):
+        self.db_path = os.getenv("CHINOOK_DB_PATH", str(DEFAULT_DB_PATH))
+
+        # Serve every router through async handlers on an aiosqlite engine
+        # instead of sync handlers in the threadpool.
+        self.async_db = _env_flag("CHINOOK_ASYNC_DB")
+
+        # SQLite tuning applied to every new connection
+        self.sqlite_busy_timeout = _env_int("CHINOOK_SQLITE_BUSY_TIMEOUT", 5000)  # milliseconds
+        self.sqlite_cache_size = _env_int("CHINOOK_SQLITE_CACHE_SIZE", -64000)  # negative = KiB
+        self.sqlite_mmap_size = _env_int("CHINOOK_SQLITE_MMAP_SIZE", 268435456)  # bytes
+
+        # In-process cache of the Genre, MediaType and Artist reference tables
+        self.cache_ttl = _env_int("CHINOOK_CACHE_TTL", 300)  # seconds
+        self.cache_size = _env_int("CHINOOK_CACHE_SIZE", 10000)  # entries
+
+        # Read-only connections are pooled; writes always share one connection
+        self.read_pool_size = _env_int("CHINOOK_READ_POOL_SIZE", 8)
+        # /export streams hold a connection for the whole download, so they
+        # get a pool of their own instead of starving the other GETs
+        self.export_pool_size = _env_int("CHINOOK_EXPORT_POOL_SIZE", 2)
+
+        # Encode list endpoints with orjson straight from row tuples instead of
+        # validating ORM objects through the response models.
+        self.fast_json = _env_flag("CHINOOK_FAST_JSON")
+
+        # Worker processes sharing the database file, set by serve.py. With
+        # more than one, writes take a cross-process file lock and the
+        # reference caches revalidate against the table versions.
+        self.workers = _env_int("CHINOOK_WORKERS", 1)
+
+        # Commit small writes (playlist tracks, invoice lines) from concurrent
+        # requests together, in one transaction per batch; see app.group_commit
+        self.group_commit = _env_flag("CHINOOK_GROUP_COMMIT")
+        self.group_commit_delay = _env_int("CHINOOK_GROUP_COMMIT_DELAY", 2)  # milliseconds
+        self.group_commit_size = _env_int("CHINOOK_GROUP_COMMIT_SIZE", 100)  # operations
+
+        # How often /autocomplete re-ranks its names by the sales rollups;
+        # 0 keeps the ranking of startup
+        self.autocomplete_refresh = _env_int("CHINOOK_AUTOCOMPLETE_REFRESH", 60)  # seconds
+
+
+settings = Settings()
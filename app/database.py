@@ -1,20 +1,315 @@
-from sqlalchemy import create_engine
+import asyncio
+import os
+import threading
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:////workspace/chinook.db"
+from app.config import settings
+
+# flock() is only needed when serve.py runs several worker processes
+if settings.workers > 1:
+    import fcntl
+
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{settings.db_path}"
+ASYNC_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+# Requests with these methods get a session from the read-only pool
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# Seconds a request waits for a pooled connection or the write lock
+WAIT_TIMEOUT = max(settings.sqlite_busy_timeout / 1000, 1)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record, read_only):
+    cursor = dbapi_connection.cursor()
+    # First, so that switching to WAL below waits for another process that
+    # is doing the same instead of failing with "database is locked"
+    cursor.execute(f"PRAGMA busy_timeout={settings.sqlite_busy_timeout:d}")
+    if not read_only:
+        # WAL is persistent in the database file, so setting it from the
+        # writer is enough for readers to pick it up as well.
+        cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA cache_size={settings.sqlite_cache_size:d}")
+    cursor.execute(f"PRAGMA mmap_size={settings.sqlite_mmap_size:d}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def _engine_options(url: str, read_only: bool, pool_size: int = None):
+    if read_only:
+        url = url.replace(":///", ":///file:", 1) + "?mode=ro&uri=true"
+        pool = {"pool_size": pool_size or settings.read_pool_size, "max_overflow": 0}
+    else:
+        # SQLite allows a single writer; queue writers on one pooled connection
+        # instead of letting them fail with "database is locked".
+        pool = {"pool_size": 1, "max_overflow": 0}
+    pool["pool_timeout"] = WAIT_TIMEOUT
+    return url, {"connect_args": {"check_same_thread": False}, **pool}
+
+
+def create_sqlite_engine(url: str = SQLALCHEMY_DATABASE_URL, read_only: bool = False, pool_size: int = None):
+    """Build a sync engine for `url` with the configured SQLite pragmas.
+
+    Read-only engines pool `pool_size` connections, by default
+    `settings.read_pool_size`.
+    """
+    url, options = _engine_options(url, read_only, pool_size)
+    new_engine = create_engine(url, **options)
+    event.listen(new_engine, "connect", lambda conn, record: _set_sqlite_pragmas(conn, record, read_only))
+    return new_engine
+
+
+def create_async_sqlite_engine(url: str = ASYNC_DATABASE_URL, read_only: bool = False):
+    """Build an aiosqlite AsyncEngine for `url` with the configured SQLite pragmas."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url, options = _engine_options(url, read_only)
+    new_engine = create_async_engine(url, **options)
+    event.listen(new_engine.sync_engine, "connect", lambda conn, record: _set_sqlite_pragmas(conn, record, read_only))
+    return new_engine
+
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class Gate:
+    """Lets `size` holders through at a time, like a threading.Semaphore
+    that coroutines can also wait on without taking up a thread.
+
+    Requests wait here on the event loop rather than in the threadpool: a
+    request waiting in a threadpool thread holds one of its tokens, and the
+    requests it waits for may need tokens to finish (to run the endpoint,
+    serialize the response and close the session). Enough waiters stall the
+    process for good.
+    """
+
+    def __init__(self, size: int = 1):
+        self._semaphore = threading.BoundedSemaphore(size)
+        self._mutex = threading.Lock()
+        self._waiters = []
+
+    def acquire(self):
+        self._semaphore.acquire()
+
+    async def acquire_async(self, timeout: float):
+        """Wait on the event loop; raise TimeoutError after `timeout` seconds."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            with self._mutex:
+                if self._semaphore.acquire(blocking=False):
+                    return
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            try:
+                # Every release wakes all waiters, and they race for it again
+                await asyncio.wait_for(waiter, max(deadline - loop.time(), 0))
+            finally:
+                with self._mutex:
+                    if (loop, waiter) in self._waiters:
+                        self._waiters.remove((loop, waiter))
+
+    def release(self):
+        self._semaphore.release()
+        with self._mutex:
+            waiters, self._waiters = self._waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_wake, waiter)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class WriteLock:
+    """Serializes write sessions across the worker processes of serve.py.
+
+    An flock() on `path` orders the processes. File locks belong to the open
+    file rather than to a thread, so a Gate orders the requests of one
+    process; without a `path` (a single worker) that is all there is.
+    """
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._gate = Gate()
+        self._file = None
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, "a")
+        return self._file
+
+    def acquire(self):
+        self._gate.acquire()
+        if self.path is None:
+            return
+        try:
+            fcntl.flock(self._open(), fcntl.LOCK_EX)
+        except BaseException:
+            self._gate.release()
+            raise
+
+    async def acquire_async(self, timeout: float = WAIT_TIMEOUT):
+        """Take the lock without blocking the event loop or a thread; raise
+        TimeoutError after `timeout` seconds."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        await self._gate.acquire_async(timeout)
+        if self.path is None:
+            return
+        try:
+            # Only one request per process gets here at a time, so polling
+            # for the other processes' lock is cheap
+            delay = 0.001
+            while True:
+                try:
+                    fcntl.flock(self._open(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return
+                except BlockingIOError:
+                    if loop.time() >= deadline:
+                        raise TimeoutError(f"write lock not acquired within {timeout}s")
+                    await asyncio.sleep(min(delay, max(deadline - loop.time(), 0)))
+                    delay = min(delay * 2, 0.02)
+        except BaseException:
+            self._gate.release()
+            raise
+
+    def release(self):
+        if self.path is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._gate.release()
+
+    def after_fork(self):
+        # A forked worker shares the parent's open file, and with it the
+        # lock, so it opens its own
+        if self._file is not None:
+            self._file.close()
+        self._gate = Gate()
+        self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+# `engine` is the single-writer engine; `read_engine` serves read-only
+# requests, and `export_engine` the long-running /export streams
+engine = create_sqlite_engine()
+read_engine = create_sqlite_engine(read_only=True)
+export_engine = create_sqlite_engine(read_only=True, pool_size=settings.export_pool_size)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+ExportSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=export_engine)
+
+# The async engines are only built when async mode is on, so aiosqlite stays
+# an optional dependency.
+async_engine = None
+async_read_engine = None
+AsyncSessionLocal = None
+AsyncReadSessionLocal = None
+if settings.async_db:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    async_engine = create_async_sqlite_engine()
+    async_read_engine = create_async_sqlite_engine(read_only=True)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False)
+    AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False)
+
+
+def sync_engines():
+    """Every engine of the app, as sync Engines that accept event listeners."""
+    engines = [engine, read_engine, export_engine]
+    for async_db_engine in (async_engine, async_read_engine):
+        if async_db_engine is not None:
+            engines.append(async_db_engine.sync_engine)
+    return engines
+
+# Each worker process has its own writer connection; the lock makes them take
+# turns instead of contending for the SQLite write lock. With a single worker
+# it queues the process's writers for the connection just the same.
+write_lock = WriteLock(f"{settings.db_path}.lock" if settings.workers > 1 else None)
+
+# Read requests queue here for the connections of the read pool, so they
+# never wait for one in the pool itself
+read_gate = Gate(settings.read_pool_size)
+
+
+def writer_lock():
+    """Context manager around a write outside of a request, e.g. migrations."""
+    return write_lock
+
+
+def _after_fork_in_child():
+    # Pooled connections belong to the parent process and must not be reused
+    for sync_engine in sync_engines():
+        sync_engine.dispose(close=False)
+    write_lock.after_fork()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
 
 Base = declarative_base()
 
-# Dependency
-def get_db():
-    db = SessionLocal()
+def _takes_write_lock(request: Request) -> bool:
+    # Endpoints batched by app.group_commit leave the lock to its writer thread
+    return request.method not in READ_METHODS and not getattr(request.scope.get("endpoint"), "group_commit", False)
+
+def _busy() -> HTTPException:
+    return HTTPException(status_code=503, detail="Database busy, try again", headers={"Retry-After": "1"})
+
+async def _wait_turn(request: Request, read_turn: Optional[Gate]):
+    """Wait for `read_turn` (reads) or the write lock (writes) and return
+    it, for the caller to release; None when there is nothing to wait for.
+
+    Awaited on the event loop, so requests queued for a connection or the
+    lock don't take up the threadpool the request holding it needs to finish.
+    """
+    if request.method in READ_METHODS:
+        turn = read_turn
+    else:
+        turn = write_lock if _takes_write_lock(request) else None
+    if turn is not None:
+        try:
+            await turn.acquire_async(WAIT_TIMEOUT)
+        except TimeoutError:
+            raise _busy()
+    return turn
+
+# Dependency. Async, so that the waiting happens on the event loop; the sync
+# endpoints still run in the threadpool.
+async def get_db(request: Request):
+    session_factory = ReadSessionLocal if request.method in READ_METHODS else SessionLocal
+    turn = await _wait_turn(request, read_gate)
+    try:
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+    finally:
+        if turn is not None:
+            turn.release()
+
+async def get_async_db(request: Request):
+    session_factory = AsyncReadSessionLocal if request.method in READ_METHODS else AsyncSessionLocal
+    # The async pools already wait for a connection on the event loop
+    turn = await _wait_turn(request, None)
     try:
-        yield db
+        async with session_factory() as db:
+            yield db
     finally:
-        db.close()
+        if turn is not None:
+            turn.release()
@@ -0,0 +1,89 @@
+from typing import Optional, get_args
+
+from fastapi import Response
+
+from app import includes
+from app.config import settings
+from app.fieldsets import json_response
+from app.pagination import fetch_ids, paginate as paginate_query
+
+# orjson is only needed when the fast path is switched on
+if settings.fast_json:
+    import orjson
+
+
+def _is_float(annotation) -> bool:
+    return annotation is float or float in get_args(annotation)
+
+
+def _names(schema, fieldset: Optional[tuple]) -> list:
+    return list(fieldset) if fieldset is not None else list(schema.model_fields)
+
+
+def _columns(query, names: list, extra: list = ()) -> list:
+    # The schemas name their fields after the model columns
+    model = query.column_descriptions[0]["entity"]
+    return [getattr(model, name) for name in names] + [column for column in extra if column.key not in names]
+
+
+def encode_rows(rows, schema, names: Optional[list] = None) -> bytes:
+    """Encode row tuples (in `names` order) as a JSON array of objects.
+
+    `names` defaults to every field of `schema`; values past the last name
+    are ignored. Produces the same bytes as FastAPI serializing the rows
+    through `response_model=List[schema]`: NUMERIC columns that SQLite
+    returns as integers are coerced to float like Pydantic does, and orjson
+    formats datetimes in ISO 8601 like Pydantic.
+    """
+    names = names or list(schema.model_fields)
+    floats = [index for index, name in enumerate(names) if _is_float(schema.model_fields[name].annotation)]
+    items = []
+    for row in rows:
+        values = list(row)
+        for index in floats:
+            if values[index] is not None:
+                values[index] = float(values[index])
+        items.append(dict(zip(names, values)))
+    return orjson.dumps(items)
+
+
+def paginate(query, schema, response: Response, order_by: list, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, fieldset: Optional[tuple] = None, include: Optional[tuple] = None, ids: Optional[list] = None):
+    """app.pagination.paginate() for list endpoints, with the fast JSON path.
+
+    With CHINOOK_FAST_JSON on, selects only the columns of `schema` (or of
+    `fieldset`) and returns the encoded page as a Response, skipping ORM
+    objects and per-row validation. Otherwise returns the ORM objects, and
+    FastAPI serializes them through the endpoint's response_model as usual;
+    with a `fieldset`, plain rows of the requested columns, for
+    app.fieldsets.render(). With an `include`, always the ORM objects with
+    the included relationships loaded, for app.includes.render().
+
+    With `ids`, returns the rows with those primary keys (the last order_by
+    column) instead of a page; see app.pagination.fetch_ids().
+    """
+    def fetch(query):
+        if ids is not None:
+            return fetch_ids(query, response, order_by[-1], ids)
+        return paginate_query(query, response, order_by, skip, limit, cursor)
+
+    if include is not None:
+        return fetch(includes.load(query, include))
+    if not settings.fast_json and fieldset is None:
+        return fetch(query)
+    names = _names(schema, fieldset)
+    # The cursor and the ids need the order_by columns even when they were not requested
+    rows = fetch(query.with_entities(*_columns(query, names, order_by)))
+    if not settings.fast_json:
+        return rows
+    return json_response(encode_rows(rows, schema, names), response)
+
+
+def list_all(query, schema, response: Response, fieldset: Optional[tuple] = None):
+    """query.all() for unpaginated list endpoints, with the fast JSON path."""
+    if not settings.fast_json and fieldset is None:
+        return query.all()
+    names = _names(schema, fieldset)
+    rows = query.with_entities(*_columns(query, names)).all()
+    if not settings.fast_json:
+        return rows
+    return json_response(encode_rows(rows, schema, names), response)
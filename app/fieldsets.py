@@ -0,0 +1,95 @@
+from functools import lru_cache
+from typing import List, Optional
+
+from fastapi import Depends, HTTPException, Query, Response
+from pydantic import ConfigDict, TypeAdapter, create_model
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only
+
+
+def parse(schema, fields: Optional[str]) -> Optional[tuple]:
+    """Validate a comma-separated `fields` parameter against `schema`.
+
+    Returns the requested field names in schema order, or None when no
+    fieldset was given. Unknown names are rejected with a 400.
+    """
+    if fields is None:
+        return None
+    requested = {name.strip() for name in fields.split(",")} - {""}
+    if not requested:
+        return None
+    unknown = requested - set(schema.model_fields)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown field(s): {', '.join(sorted(unknown))}. "
+                   f"Valid fields: {', '.join(schema.model_fields)}",
+        )
+    return tuple(name for name in schema.model_fields if name in requested)
+
+
+def select(schema):
+    """Dependency for the `fields` query parameter of endpoints returning `schema`."""
+    def fieldset(
+        fields: Optional[str] = Query(
+            None, description=f"Comma-separated {schema.__name__} fields to return, e.g. {_example(schema)}"
+        ),
+    ) -> Optional[tuple]:
+        return parse(schema, fields)
+    return Depends(fieldset)
+
+
+def _example(schema) -> str:
+    return ",".join(list(schema.model_fields)[:2])
+
+
+def project(query, fieldset: Optional[tuple], loaders: Optional[dict] = None):
+    """Restrict `query` to the columns of `fieldset`.
+
+    `loaders` maps the relationships the response nests to their loader
+    option (joinedload, selectinload); only the requested ones are loaded.
+    Without a fieldset every column and relationship is loaded as before.
+    """
+    loaders = loaders or {}
+    if fieldset is None:
+        return query.options(*(loader(relationship) for relationship, loader in loaders.items()))
+    model = query.column_descriptions[0]["entity"]
+    mapper = inspect(model)
+    # The primary key is always loaded, also when only relationships are requested
+    names = [column.key for column in mapper.primary_key]
+    names += [name for name in fieldset if name in mapper.column_attrs and name not in names]
+    options = [load_only(*(getattr(model, name) for name in names))]
+    options += [loader(relationship) for relationship, loader in loaders.items() if relationship.key in fieldset]
+    return query.options(*options)
+
+
+@lru_cache(maxsize=256)
+def _adapter(schema, fieldset: tuple, many: bool) -> TypeAdapter:
+    # A copy of `schema` holding only the requested fields, so the response
+    # is still validated and serialized by Pydantic
+    partial = create_model(
+        f"{schema.__name__}Fields",
+        __config__=ConfigDict(from_attributes=True),
+        **{name: (schema.model_fields[name].annotation, schema.model_fields[name]) for name in fieldset},
+    )
+    return TypeAdapter(List[partial] if many else partial)
+
+
+def json_response(content: bytes, response: Response) -> Response:
+    json_response = Response(content=content, media_type="application/json")
+    # FastAPI only merges the headers set on the injected `response` (next
+    # cursor, ETag) into responses it builds itself
+    json_response.headers.raw.extend(response.headers.raw)
+    return json_response
+
+
+def render(result, schema, fieldset: Optional[tuple], response: Response):
+    """Serialize only the `fieldset` fields of `result` (an object or a list).
+
+    Returns `result` untouched without a fieldset, or when it already is a
+    Response, so FastAPI applies the endpoint's response_model as usual.
+    """
+    if fieldset is None or isinstance(result, Response):
+        return result
+    adapter = _adapter(schema, fieldset, isinstance(result, list))
+    return json_response(adapter.dump_json(adapter.validate_python(result, from_attributes=True)), response)
@@ -0,0 +1,180 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from sqlalchemy.util.concurrency import await_only, in_greenlet
+
+from app.config import settings
+from app.database import SessionLocal, writer_lock
+
+# Small, frequent writes (adding a track to a playlist, adding an invoice
+# line) each cost a commit, and with it an fsync of the WAL. With
+# CHINOOK_GROUP_COMMIT on, their endpoints hand the write to one background
+# thread, which runs every operation queued within a few milliseconds in a
+# single transaction and answers each caller with its own result. Work that
+# adds up across operations (version bumps, rollups, totals) goes through
+# defer() and runs once per batch.
+
+_STOP = object()
+
+# Session.info key of the work deferred to the end of the batch
+_DEFERRED = "group_commit_deferred"
+
+
+class GroupCommitter:
+    """Background writer that commits queued operations in batches.
+
+    A batch is committed once it holds `max_batch` operations or `max_delay`
+    seconds after its first operation arrived, whichever comes first.
+    """
+
+    def __init__(self, max_batch: int, max_delay: float):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.operations = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, operation) -> Future:
+        """Queue `operation(db)`; the future resolves to its return value."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                self._thread.start()
+        future = Future()
+        self._queue.put((operation, future))
+        return future
+
+    def stop(self):
+        """Commit what is queued and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "operations": self.operations}
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                timeout = deadline - time.monotonic()
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self.batches += 1
+            self.operations += len(batch)
+            try:
+                self._commit(batch)
+            except Exception:
+                # Something beyond an operation's own validation failed: run
+                # every operation on its own so only the culprit fails
+                for operation, future in batch:
+                    try:
+                        self._commit([(operation, future)])
+                    except Exception as exc:
+                        future.set_exception(exc)
+
+    def _commit(self, batch):
+        results = []
+        with writer_lock():
+            db = SessionLocal()
+            db.info[_DEFERRED] = {}
+            try:
+                for operation, future in batch:
+                    try:
+                        result = operation(db)
+                    except HTTPException as exc:
+                        results.append((future, None, exc))
+                        continue
+                    # Later operations of the batch see this one's rows
+                    db.flush()
+                    results.append((future, result, None))
+                for function, items in db.info[_DEFERRED].items():
+                    function(db, *items)
+                db.commit()
+            except Exception as exc:
+                db.rollback()
+                if len(batch) > 1:
+                    raise
+                results = [(future, None, exc) for _, future in batch]
+            finally:
+                db.close()
+        for future, result, exc in results:
+            if exc is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exc)
+
+
+committer = GroupCommitter(
+    max_batch=settings.group_commit_size,
+    max_delay=settings.group_commit_delay / 1000,
+) if settings.group_commit else None
+
+
+def batched(endpoint):
+    """Mark an endpoint whose writes go through run().
+
+    Its requests don't take the cross-process write lock in app.database;
+    the group commit thread takes it for each batch instead.
+    """
+    endpoint.group_commit = committer is not None
+    return endpoint
+
+
+def defer(db: Session, function, *items):
+    """Call `function(db, *items)` before the transaction commits.
+
+    In a batch, the calls with the same `function` are merged into one that
+    gets the items of every operation, so `function` has to accept any
+    number of them, and later operations of the batch don't see its effect
+    yet. Outside of a batch `function` is called right away.
+    """
+    deferred = db.info.get(_DEFERRED)
+    if deferred is None:
+        function(db, *items)
+    else:
+        deferred.setdefault(function, []).extend(items)
+
+
+def run(db: Session, operation):
+    """Run `operation(db)` and commit, through the group commit thread when on.
+
+    `operation` must raise its HTTPExceptions before it writes anything, and
+    return plain data rather than ORM objects, which expire on commit. In
+    async mode the caller's greenlet waits for the batch without blocking the
+    event loop.
+    """
+    if committer is None:
+        result = operation(db)
+        db.commit()
+        return result
+
+    future = committer.submit(operation)
+    if in_greenlet():
+        return await_only(asyncio.wrap_future(future))
+    return future.result()
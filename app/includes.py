@@ -0,0 +1,191 @@
+from functools import lru_cache
+from typing import List, Optional
+
+from fastapi import Depends, HTTPException, Query, Request, Response
+from pydantic import ConfigDict, TypeAdapter, create_model
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, selectinload
+
+from app import fieldsets, versions
+from app.database import get_db
+from app.models.models import (
+    Album as AlbumModel, Artist as ArtistModel, Customer as CustomerModel, Employee as EmployeeModel,
+    Genre as GenreModel, Invoice as InvoiceModel, InvoiceLine as InvoiceLineModel,
+    MediaType as MediaTypeModel, Playlist as PlaylistModel, Track as TrackModel,
+)
+from app.schemas.schemas import (
+    Album, Artist, Customer, Employee, Genre, Invoice, InvoiceLine, MediaType, Playlist, Track,
+)
+
+# Schema of the rows of each model when they are embedded
+SCHEMAS = {
+    AlbumModel: Album,
+    ArtistModel: Artist,
+    CustomerModel: Customer,
+    EmployeeModel: Employee,
+    GenreModel: Genre,
+    InvoiceModel: Invoice,
+    InvoiceLineModel: InvoiceLine,
+    MediaTypeModel: MediaType,
+    PlaylistModel: Playlist,
+    TrackModel: Track,
+}
+
+# Relationships `include` can expand, per model
+RELATIONSHIPS = {
+    AlbumModel: ("artist", "tracks"),
+    ArtistModel: ("albums",),
+    CustomerModel: ("invoices", "support_rep"),
+    EmployeeModel: ("customers",),
+    InvoiceModel: ("customer", "invoice_lines"),
+    InvoiceLineModel: ("track",),
+    PlaylistModel: ("tracks",),
+    TrackModel: ("album", "genre", "media_type"),
+}
+
+
+def parse(model, include: Optional[str]) -> Optional[tuple]:
+    """Validate a comma-separated `include` parameter against the relationships of `model`.
+
+    Dotted paths expand the relationships of embedded rows, e.g.
+    `artist,tracks.genre`. Returns a tree of (name, subtree) pairs sorted by
+    name, or None when nothing is included. Unknown names are rejected with
+    a 400.
+    """
+    if include is None:
+        return None
+    paths = [path.strip() for path in include.split(",") if path.strip()]
+    if not paths:
+        return None
+    tree = {}
+    for path in paths:
+        current_model, node = model, tree
+        for name in path.split("."):
+            if name not in RELATIONSHIPS.get(current_model, ()):
+                valid = ", ".join(RELATIONSHIPS.get(current_model, ())) or "none"
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Unknown include: {path}. {current_model.__name__} relationships: {valid}",
+                )
+            current_model = _relationship(current_model, name).mapper.class_
+            node = node.setdefault(name, {})
+    return _freeze(tree)
+
+
+def _freeze(tree: dict) -> tuple:
+    return tuple((name, _freeze(subtree)) for name, subtree in sorted(tree.items()))
+
+
+def _relationship(model, name: str):
+    return inspect(model).relationships[name]
+
+
+def _tables(model, tree: tuple) -> set:
+    # Every table the embedded rows are read from, for the ETag
+    tables = set()
+    for name, subtree in tree:
+        relationship = _relationship(model, name)
+        tables.add(relationship.mapper.class_.__tablename__)
+        if relationship.secondary is not None:
+            tables.add(relationship.secondary.name)
+        tables |= _tables(relationship.mapper.class_, subtree)
+    return tables
+
+
+def select(model):
+    """Dependency for the `include` query parameter of endpoints returning `model` rows.
+
+    Also extends the ETag set by versions.conditional_get() with the tables
+    of the included rows.
+    """
+    def include_tree(
+        request: Request,
+        response: Response,
+        include: Optional[str] = Query(
+            None,
+            description="Comma-separated relationships to embed, dotted for nested ones, "
+                        f"e.g. {_example(model)}. {model.__name__} relationships: {', '.join(RELATIONSHIPS[model])}",
+        ),
+        db: Session = Depends(get_db),
+    ) -> Optional[tuple]:
+        tree = parse(model, include)
+        if tree is not None:
+            versions.extend_etag(request, response, db, _tables(model, tree))
+        return tree
+    return Depends(include_tree)
+
+
+def _example(model) -> str:
+    name = RELATIONSHIPS[model][-1]
+    nested = RELATIONSHIPS.get(_relationship(model, name).mapper.class_)
+    return f"{name}.{nested[0]}" if nested else name
+
+
+def _options(model, tree: tuple, parent=None) -> list:
+    options = []
+    for name, subtree in tree:
+        attribute = getattr(model, name)
+        loader = parent.selectinload(attribute) if parent is not None else selectinload(attribute)
+        options.append(loader)
+        options += _options(_relationship(model, name).mapper.class_, subtree, loader)
+    return options
+
+
+def load(query, include: Optional[tuple]):
+    """Load the relationships of `include` with one IN query per relationship and level."""
+    if include is None:
+        return query
+    model = query.column_descriptions[0]["entity"]
+    return query.options(*_options(model, include))
+
+
+def project(query, fieldset: Optional[tuple], include: Optional[tuple], loaders: Optional[dict] = None):
+    """fieldsets.project() plus the relationships of `include`.
+
+    Included relationships are loaded by load(), in place of their loader
+    in `loaders`.
+    """
+    included = {name for name, _ in include or ()}
+    loaders = {
+        relationship: loader for relationship, loader in (loaders or {}).items() if relationship.key not in included
+    }
+    return load(fieldsets.project(query, fieldset, loaders), include)
+
+
+@lru_cache(maxsize=256)
+def _model(schema, model, fieldset: Optional[tuple], include: tuple):
+    # `schema` (or its `fieldset` fields) plus one field per included relationship
+    fields = {
+        name: (schema.model_fields[name].annotation, schema.model_fields[name])
+        for name in (fieldset or schema.model_fields)
+    }
+    for name, subtree in include:
+        relationship = _relationship(model, name)
+        related = relationship.mapper.class_
+        nested = _model(SCHEMAS[related], related, None, subtree)
+        fields[name] = (List[nested], []) if relationship.uselist else (Optional[nested], None)
+    suffix = "".join(name.title().replace("_", "") for name, _ in include)
+    return create_model(
+        f"{schema.__name__}With{suffix}", __config__=ConfigDict(from_attributes=True), **fields
+    )
+
+
+@lru_cache(maxsize=256)
+def _adapter(schema, model, fieldset: Optional[tuple], include: tuple, many: bool) -> TypeAdapter:
+    nested = _model(schema, model, fieldset, include)
+    return TypeAdapter(List[nested] if many else nested)
+
+
+def render(result, schema, fieldset: Optional[tuple], include: Optional[tuple], response: Response):
+    """Serialize `result` (an object or a list of `model` rows) with the included relationships.
+
+    Without an include, the same as fieldsets.render().
+    """
+    if include is None or isinstance(result, Response):
+        return fieldsets.render(result, schema, fieldset, response)
+    many = isinstance(result, list)
+    if not result and many:
+        return fieldsets.json_response(b"[]", response)
+    model = type(result[0] if many else result)
+    adapter = _adapter(schema, model, fieldset, include, many)
+    return fieldsets.json_response(adapter.dump_json(adapter.validate_python(result, from_attributes=True)), response)
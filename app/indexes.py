@@ -0,0 +1,63 @@
+from sqlalchemy import inspect
+
+from app.database import Base
+from app.models import models  # noqa: F401 - registers the tables on Base.metadata
+
+# Indexes that older schemas had and that other indexes now make redundant
+REDUNDANT_INDEXES = [
+    # index=True on the primary keys: on an INTEGER PRIMARY KEY the table
+    # itself already is that index
+    *(
+        f"ix_{table.name}_{column.name}"
+        for table in Base.metadata.sorted_tables
+        for column in table.primary_key.columns
+    ),
+    # Leading column of IX_PlaylistTrackTrackIdPlaylistId
+    "IFK_PlaylistTrackTrackId",
+]
+
+
+def setup_indexes(engine) -> dict:
+    """Bring the indexes of an existing database in line with the models.
+
+    Creates every index declared on the models that the database lacks and
+    drops the ones listed in REDUNDANT_INDEXES. Tables that do not exist yet
+    are skipped; they get their indexes when they are created. Returns the
+    names of the created and dropped indexes.
+    """
+    inspector = inspect(engine)
+    table_names = set(inspector.get_table_names())
+    existing = {
+        index["name"]
+        for table_name in table_names
+        for index in inspector.get_indexes(table_name)
+    }
+    created = []
+    dropped = [name for name in REDUNDANT_INDEXES if name in existing]
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in table_names:
+                continue
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                if index.name not in existing:
+                    index.create(conn)
+                    created.append(index.name)
+        for name in dropped:
+            conn.exec_driver_sql(f'DROP INDEX IF EXISTS "{name}"')
+        if created:
+            # Give the query planner statistics for the new indexes
+            conn.exec_driver_sql("ANALYZE")
+    return {"created": created, "dropped": dropped}
+
+
+# Migrate a database without starting the app: python -m app.indexes
+if __name__ == "__main__":
+    from app.database import engine
+
+    changes = setup_indexes(engine)
+    for name in changes["created"]:
+        print(f"Created {name}")
+    for name in changes["dropped"]:
+        print(f"Dropped {name}")
+    if not changes["created"] and not changes["dropped"]:
+        print("Indexes are up to date")
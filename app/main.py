@@ -9,19 +9,64 @@
 
 
 
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
-
-from app.routers import artists, albums, tracks, customers, employees, invoices, playlists, genres, media_types
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.async_routes import async_router
+from app.autocomplete import setup_autocomplete, stop_autocomplete
+from app.cache import cache_stats
+from app.config import settings
+from app import group_commit
+from app.database import async_engine, async_read_engine, engine, sync_engines, writer_lock
+from app.indexes import setup_indexes
+from app.metrics import MetricsMiddleware, instrument_engines, registry
+from app.pagination import MISSING_IDS_HEADER, NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER
+from app.rollups import setup_rollups
+from app.search import setup_search
+from app.versions import setup_versions
+from app.routers import artists, albums, tracks, customers, employees, invoices, playlists, genres, media_types, export, reports, autocomplete
+
+def setup_database():
+    """Build the full-text search indexes, sales rollups and table versions on
+    first start, then add any index the database is missing."""
+    # Under serve.py every worker runs this; the first one does the work
+    with writer_lock():
+        setup_versions(engine)
+        setup_search(engine)
+        setup_rollups(engine)
+        setup_indexes(engine)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    setup_database()
+    setup_autocomplete(engine)
+    yield
+    stop_autocomplete()
+    if group_commit.committer is not None:
+        group_commit.committer.stop()
+    if async_engine is not None:
+        await async_engine.dispose()
+        await async_read_engine.dispose()
 
 app = FastAPI(
     title="Chinook API",
     description="API for the Chinook digital media store",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+@app.exception_handler(PoolTimeoutError)
+def pool_timeout(request: Request, exc: PoolTimeoutError):
+    # No pooled connection came free within the pool timeout
+    return JSONResponse(
+        status_code=503, content={"detail": "Database busy, try again"}, headers={"Retry-After": "1"}
+    )
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -29,18 +74,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER, MISSING_IDS_HEADER, "ETag", "Server-Timing"],
 )
 
-# Include all routers
-app.include_router(artists.router)
-app.include_router(albums.router)
-app.include_router(tracks.router)
-app.include_router(customers.router)
-app.include_router(employees.router)
-app.include_router(invoices.router)
-app.include_router(playlists.router)
-app.include_router(genres.router)
-app.include_router(media_types.router)
+# Per-request SQL and latency instrumentation: Server-Timing header and /metrics
+instrument_engines(sync_engines())
+app.add_middleware(MetricsMiddleware)
+
+# Include all routers, switched to async handlers when async mode is on
+for module in (artists, albums, tracks, customers, employees, invoices, playlists, genres, media_types, export, reports, autocomplete):
+    app.include_router(async_router(module.router) if settings.async_db else module.router)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
@@ -49,6 +92,15 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 def read_root():
     return RedirectResponse(url="/static/index.html")
 
+@app.get("/cache/stats")
+def read_cache_stats():
+    return cache_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/api")
 def read_api_info():
     return {
@@ -63,7 +115,10 @@ def read_api_info():
             "/invoices",
             "/playlists",
             "/genres",
-            "/media-types"
+            "/media-types",
+            "/export",
+            "/reports",
+            "/autocomplete"
         ]
     }
 
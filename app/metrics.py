@@ -0,0 +1,253 @@
+import inspect
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+from app import group_commit
+from app.cache import cache_stats
+
+# Upper bounds of the histogram buckets, in seconds and in statements
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+# Route label of requests that matched no route, so 404 scans don't add series
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class RequestMetrics:
+    """Timings of the request being handled, in seconds."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.handler_time = None
+        self.handler_end = None
+        self.serialize_time = None
+
+    def server_timing(self, now: float) -> str:
+        entries = [f'db;dur={self.db_time * 1000:.2f};desc="{self.queries} queries"']
+        if self.handler_time is not None:
+            entries.append(f"handler;dur={self.handler_time * 1000:.2f}")
+        if self.serialize_time is not None:
+            entries.append(f"serialize;dur={self.serialize_time * 1000:.2f}")
+        entries.append(f"total;dur={(now - self.start) * 1000:.2f}")
+        return ", ".join(entries)
+
+
+# Set by MetricsMiddleware for the duration of each HTTP request. The object
+# itself is shared, so threadpool workers that inherit the context (sync
+# handlers, run_sync, streaming bodies) record into the same instance.
+current_request: ContextVar[Optional[RequestMetrics]] = ContextVar("current_request", default=None)
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram with one series per label set."""
+
+    def __init__(self, name: str, description: str, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self, label_names: tuple) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            label_text = _format_labels(label_names, labels)
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+class Registry:
+    """Per-route request metrics aggregated since the process started."""
+
+    ROUTE_LABELS = ("method", "route")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.duration = Histogram(
+            "chinook_http_request_duration_seconds", "Time from request start to the last body byte.", LATENCY_BUCKETS
+        )
+        self.db_time = Histogram(
+            "chinook_http_request_db_seconds", "Time spent executing SQL statements per request.", LATENCY_BUCKETS
+        )
+        self.queries = Histogram(
+            "chinook_http_request_queries", "SQL statements executed per request.", QUERY_BUCKETS
+        )
+
+    def observe(self, method: str, route: str, status: int, metrics: RequestMetrics, duration: float):
+        labels = (method, route)
+        with self._lock:
+            key = (method, route, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.duration.observe(labels, duration)
+            self.db_time.observe(labels, metrics.db_time)
+            self.queries.observe(labels, metrics.queries)
+
+    def render(self) -> str:
+        with self._lock:
+            lines = [
+                "# HELP chinook_http_requests_total HTTP requests handled, by route and status code.",
+                "# TYPE chinook_http_requests_total counter",
+            ]
+            for labels, count in sorted(self.requests.items()):
+                label_text = _format_labels(self.ROUTE_LABELS + ("status",), labels)
+                lines.append(f"chinook_http_requests_total{{{label_text}}} {count}")
+            for histogram in (self.duration, self.db_time, self.queries):
+                lines.extend(histogram.render(self.ROUTE_LABELS))
+
+        for kind in ("hits", "misses"):
+            lines.append(f"# HELP chinook_cache_{kind}_total Reference cache {kind}.")
+            lines.append(f"# TYPE chinook_cache_{kind}_total counter")
+            for name, stats in cache_stats().items():
+                lines.append(f'chinook_cache_{kind}_total{{cache="{name}"}} {stats[kind]}')
+
+        if group_commit.committer is not None:
+            stats = group_commit.committer.stats()
+            for kind, description in (("batches", "transactions committed"), ("operations", "writes committed")):
+                lines.append(f"# HELP chinook_group_commit_{kind}_total Group commit {description}.")
+                lines.append(f"# TYPE chinook_group_commit_{kind}_total counter")
+                lines.append(f"chinook_group_commit_{kind}_total {stats[kind]}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# The start time lives on the statement's execution context, which is
+# dropped with the statement whether or not it raised; after_cursor_execute
+# only fires for statements that succeeded
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_start
+    metrics = current_request.get()
+    if metrics is not None:
+        metrics.queries += 1
+        metrics.db_time += elapsed
+
+
+def instrument_engines(engines):
+    """Attribute SQL statements run on `engines` to the current request."""
+    for engine in engines:
+        if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _record_handler(start: float):
+    metrics = current_request.get()
+    if metrics is not None:
+        metrics.handler_end = time.perf_counter()
+        metrics.handler_time = metrics.handler_end - start
+
+
+def _timed(endpoint):
+    # Keeps the endpoint's signature (via __wrapped__) so FastAPI resolves the
+    # same parameters, and its sync/async kind so it runs in the same place.
+    if inspect.iscoroutinefunction(endpoint):
+        @wraps(endpoint)
+        async def timed_endpoint(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                _record_handler(start)
+    else:
+        @wraps(endpoint)
+        def timed_endpoint(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                _record_handler(start)
+    return timed_endpoint
+
+
+class TimedRoute(APIRoute):
+    """APIRoute that reports handler and response serialization time.
+
+    Use as `APIRouter(route_class=TimedRoute)`. Handler time covers the
+    endpoint function only; serialization is everything after it until the
+    Response object is built (response model validation and JSON encoding).
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _timed(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        route_handler = super().get_route_handler()
+
+        async def timed_route_handler(request):
+            response = await route_handler(request)
+            metrics = current_request.get()
+            if metrics is not None and metrics.handler_end is not None:
+                metrics.serialize_time = time.perf_counter() - metrics.handler_end
+            return response
+
+        return timed_route_handler
+
+
+class MetricsMiddleware:
+    """Add a Server-Timing header to every response and record it in `registry`."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", metrics.server_timing(time.perf_counter()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            duration = time.perf_counter() - metrics.start
+            current_request.reset(token)
+            route = scope.get("route")
+            registry.observe(
+                scope["method"], getattr(route, "path", UNMATCHED_ROUTE), status, metrics, duration
+            )
@@ -1,21 +1,27 @@
 
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime, Date, Index
+from sqlalchemy.orm import query_expression, relationship
 
 from app.database import Base
 
+# Foreign key indexes keep the IFK_* names of the original Chinook database,
+# so app.indexes only creates the ones an existing database is missing
+
 class Artist(Base):
     __tablename__ = "Artist"
 
-    ArtistId = Column(Integer, primary_key=True, index=True)
+    ArtistId = Column(Integer, primary_key=True)
     Name = Column(String)
     
     albums = relationship("Album", back_populates="artist")
 
 class Album(Base):
     __tablename__ = "Album"
+    __table_args__ = (
+        Index("IFK_AlbumArtistId", "ArtistId"),
+    )
 
-    AlbumId = Column(Integer, primary_key=True, index=True)
+    AlbumId = Column(Integer, primary_key=True)
     Title = Column(String)
     ArtistId = Column(Integer, ForeignKey("Artist.ArtistId"))
     
@@ -25,7 +31,7 @@ class Album(Base):
 class Genre(Base):
     __tablename__ = "Genre"
 
-    GenreId = Column(Integer, primary_key=True, index=True)
+    GenreId = Column(Integer, primary_key=True)
     Name = Column(String)
     
     tracks = relationship("Track", back_populates="genre")
@@ -33,15 +39,20 @@ class Genre(Base):
 class MediaType(Base):
     __tablename__ = "MediaType"
 
-    MediaTypeId = Column(Integer, primary_key=True, index=True)
+    MediaTypeId = Column(Integer, primary_key=True)
     Name = Column(String)
     
     tracks = relationship("Track", back_populates="media_type")
 
 class Track(Base):
     __tablename__ = "Track"
+    __table_args__ = (
+        Index("IFK_TrackAlbumId", "AlbumId"),
+        Index("IFK_TrackGenreId", "GenreId"),
+        Index("IFK_TrackMediaTypeId", "MediaTypeId"),
+    )
 
-    TrackId = Column(Integer, primary_key=True, index=True)
+    TrackId = Column(Integer, primary_key=True)
     Name = Column(String)
     AlbumId = Column(Integer, ForeignKey("Album.AlbumId"))
     MediaTypeId = Column(Integer, ForeignKey("MediaType.MediaTypeId"))
@@ -50,6 +61,8 @@ class Track(Base):
     Milliseconds = Column(Integer)
     Bytes = Column(Integer)
     UnitPrice = Column(Float)
+    # Position in a playlist, only loaded by queries that join PlaylistTrack
+    Position = query_expression()
     
     album = relationship("Album", back_populates="tracks")
     genre = relationship("Genre", back_populates="tracks")
@@ -60,13 +73,21 @@ class Track(Base):
 class Playlist(Base):
     __tablename__ = "Playlist"
 
-    PlaylistId = Column(Integer, primary_key=True, index=True)
+    PlaylistId = Column(Integer, primary_key=True)
     Name = Column(String)
     
     playlist_tracks = relationship("PlaylistTrack", back_populates="playlist")
+    tracks = relationship("Track", secondary="PlaylistTrack", viewonly=True)
 
 class PlaylistTrack(Base):
     __tablename__ = "PlaylistTrack"
+    # The primary key index covers lookups by playlist; the TrackId one covers
+    # the reverse direction, so both are answered from an index alone. The
+    # PlaylistId index keeps each playlist's rows in rowid (position) order.
+    __table_args__ = (
+        Index("IX_PlaylistTrackTrackIdPlaylistId", "TrackId", "PlaylistId"),
+        Index("IX_PlaylistTrackPlaylistId", "PlaylistId"),
+    )
 
     PlaylistId = Column(Integer, ForeignKey("Playlist.PlaylistId"), primary_key=True)
     TrackId = Column(Integer, ForeignKey("Track.TrackId"), primary_key=True)
@@ -76,8 +97,11 @@ class PlaylistTrack(Base):
 
 class Customer(Base):
     __tablename__ = "Customer"
+    __table_args__ = (
+        Index("IFK_CustomerSupportRepId", "SupportRepId"),
+    )
 
-    CustomerId = Column(Integer, primary_key=True, index=True)
+    CustomerId = Column(Integer, primary_key=True)
     FirstName = Column(String)
     LastName = Column(String)
     Company = Column(String)
@@ -96,8 +120,11 @@ class Customer(Base):
 
 class Employee(Base):
     __tablename__ = "Employee"
+    __table_args__ = (
+        Index("IFK_EmployeeReportsTo", "ReportsTo"),
+    )
 
-    EmployeeId = Column(Integer, primary_key=True, index=True)
+    EmployeeId = Column(Integer, primary_key=True)
     LastName = Column(String)
     FirstName = Column(String)
     Title = Column(String)
@@ -118,8 +145,11 @@ class Employee(Base):
 
 class Invoice(Base):
     __tablename__ = "Invoice"
+    __table_args__ = (
+        Index("IFK_InvoiceCustomerId", "CustomerId"),
+    )
 
-    InvoiceId = Column(Integer, primary_key=True, index=True)
+    InvoiceId = Column(Integer, primary_key=True)
     CustomerId = Column(Integer, ForeignKey("Customer.CustomerId"))
     InvoiceDate = Column(DateTime)
     BillingAddress = Column(String)
@@ -134,8 +164,12 @@ class Invoice(Base):
 
 class InvoiceLine(Base):
     __tablename__ = "InvoiceLine"
+    __table_args__ = (
+        Index("IFK_InvoiceLineInvoiceId", "InvoiceId"),
+        Index("IFK_InvoiceLineTrackId", "TrackId"),
+    )
 
-    InvoiceLineId = Column(Integer, primary_key=True, index=True)
+    InvoiceLineId = Column(Integer, primary_key=True)
     InvoiceId = Column(Integer, ForeignKey("Invoice.InvoiceId"))
     TrackId = Column(Integer, ForeignKey("Track.TrackId"))
     UnitPrice = Column(Float)
@@ -143,3 +177,47 @@ class InvoiceLine(Base):
     
     invoice = relationship("Invoice", back_populates="invoice_lines")
     track = relationship("Track", back_populates="invoice_lines")
+
+# Sales rollups, maintained incrementally by app.rollups on invoice line writes
+class SalesByTrack(Base):
+    __tablename__ = "SalesByTrack"
+
+    TrackId = Column(Integer, primary_key=True)
+    Revenue = Column(Float, nullable=False, default=0, index=True)
+    Units = Column(Integer, nullable=False, default=0)
+
+class SalesByAlbum(Base):
+    __tablename__ = "SalesByAlbum"
+
+    AlbumId = Column(Integer, primary_key=True)
+    Revenue = Column(Float, nullable=False, default=0, index=True)
+    Units = Column(Integer, nullable=False, default=0)
+
+class SalesByArtist(Base):
+    __tablename__ = "SalesByArtist"
+
+    ArtistId = Column(Integer, primary_key=True)
+    Revenue = Column(Float, nullable=False, default=0, index=True)
+    Units = Column(Integer, nullable=False, default=0)
+
+class SalesByGenre(Base):
+    __tablename__ = "SalesByGenre"
+
+    GenreId = Column(Integer, primary_key=True)
+    Revenue = Column(Float, nullable=False, default=0, index=True)
+    Units = Column(Integer, nullable=False, default=0)
+
+class SalesByDay(Base):
+    __tablename__ = "SalesByDay"
+
+    Day = Column(Date, primary_key=True)
+    Revenue = Column(Float, nullable=False, default=0)
+    Units = Column(Integer, nullable=False, default=0)
+
+
+# Change counter per table, bumped by every write; drives the ETags of GET responses
+class TableVersion(Base):
+    __tablename__ = "TableVersion"
+
+    Name = Column(String, primary_key=True)
+    Version = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,136 @@
+import base64
+import json
+from typing import Optional
+
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import tuple_
+from sqlalchemy.sql import operators
+
+from app.bulk import chunked
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+MISSING_IDS_HEADER = "X-Missing-Ids"
+
+
+def encode_cursor(values) -> str:
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if (
+        not isinstance(values, list)
+        or len(values) != size
+        or not all(isinstance(value, (int, float, str)) for value in values)
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def paginate(query, response: Response, order_by: list, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """Return one page of `query`, ordered by the `order_by` columns.
+
+    The last column of `order_by` must be the primary key so the ordering is
+    total. With a `cursor` the page starts right after the row it encodes
+    (`WHERE (key, pk) > (:key, :pk)`), otherwise `skip` is used as an offset.
+    When the page is full, a cursor for the next page is returned in the
+    X-Next-Cursor response header.
+
+    The columns may also all be `.desc()`, for pages in descending order.
+    """
+    columns = [_unordered(column) for column in order_by]
+    if cursor is not None:
+        values = decode_cursor(cursor, len(order_by))
+        if len({_descending(column) for column in order_by}) > 1:
+            raise ValueError("order_by columns must all sort in the same direction")
+        if len(columns) == 1:
+            key, value = columns[0], values[0]
+        else:
+            key, value = tuple_(*columns), tuple_(*values)
+        query = query.filter(key < value if _descending(order_by[0]) else key > value)
+    rows = query.order_by(*order_by)
+    if cursor is None and skip:
+        rows = rows.offset(skip)
+    rows = rows.limit(limit).all()
+
+    if rows and len(rows) == limit:
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(getattr(last, column.key) for column in columns)
+    return rows
+
+
+def _descending(column) -> bool:
+    return getattr(column, "modifier", None) is operators.desc_op
+
+
+def _unordered(column):
+    # The column under .desc()/.asc()
+    return column.element if getattr(column, "modifier", None) in (operators.desc_op, operators.asc_op) else column
+
+
+def paginate_items(items: list, response: Response, order_by: list, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """Same as paginate(), for an in-memory list already sorted by the `order_by` attribute names."""
+    if cursor is not None:
+        values = decode_cursor(cursor, len(order_by))
+        if items:
+            # Python, unlike SQLite, can't order a string against a number
+            keys = [getattr(items[0], name) for name in order_by]
+            if any(isinstance(value, str) != isinstance(key, str) for value, key in zip(values, keys)):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+        items = [item for item in items if [getattr(item, name) for name in order_by] > values]
+    elif skip > 0:
+        items = items[skip:]
+    # A negative LIMIT is no limit in SQLite
+    rows = items[:limit] if limit >= 0 else items
+
+    if rows and len(rows) == limit:
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(getattr(last, name) for name in order_by)
+    return rows
+
+
+def parse_ids(
+    ids: Optional[str] = Query(
+        None,
+        description="Comma-separated ids to fetch, in this order, instead of a page. "
+                    f"Ids without a row are listed in the {MISSING_IDS_HEADER} header.",
+    ),
+) -> Optional[list]:
+    """Dependency for the `ids` query parameter of list endpoints."""
+    if ids is None:
+        return None
+    try:
+        return [int(value) for value in ids.split(",") if value.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+
+
+def _found_in_order(found: dict, response: Response, ids: list) -> list:
+    missing = [value for value in dict.fromkeys(ids) if value not in found]
+    if missing:
+        response.headers[MISSING_IDS_HEADER] = ",".join(map(str, missing))
+    return [found[value] for value in ids if value in found]
+
+
+def fetch_ids(query, response: Response, pk_column, ids: list) -> list:
+    """The rows of `query` whose `pk_column` is in `ids`, in the order of `ids`.
+
+    Runs one IN query per chunk of ids. Ids without a row are left out and
+    listed in the X-Missing-Ids response header instead.
+    """
+    found = {}
+    for chunk in chunked(set(ids)):
+        for row in query.filter(pk_column.in_(chunk)):
+            found[getattr(row, pk_column.key)] = row
+    return _found_in_order(found, response, ids)
+
+
+def pick_ids(items: dict, response: Response, ids: list) -> list:
+    """Same as fetch_ids(), for in-memory `items` keyed by primary key."""
+    return _found_in_order(items, response, ids)
@@ -0,0 +1,50 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import database
+
+
+class QueryCounter:
+    """Record every SQL statement executed on `engines` while active.
+
+    Counts the app's own engines (sync and async, read and write) by default.
+    """
+
+    def __init__(self, *engines):
+        self.engines = engines or database.sync_engines()
+        self.statements = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        for engine in self.engines:
+            event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc_info):
+        for engine in self.engines:
+            event.remove(engine, "before_cursor_execute", self._before_cursor_execute)
+
+
+@contextmanager
+def assert_max_queries(budget: int, *engines):
+    """Fail with AssertionError if the block runs more than `budget` statements.
+
+    Pins an endpoint's N+1 behaviour, as benchmarks.check_query_budgets does:
+
+        with assert_max_queries(3):
+            client.get("/customers/1/with-invoices")
+    """
+    with QueryCounter(*engines) as counter:
+        yield counter
+    if counter.count > budget:
+        statements = "\n".join(f"  {statement}" for statement in counter.statements)
+        raise AssertionError(
+            f"Expected at most {budget} SQL statements, {counter.count} were executed:\n{statements}"
+        )
@@ -0,0 +1,219 @@
+from collections import defaultdict
+
+from sqlalchemy import inspect, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app import versions
+from app.bulk import chunked
+from app.models.models import (
+    Album as AlbumModel, InvoiceLine as InvoiceLineModel, Invoice as InvoiceModel, Track as TrackModel,
+    SalesByTrack, SalesByAlbum, SalesByArtist, SalesByGenre, SalesByDay
+)
+
+ROLLUP_MODELS = (SalesByTrack, SalesByAlbum, SalesByArtist, SalesByGenre, SalesByDay)
+
+_REBUILD_SQL = [
+    """
+    INSERT INTO SalesByTrack (TrackId, Revenue, Units)
+    SELECT TrackId, SUM(UnitPrice * Quantity), SUM(Quantity)
+    FROM InvoiceLine GROUP BY TrackId
+    """,
+    """
+    INSERT INTO SalesByAlbum (AlbumId, Revenue, Units)
+    SELECT Track.AlbumId, SUM(SalesByTrack.Revenue), SUM(SalesByTrack.Units)
+    FROM SalesByTrack JOIN Track ON Track.TrackId = SalesByTrack.TrackId
+    WHERE Track.AlbumId IS NOT NULL GROUP BY Track.AlbumId
+    """,
+    """
+    INSERT INTO SalesByArtist (ArtistId, Revenue, Units)
+    SELECT Album.ArtistId, SUM(SalesByAlbum.Revenue), SUM(SalesByAlbum.Units)
+    FROM SalesByAlbum JOIN Album ON Album.AlbumId = SalesByAlbum.AlbumId
+    WHERE Album.ArtistId IS NOT NULL GROUP BY Album.ArtistId
+    """,
+    """
+    INSERT INTO SalesByGenre (GenreId, Revenue, Units)
+    SELECT Track.GenreId, SUM(SalesByTrack.Revenue), SUM(SalesByTrack.Units)
+    FROM SalesByTrack JOIN Track ON Track.TrackId = SalesByTrack.TrackId
+    WHERE Track.GenreId IS NOT NULL GROUP BY Track.GenreId
+    """,
+    """
+    INSERT INTO SalesByDay (Day, Revenue, Units)
+    SELECT date(Invoice.InvoiceDate), SUM(InvoiceLine.UnitPrice * InvoiceLine.Quantity), SUM(InvoiceLine.Quantity)
+    FROM InvoiceLine JOIN Invoice ON Invoice.InvoiceId = InvoiceLine.InvoiceId
+    GROUP BY date(Invoice.InvoiceDate)
+    """,
+]
+
+
+def rebuild(db: Session):
+    """Recompute every rollup table from InvoiceLine. Caller commits."""
+    for model in ROLLUP_MODELS:
+        db.query(model).delete()
+    for statement in _REBUILD_SQL:
+        db.execute(text(statement))
+    versions.bump(db, *ROLLUP_MODELS)
+
+
+def setup_rollups(engine):
+    """Create the rollup tables on first start and fill them from the sales history."""
+    missing = [model.__table__ for model in ROLLUP_MODELS if not inspect(engine).has_table(model.__tablename__)]
+    if not missing:
+        return
+    for table in missing:
+        table.create(engine)
+    with Session(engine) as db:
+        rebuild(db)
+        db.commit()
+
+
+def _upsert(db: Session, model, deltas: dict):
+    if not deltas:
+        return
+    key = model.__table__.primary_key.columns.keys()[0]
+    statement = sqlite_insert(model)
+    statement = statement.on_conflict_do_update(
+        index_elements=[key],
+        set_={
+            "Revenue": model.Revenue + statement.excluded.Revenue,
+            "Units": model.Units + statement.excluded.Units,
+        },
+    )
+    db.execute(statement, [
+        {key: value, "Revenue": revenue, "Units": units}
+        for value, (revenue, units) in deltas.items()
+    ])
+    versions.bump(db, model)
+
+
+def _add(deltas: dict, key, revenue: float, units: int):
+    current = deltas[key]
+    deltas[key] = (current[0] + revenue, current[1] + units)
+
+
+def apply_lines(db: Session, lines, sign: int = 1):
+    """Add (sign=1) or subtract (sign=-1) invoice lines to/from every rollup.
+
+    `lines` yields (TrackId, InvoiceDate, UnitPrice, Quantity) tuples. Must
+    run in the transaction that writes the lines themselves.
+    """
+    lines = list(lines)
+    if not lines:
+        return
+
+    # Album, artist and genre of every track involved, in one query per chunk
+    dimensions = {}
+    for chunk in chunked({line[0] for line in lines}):
+        dimensions.update(
+            (track_id, (album_id, artist_id, genre_id))
+            for track_id, album_id, artist_id, genre_id in db.query(
+                TrackModel.TrackId, TrackModel.AlbumId, AlbumModel.ArtistId, TrackModel.GenreId
+            ).outerjoin(AlbumModel, AlbumModel.AlbumId == TrackModel.AlbumId).filter(TrackModel.TrackId.in_(chunk))
+        )
+
+    deltas = {model: defaultdict(lambda: (0.0, 0)) for model in ROLLUP_MODELS}
+    for track_id, invoice_date, unit_price, quantity in lines:
+        revenue = sign * unit_price * quantity
+        units = sign * quantity
+        album_id, artist_id, genre_id = dimensions.get(track_id, (None, None, None))
+        _add(deltas[SalesByTrack], track_id, revenue, units)
+        _add(deltas[SalesByDay], invoice_date.date(), revenue, units)
+        if album_id is not None:
+            _add(deltas[SalesByAlbum], album_id, revenue, units)
+        if artist_id is not None:
+            _add(deltas[SalesByArtist], artist_id, revenue, units)
+        if genre_id is not None:
+            _add(deltas[SalesByGenre], genre_id, revenue, units)
+
+    for model, model_deltas in deltas.items():
+        _upsert(db, model, model_deltas)
+
+
+def apply_invoice(db: Session, invoice_id: int, sign: int = 1):
+    """Add or subtract all current lines of an invoice to/from the rollups."""
+    apply_lines(db, db.query(
+        InvoiceLineModel.TrackId, InvoiceModel.InvoiceDate, InvoiceLineModel.UnitPrice, InvoiceLineModel.Quantity
+    ).join(InvoiceModel, InvoiceModel.InvoiceId == InvoiceLineModel.InvoiceId).filter(
+        InvoiceLineModel.InvoiceId == invoice_id
+    ).all(), sign)
+
+
+def move_track(db: Session, track_id: int, old_album_id, old_genre_id, new_album_id, new_genre_id):
+    """Move a track's sales between albums/artists/genres after it was reassigned."""
+    sales = db.query(SalesByTrack).filter(SalesByTrack.TrackId == track_id).first()
+    if sales is None or (old_album_id == new_album_id and old_genre_id == new_genre_id):
+        return
+
+    def artist_of(album_id):
+        if album_id is None:
+            return None
+        return db.query(AlbumModel.ArtistId).filter(AlbumModel.AlbumId == album_id).scalar()
+
+    old_artist_id = artist_of(old_album_id)
+    new_artist_id = artist_of(new_album_id)
+    for model, old, new in (
+        (SalesByAlbum, old_album_id, new_album_id),
+        (SalesByArtist, old_artist_id, new_artist_id),
+        (SalesByGenre, old_genre_id, new_genre_id),
+    ):
+        if old == new:
+            continue
+        if old is not None:
+            _upsert(db, model, {old: (-sales.Revenue, -sales.Units)})
+        if new is not None:
+            _upsert(db, model, {new: (sales.Revenue, sales.Units)})
+
+
+def move_album(db: Session, album_id: int, old_artist_id, new_artist_id):
+    """Move an album's sales between artists after it was reassigned."""
+    sales = db.query(SalesByAlbum).filter(SalesByAlbum.AlbumId == album_id).first()
+    if sales is None or old_artist_id == new_artist_id:
+        return
+    if old_artist_id is not None:
+        _upsert(db, SalesByArtist, {old_artist_id: (-sales.Revenue, -sales.Units)})
+    if new_artist_id is not None:
+        _upsert(db, SalesByArtist, {new_artist_id: (sales.Revenue, sales.Units)})
+
+
+def _forget(db: Session, model, key):
+    (column,) = model.__table__.primary_key.columns
+    if db.query(model).filter(column == key).delete(synchronize_session=False):
+        versions.bump(db, model)
+
+
+def remove_track(db: Session, track_id: int, album_id, genre_id):
+    """Take a track's sales out of the rollups before the track is deleted."""
+    move_track(db, track_id, album_id, genre_id, None, None)
+    _forget(db, SalesByTrack, track_id)
+
+
+def remove_album(db: Session, album_id: int, artist_id):
+    """Take an album's sales out of the rollups before the album is deleted.
+
+    Its tracks lose their AlbumId, so their sales no longer count for the
+    artist either; they stay in the track and genre rollups.
+    """
+    move_album(db, album_id, artist_id, None)
+    _forget(db, SalesByAlbum, album_id)
+
+
+def remove_artist(db: Session, artist_id: int):
+    """Drop an artist's rollup row before the artist is deleted."""
+    _forget(db, SalesByArtist, artist_id)
+
+
+def remove_genre(db: Session, genre_id: int):
+    """Drop a genre's rollup row before the genre is deleted."""
+    _forget(db, SalesByGenre, genre_id)
+
+
+# Full rebuild, for recovery when the rollups have drifted: python -m app.rollups
+if __name__ == "__main__":
+    from app.database import engine
+
+    for model in ROLLUP_MODELS:
+        model.__table__.create(engine, checkfirst=True)
+    with Session(engine) as db:
+        rebuild(db)
+        db.commit()
+    print("Sales rollups rebuilt")
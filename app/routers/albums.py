@@ -1,42 +1,65 @@
 
 
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.orm import Session, joinedload
 
+from app import autocomplete, cache, fast_json, fieldsets, includes, rollups, versions
 from app.database import get_db
-from app.models.models import Album as AlbumModel, Artist as ArtistModel
+from app.metrics import TimedRoute
+from app.pagination import parse_ids
+from app.models.models import Album as AlbumModel, Artist as ArtistModel, Track as TrackModel
 from app.schemas.schemas import Album, AlbumCreate, AlbumWithArtist
 
 router = APIRouter(
     prefix="/albums",
     tags=["albums"],
+    route_class=TimedRoute,
     responses={404: {"description": "Not found"}},
 )
 
-@router.get("/", response_model=List[Album])
-def read_albums(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    albums = db.query(AlbumModel).offset(skip).limit(limit).all()
-    return albums
+@router.get("/", response_model=List[Album], dependencies=[versions.conditional_get(AlbumModel)])
+def read_albums(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    ids: Optional[list] = Depends(parse_ids),
+    fieldset: Optional[tuple] = fieldsets.select(Album),
+    include: Optional[tuple] = includes.select(AlbumModel),
+    db: Session = Depends(get_db)
+):
+    albums = fast_json.paginate(db.query(AlbumModel), Album, response, [AlbumModel.AlbumId], skip, limit, cursor, fieldset, include, ids)
+    return includes.render(albums, Album, fieldset, include, response)
 
-@router.get("/{album_id}", response_model=AlbumWithArtist)
-def read_album(album_id: int, db: Session = Depends(get_db)):
-    db_album = db.query(AlbumModel).filter(AlbumModel.AlbumId == album_id).first()
+@router.get("/{album_id}", response_model=AlbumWithArtist, dependencies=[versions.conditional_get(AlbumModel, ArtistModel)])
+def read_album(
+    album_id: int,
+    response: Response,
+    fieldset: Optional[tuple] = fieldsets.select(AlbumWithArtist),
+    include: Optional[tuple] = includes.select(AlbumModel),
+    db: Session = Depends(get_db)
+):
+    # AlbumWithArtist nests the artist: load it in the same query
+    db_album = includes.project(db.query(AlbumModel), fieldset, include, {
+        AlbumModel.artist: joinedload,
+    }).filter(AlbumModel.AlbumId == album_id).first()
     if db_album is None:
         raise HTTPException(status_code=404, detail="Album not found")
-    return db_album
+    return includes.render(db_album, AlbumWithArtist, fieldset, include, response)
 
 @router.post("/", response_model=Album)
 def create_album(album: AlbumCreate, db: Session = Depends(get_db)):
     # Check if artist exists
-    artist = db.query(ArtistModel).filter(ArtistModel.ArtistId == album.ArtistId).first()
-    if not artist:
+    if cache.get_artist(db, album.ArtistId) is None:
         raise HTTPException(status_code=404, detail="Artist not found")
     
     db_album = AlbumModel(Title=album.Title, ArtistId=album.ArtistId)
     db.add(db_album)
+    versions.bump(db, AlbumModel)
     db.commit()
     db.refresh(db_album)
+    autocomplete.index.add(db, "album", {db_album.AlbumId: db_album.Title})
     return db_album
 
 @router.put("/{album_id}", response_model=Album)
@@ -46,14 +69,18 @@ def update_album(album_id: int, album: AlbumCreate, db: Session = Depends(get_db
         raise HTTPException(status_code=404, detail="Album not found")
     
     # Check if artist exists
-    artist = db.query(ArtistModel).filter(ArtistModel.ArtistId == album.ArtistId).first()
-    if not artist:
+    if cache.get_artist(db, album.ArtistId) is None:
         raise HTTPException(status_code=404, detail="Artist not found")
     
+    # Keep artist sales in step when the album is reassigned
+    rollups.move_album(db, album_id, db_album.ArtistId, album.ArtistId)
+    
     db_album.Title = album.Title
     db_album.ArtistId = album.ArtistId
+    versions.bump(db, AlbumModel)
     db.commit()
     db.refresh(db_album)
+    autocomplete.index.add(db, "album", {db_album.AlbumId: db_album.Title})
     return db_album
 
 @router.delete("/{album_id}", response_model=Album)
@@ -62,17 +89,30 @@ def delete_album(album_id: int, db: Session = Depends(get_db)):
     if db_album is None:
         raise HTTPException(status_code=404, detail="Album not found")
     
+    # Its tracks are left without an album, and their sales without an artist
+    rollups.remove_album(db, album_id, db_album.ArtistId)
+    
     db.delete(db_album)
+    versions.bump(db, AlbumModel, TrackModel)
     db.commit()
+    # Its tracks lost their album, which the track index doesn't show
+    autocomplete.index.remove(db, "album", [album_id])
+    autocomplete.index.written(db, "track")
     return db_album
 
-@router.get("/by-artist/{artist_id}", response_model=List[Album])
-def read_albums_by_artist(artist_id: int, db: Session = Depends(get_db)):
+@router.get("/by-artist/{artist_id}", response_model=List[Album], dependencies=[versions.conditional_get(AlbumModel, ArtistModel)])
+def read_albums_by_artist(
+    artist_id: int,
+    response: Response,
+    fieldset: Optional[tuple] = fieldsets.select(Album),
+    db: Session = Depends(get_db)
+):
     # Check if artist exists
-    artist = db.query(ArtistModel).filter(ArtistModel.ArtistId == artist_id).first()
-    if not artist:
+    if cache.get_artist(db, artist_id) is None:
         raise HTTPException(status_code=404, detail="Artist not found")
     
-    albums = db.query(AlbumModel).filter(AlbumModel.ArtistId == artist_id).all()
-    return albums
+    albums = fast_json.list_all(
+        db.query(AlbumModel).filter(AlbumModel.ArtistId == artist_id), Album, response, fieldset
+    )
+    return fieldsets.render(albums, Album, fieldset, response)
 
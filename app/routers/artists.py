@@ -1,36 +1,66 @@
 
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 
+from app import autocomplete, cache, fieldsets, rollups, versions
 from app.database import get_db
-from app.models.models import Artist as ArtistModel
+from app.metrics import TimedRoute
+from app.pagination import fetch_ids, paginate, parse_ids
+from app.models.models import Artist as ArtistModel, Album as AlbumModel
 from app.schemas.schemas import Artist, ArtistCreate
 
 router = APIRouter(
     prefix="/artists",
     tags=["artists"],
+    route_class=TimedRoute,
     responses={404: {"description": "Not found"}},
 )
 
-@router.get("/", response_model=List[Artist])
-def read_artists(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    artists = db.query(ArtistModel).offset(skip).limit(limit).all()
-    return artists
+@router.get("/", response_model=List[Artist], dependencies=[versions.conditional_get(ArtistModel)])
+def read_artists(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    ids: Optional[list] = Depends(parse_ids),
+    fieldset: Optional[tuple] = fieldsets.select(Artist),
+    db: Session = Depends(get_db)
+):
+    if ids is not None:
+        artists = fetch_ids(db.query(ArtistModel), response, ArtistModel.ArtistId, ids)
+        return fieldsets.render(artists, Artist, fieldset, response)
+    artists = cache.cached_page(
+        cache.artist_cache, ("page", skip, limit, cursor), response,
+        lambda page_response: [
+            Artist.model_validate(db_artist)
+            for db_artist in paginate(db.query(ArtistModel), page_response, [ArtistModel.ArtistId], skip, limit, cursor)
+        ],
+        cache.shared_version(db, ArtistModel),
+    )
+    return fieldsets.render(artists, Artist, fieldset, response)
 
-@router.get("/{artist_id}", response_model=Artist)
-def read_artist(artist_id: int, db: Session = Depends(get_db)):
-    db_artist = db.query(ArtistModel).filter(ArtistModel.ArtistId == artist_id).first()
+@router.get("/{artist_id}", response_model=Artist, dependencies=[versions.conditional_get(ArtistModel)])
+def read_artist(
+    artist_id: int,
+    response: Response,
+    fieldset: Optional[tuple] = fieldsets.select(Artist),
+    db: Session = Depends(get_db)
+):
+    db_artist = cache.get_artist(db, artist_id)
     if db_artist is None:
         raise HTTPException(status_code=404, detail="Artist not found")
-    return db_artist
+    return fieldsets.render(db_artist, Artist, fieldset, response)
 
 @router.post("/", response_model=Artist)
 def create_artist(artist: ArtistCreate, db: Session = Depends(get_db)):
     db_artist = ArtistModel(Name=artist.Name)
     db.add(db_artist)
+    versions.bump(db, ArtistModel)
     db.commit()
     db.refresh(db_artist)
+    cache.artist_cache.invalidate()
+    autocomplete.index.add(db, "artist", {db_artist.ArtistId: db_artist.Name})
     return db_artist
 
 @router.put("/{artist_id}", response_model=Artist)
@@ -40,8 +70,11 @@ def update_artist(artist_id: int, artist: ArtistCreate, db: Session = Depends(ge
         raise HTTPException(status_code=404, detail="Artist not found")
     
     db_artist.Name = artist.Name
+    versions.bump(db, ArtistModel)
     db.commit()
     db.refresh(db_artist)
+    cache.artist_cache.invalidate()
+    autocomplete.index.add(db, "artist", {db_artist.ArtistId: db_artist.Name})
     return db_artist
 
 @router.delete("/{artist_id}", response_model=Artist)
@@ -50,6 +83,11 @@ def delete_artist(artist_id: int, db: Session = Depends(get_db)):
     if db_artist is None:
         raise HTTPException(status_code=404, detail="Artist not found")
     
+    rollups.remove_artist(db, artist_id)
     db.delete(db_artist)
+    versions.bump(db, ArtistModel, AlbumModel)
     db.commit()
+    cache.artist_cache.invalidate()
+    autocomplete.index.remove(db, "artist", [artist_id])
+    autocomplete.index.written(db, "album")
     return db_artist
@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app import autocomplete
+from app.database import get_db
+from app.metrics import TimedRoute
+from app.schemas.schemas import Autocomplete, AutocompleteMatch
+
+# Answered from app.autocomplete's in-memory index without touching the
+# database, so there is no ETag either: the TableVersion lookup of a
+# conditional GET would cost more than the search itself.
+router = APIRouter(
+    prefix="/autocomplete",
+    tags=["autocomplete"],
+    route_class=TimedRoute,
+)
+
+FIELDS = {"artist": "Artists", "album": "Albums", "track": "Tracks"}
+
+def _parse_types(types: str) -> list:
+    kinds = [kind.strip() for kind in types.split(",") if kind.strip()]
+    for kind in kinds:
+        if kind not in FIELDS:
+            raise HTTPException(status_code=400, detail=f"Unknown type: {kind}. Types: {', '.join(FIELDS)}")
+    return kinds or list(FIELDS)
+
+@router.get("", response_model=Autocomplete)
+def read_autocomplete(
+    q: str = Query(..., min_length=1, max_length=100, description="Start of a word of the name, case- and accent-insensitive"),
+    types: str = Query("artist,album,track", description="Comma-separated types to search: artist, album, track"),
+    limit: int = Query(10, ge=1, le=autocomplete.MAX_LIMIT, description="Matches per type, most sold first"),
+    db: Session = Depends(get_db)
+):
+    kinds = _parse_types(types)
+    autocomplete.index.refresh(db, kinds)
+    matches = autocomplete.index.search(q, kinds, limit)
+    return Autocomplete(**{
+        FIELDS[kind]: [AutocompleteMatch(Id=id_, Name=name, Popularity=popularity) for id_, name, popularity in rows]
+        for kind, rows in matches.items()
+    })
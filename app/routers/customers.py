@@ -1,38 +1,69 @@
 
 
 
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.orm import Session, selectinload
 
+from app import fast_json, fieldsets, includes, search, versions
 from app.database import get_db
-from app.models.models import Customer as CustomerModel, Employee as EmployeeModel
+from app.metrics import TimedRoute
+from app.pagination import parse_ids
+from app.models.models import Customer as CustomerModel, Employee as EmployeeModel, Invoice as InvoiceModel
 from app.schemas.schemas import Customer, CustomerCreate, CustomerWithInvoices
 
 router = APIRouter(
     prefix="/customers",
     tags=["customers"],
+    route_class=TimedRoute,
     responses={404: {"description": "Not found"}},
 )
 
-@router.get("/", response_model=List[Customer])
-def read_customers(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    customers = db.query(CustomerModel).offset(skip).limit(limit).all()
-    return customers
+@router.get("/", response_model=List[Customer], dependencies=[versions.conditional_get(CustomerModel)])
+def read_customers(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    ids: Optional[list] = Depends(parse_ids),
+    fieldset: Optional[tuple] = fieldsets.select(Customer),
+    include: Optional[tuple] = includes.select(CustomerModel),
+    db: Session = Depends(get_db)
+):
+    customers = fast_json.paginate(
+        db.query(CustomerModel), Customer, response, [CustomerModel.CustomerId], skip, limit, cursor, fieldset, include, ids
+    )
+    return includes.render(customers, Customer, fieldset, include, response)
 
-@router.get("/{customer_id}", response_model=Customer)
-def read_customer(customer_id: int, db: Session = Depends(get_db)):
-    db_customer = db.query(CustomerModel).filter(CustomerModel.CustomerId == customer_id).first()
+@router.get("/{customer_id}", response_model=Customer, dependencies=[versions.conditional_get(CustomerModel)])
+def read_customer(
+    customer_id: int,
+    response: Response,
+    fieldset: Optional[tuple] = fieldsets.select(Customer),
+    include: Optional[tuple] = includes.select(CustomerModel),
+    db: Session = Depends(get_db)
+):
+    db_customer = includes.project(db.query(CustomerModel), fieldset, include).filter(
+        CustomerModel.CustomerId == customer_id
+    ).first()
     if db_customer is None:
         raise HTTPException(status_code=404, detail="Customer not found")
-    return db_customer
+    return includes.render(db_customer, Customer, fieldset, include, response)
 
-@router.get("/{customer_id}/with-invoices", response_model=CustomerWithInvoices)
-def read_customer_with_invoices(customer_id: int, db: Session = Depends(get_db)):
-    db_customer = db.query(CustomerModel).filter(CustomerModel.CustomerId == customer_id).first()
+@router.get("/{customer_id}/with-invoices", response_model=CustomerWithInvoices, dependencies=[versions.conditional_get(CustomerModel, InvoiceModel)])
+def read_customer_with_invoices(
+    customer_id: int,
+    response: Response,
+    fieldset: Optional[tuple] = fieldsets.select(CustomerWithInvoices),
+    db: Session = Depends(get_db)
+):
+    # CustomerWithInvoices nests every invoice: fetch them with one IN query
+    db_customer = fieldsets.project(db.query(CustomerModel), fieldset, {
+        CustomerModel.invoices: selectinload,
+    }).filter(CustomerModel.CustomerId == customer_id).first()
     if db_customer is None:
         raise HTTPException(status_code=404, detail="Customer not found")
-    return db_customer
+    return fieldsets.render(db_customer, CustomerWithInvoices, fieldset, response)
 
 @router.post("/", response_model=Customer)
 def create_customer(customer: CustomerCreate, db: Session = Depends(get_db)):
@@ -44,6 +75,7 @@ def create_customer(customer: CustomerCreate, db: Session = Depends(get_db)):
     
     db_customer = CustomerModel(**customer.model_dump())
     db.add(db_customer)
+    versions.bump(db, CustomerModel)
     db.commit()
     db.refresh(db_customer)
     return db_customer
@@ -64,6 +96,7 @@ def update_customer(customer_id: int, customer: CustomerCreate, db: Session = De
     for key, value in customer.model_dump().items():
         setattr(db_customer, key, value)
     
+    versions.bump(db, CustomerModel)
     db.commit()
     db.refresh(db_customer)
     return db_customer
@@ -75,17 +108,20 @@ def delete_customer(customer_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Customer not found")
     
     db.delete(db_customer)
+    versions.bump(db, CustomerModel, InvoiceModel)
     db.commit()
     return db_customer
 
-@router.get("/search/{query}", response_model=List[Customer])
-def search_customers(query: str, db: Session = Depends(get_db)):
-    customers = db.query(CustomerModel).filter(
-        (CustomerModel.FirstName.like(f"%{query}%")) | 
-        (CustomerModel.LastName.like(f"%{query}%")) |
-        (CustomerModel.Email.like(f"%{query}%")) |
-        (CustomerModel.Company.like(f"%{query}%"))
-    ).all()
-    return customers
+@router.get("/search/{query}", response_model=List[Customer], dependencies=[versions.conditional_get(CustomerModel)])
+def search_customers(
+    query: str,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    fieldset: Optional[tuple] = fieldsets.select(Customer),
+    db: Session = Depends(get_db)
+):
+    customers = search.search_customers(db, query, skip=skip, limit=limit)
+    return fieldsets.render(customers, Customer, fieldset, response)
 
 
@@ -3,31 +3,81 @@
 
 
 
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from enum import Enum
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import and_, func, literal, select
 from sqlalchemy.orm import Session
 
+from app import fast_json, fieldsets, versions
 from app.database import get_db
-from app.models.models import Employee as EmployeeModel
-from app.schemas.schemas import Employee, EmployeeCreate
+from app.metrics import TimedRoute
+from app.pagination import paginate, parse_ids
+from app.models.models import (
+    Employee as EmployeeModel, Customer as CustomerModel, Genre as GenreModel, Invoice as InvoiceModel,
+    InvoiceLine as InvoiceLineModel, Track as TrackModel,
+)
+from app.schemas.schemas import Customer, Employee, EmployeeCreate, PortfolioCustomer
 
 router = APIRouter(
     prefix="/employees",
     tags=["employees"],
+    route_class=TimedRoute,
     responses={404: {"description": "Not found"}},
 )
 
-@router.get("/", response_model=List[Employee])
-def read_employees(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    employees = db.query(EmployeeModel).offset(skip).limit(limit).all()
-    return employees
+def _subtree(employee_id: int, depth: Optional[int] = None):
+    """Recursive CTE of the employees under `employee_id` (EmployeeId, Depth).
 
-@router.get("/{employee_id}", response_model=Employee)
-def read_employee(employee_id: int, db: Session = Depends(get_db)):
-    db_employee = db.query(EmployeeModel).filter(EmployeeModel.EmployeeId == employee_id).first()
+    Depth is 1 for direct reports; `depth` limits how many levels are
+    followed, None follows all of them. Each level is one lookup on
+    IFK_EmployeeReportsTo per employee of the level above, all in a single
+    statement.
+    """
+    tree = select(
+        EmployeeModel.EmployeeId, literal(1).label("Depth")
+    ).where(EmployeeModel.ReportsTo == employee_id).cte("subtree", recursive=True)
+    below = select(EmployeeModel.EmployeeId, tree.c.Depth + 1).where(EmployeeModel.ReportsTo == tree.c.EmployeeId)
+    if depth is not None:
+        below = below.where(tree.c.Depth < depth)
+    return tree.union_all(below)
+
+class PortfolioSort(str, Enum):
+    spend = "spend"
+    customer = "customer"
+
+def _check_employee(db: Session, employee_id: int):
+    if db.query(EmployeeModel.EmployeeId).filter(EmployeeModel.EmployeeId == employee_id).first() is None:
+        raise HTTPException(status_code=404, detail="Employee not found")
+
+@router.get("/", response_model=List[Employee], dependencies=[versions.conditional_get(EmployeeModel)])
+def read_employees(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    ids: Optional[list] = Depends(parse_ids),
+    fieldset: Optional[tuple] = fieldsets.select(Employee),
+    db: Session = Depends(get_db)
+):
+    employees = fast_json.paginate(
+        db.query(EmployeeModel), Employee, response, [EmployeeModel.EmployeeId], skip, limit, cursor, fieldset, ids=ids
+    )
+    return fieldsets.render(employees, Employee, fieldset, response)
+
+@router.get("/{employee_id}", response_model=Employee, dependencies=[versions.conditional_get(EmployeeModel)])
+def read_employee(
+    employee_id: int,
+    response: Response,
+    fieldset: Optional[tuple] = fieldsets.select(Employee),
+    db: Session = Depends(get_db)
+):
+    db_employee = fieldsets.project(db.query(EmployeeModel), fieldset).filter(
+        EmployeeModel.EmployeeId == employee_id
+    ).first()
     if db_employee is None:
         raise HTTPException(status_code=404, detail="Employee not found")
-    return db_employee
+    return fieldsets.render(db_employee, Employee, fieldset, response)
 
 @router.post("/", response_model=Employee)
 def create_employee(employee: EmployeeCreate, db: Session = Depends(get_db)):
@@ -39,6 +89,7 @@ def create_employee(employee: EmployeeCreate, db: Session = Depends(get_db)):
     
     db_employee = EmployeeModel(**employee.model_dump())
     db.add(db_employee)
+    versions.bump(db, EmployeeModel)
     db.commit()
     db.refresh(db_employee)
     return db_employee
@@ -58,11 +109,17 @@ def update_employee(employee_id: int, employee: EmployeeCreate, db: Session = De
         reports_to = db.query(EmployeeModel).filter(EmployeeModel.EmployeeId == employee.ReportsTo).first()
         if not reports_to:
             raise HTTPException(status_code=404, detail="Manager not found")
-    
+
+        # Nor to anyone under them, which would make the org chart a cycle
+        tree = _subtree(employee_id)
+        if db.query(tree.c.EmployeeId).filter(tree.c.EmployeeId == employee.ReportsTo).first() is not None:
+            raise HTTPException(status_code=400, detail="Employee cannot report to one of their own reports")
+
     # Update employee attributes
     for key, value in employee.model_dump().items():
         setattr(db_employee, key, value)
     
+    versions.bump(db, EmployeeModel)
     db.commit()
     db.refresh(db_employee)
     return db_employee
@@ -74,27 +131,155 @@ def delete_employee(employee_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Employee not found")
     
     # Check if employee has subordinates
-    subordinates = db.query(EmployeeModel).filter(EmployeeModel.ReportsTo == employee_id).all()
-    if subordinates:
+    subordinate = db.query(EmployeeModel.EmployeeId).filter(EmployeeModel.ReportsTo == employee_id).first()
+    if subordinate is not None:
         raise HTTPException(
             status_code=400, 
             detail="Cannot delete employee with subordinates. Reassign subordinates first."
         )
     
     db.delete(db_employee)
+    versions.bump(db, EmployeeModel, CustomerModel)
     db.commit()
     return db_employee
 
-@router.get("/{employee_id}/subordinates", response_model=List[Employee])
-def read_employee_subordinates(employee_id: int, db: Session = Depends(get_db)):
+@router.get("/{employee_id}/subordinates", response_model=List[Employee], dependencies=[versions.conditional_get(EmployeeModel)])
+def read_employee_subordinates(
+    employee_id: int,
+    response: Response,
+    fieldset: Optional[tuple] = fieldsets.select(Employee),
+    db: Session = Depends(get_db)
+):
     # Check if employee exists
     employee = db.query(EmployeeModel).filter(EmployeeModel.EmployeeId == employee_id).first()
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
     
-    subordinates = db.query(EmployeeModel).filter(EmployeeModel.ReportsTo == employee_id).all()
-    return subordinates
-
+    subordinates = fast_json.list_all(
+        db.query(EmployeeModel).filter(EmployeeModel.ReportsTo == employee_id), Employee, response, fieldset
+    )
+    return fieldsets.render(subordinates, Employee, fieldset, response)
 
+@router.get("/{employee_id}/reports", response_model=List[Employee], dependencies=[versions.conditional_get(EmployeeModel)])
+def read_employee_reports(
+    employee_id: int,
+    response: Response,
+    depth: str = Query(
+        "1",
+        pattern=r"^(all|[1-9][0-9]*)$",
+        description="Levels below the employee to return: a number (1 for direct reports) or `all`",
+    ),
+    fieldset: Optional[tuple] = fieldsets.select(Employee),
+    db: Session = Depends(get_db)
+):
+    _check_employee(db, employee_id)
+    
+    # Level by level, in EmployeeId order within a level
+    tree = _subtree(employee_id, None if depth == "all" else int(depth))
+    query = db.query(EmployeeModel).join(
+        tree, tree.c.EmployeeId == EmployeeModel.EmployeeId
+    ).order_by(tree.c.Depth, EmployeeModel.EmployeeId)
+    reports = fast_json.list_all(query, Employee, response, fieldset)
+    return fieldsets.render(reports, Employee, fieldset, response)
 
+@router.get("/{employee_id}/customers", response_model=List[Customer], dependencies=[versions.conditional_get(EmployeeModel, CustomerModel)])
+def read_employee_customers(
+    employee_id: int,
+    response: Response,
+    recursive: bool = Query(False, description="Also return the customers of everyone under the employee"),
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    fieldset: Optional[tuple] = fieldsets.select(Customer),
+    db: Session = Depends(get_db)
+):
+    _check_employee(db, employee_id)
+    
+    rep_ids = [employee_id]
+    if recursive:
+        tree = _subtree(employee_id)
+        rep_ids = select(literal(employee_id)).union_all(select(tree.c.EmployeeId))
+    query = db.query(CustomerModel).filter(CustomerModel.SupportRepId.in_(rep_ids))
+    customers = fast_json.paginate(query, Customer, response, [CustomerModel.CustomerId], skip, limit, cursor, fieldset)
+    return fieldsets.render(customers, Customer, fieldset, response)
 
+@router.get(
+    "/{employee_id}/portfolio",
+    response_model=List[PortfolioCustomer],
+    dependencies=[versions.conditional_get(
+        EmployeeModel, CustomerModel, InvoiceModel, InvoiceLineModel, TrackModel, GenreModel
+    )],
+)
+def read_employee_portfolio(
+    employee_id: int,
+    response: Response,
+    sort: PortfolioSort = Query(
+        PortfolioSort.spend, description="`spend` (highest lifetime spend first) or `customer` (CustomerId)"
+    ),
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    _check_employee(db, employee_id)
+    
+    # The agent's customers, their invoice aggregates and the genre each
+    # spent most on, all in one statement: both subqueries only read the
+    # invoices of these customers, through IFK_CustomerSupportRepId and
+    # IFK_InvoiceCustomerId
+    totals = select(
+        InvoiceModel.CustomerId,
+        func.count().label("InvoiceCount"),
+        func.round(func.sum(InvoiceModel.Total), 2).label("Spend"),
+        func.max(InvoiceModel.InvoiceDate).label("LastPurchase"),
+    ).join(
+        CustomerModel, CustomerModel.CustomerId == InvoiceModel.CustomerId
+    ).where(
+        CustomerModel.SupportRepId == employee_id
+    ).group_by(InvoiceModel.CustomerId).subquery()
+    
+    genre_spend = func.sum(InvoiceLineModel.UnitPrice * InvoiceLineModel.Quantity)
+    genres = select(
+        InvoiceModel.CustomerId,
+        TrackModel.GenreId,
+        func.row_number().over(
+            partition_by=InvoiceModel.CustomerId, order_by=(genre_spend.desc(), TrackModel.GenreId)
+        ).label("Rank"),
+    ).join(
+        CustomerModel, CustomerModel.CustomerId == InvoiceModel.CustomerId
+    ).join(
+        InvoiceLineModel, InvoiceLineModel.InvoiceId == InvoiceModel.InvoiceId
+    ).join(
+        TrackModel, TrackModel.TrackId == InvoiceLineModel.TrackId
+    ).where(
+        CustomerModel.SupportRepId == employee_id, TrackModel.GenreId.isnot(None)
+    ).group_by(InvoiceModel.CustomerId, TrackModel.GenreId).subquery()
+    
+    spend = func.coalesce(totals.c.Spend, 0).label("Spend")
+    query = db.query(
+        CustomerModel.CustomerId,
+        CustomerModel.FirstName,
+        CustomerModel.LastName,
+        CustomerModel.Company,
+        CustomerModel.Country,
+        CustomerModel.Email,
+        CustomerModel.Phone,
+        func.coalesce(totals.c.InvoiceCount, 0).label("InvoiceCount"),
+        spend,
+        totals.c.LastPurchase,
+        GenreModel.GenreId.label("TopGenreId"),
+        GenreModel.Name.label("TopGenre"),
+    ).outerjoin(
+        totals, totals.c.CustomerId == CustomerModel.CustomerId
+    ).outerjoin(
+        genres, and_(genres.c.CustomerId == CustomerModel.CustomerId, genres.c.Rank == 1)
+    ).outerjoin(
+        GenreModel, GenreModel.GenreId == genres.c.GenreId
+    ).filter(CustomerModel.SupportRepId == employee_id)
+    
+    if sort is PortfolioSort.spend:
+        order_by = [spend.desc(), CustomerModel.CustomerId.desc()]
+    else:
+        order_by = [CustomerModel.CustomerId]
+    rows = paginate(query, response, order_by, skip, limit, cursor)
+    return [PortfolioCustomer.model_validate(row._mapping) for row in rows]
@@ -0,0 +1,185 @@
+import csv
+import io
+import json
+from enum import Enum
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import DateTime, Float, select
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from starlette.background import BackgroundTask
+
+from app import versions
+from app.database import ExportSessionLocal
+from app.metrics import TimedRoute
+from app.models.models import (
+    Artist as ArtistModel, Album as AlbumModel, Track as TrackModel, Genre as GenreModel,
+    MediaType as MediaTypeModel, Playlist as PlaylistModel, PlaylistTrack as PlaylistTrackModel,
+    Customer as CustomerModel, Employee as EmployeeModel, Invoice as InvoiceModel,
+    InvoiceLine as InvoiceLineModel
+)
+
+router = APIRouter(
+    prefix="/export",
+    tags=["export"],
+    route_class=TimedRoute,
+    responses={404: {"description": "Not found"}},
+)
+
+# Rows fetched from SQLite and written to the response per chunk
+EXPORT_BATCH_SIZE = 1000
+
+class ExportTable(str, Enum):
+    artists = "artists"
+    albums = "albums"
+    tracks = "tracks"
+    genres = "genres"
+    media_types = "media-types"
+    playlists = "playlists"
+    playlist_tracks = "playlist-tracks"
+    customers = "customers"
+    employees = "employees"
+    invoices = "invoices"
+    invoice_lines = "invoice-lines"
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+EXPORT_MODELS = {
+    ExportTable.artists: ArtistModel,
+    ExportTable.albums: AlbumModel,
+    ExportTable.tracks: TrackModel,
+    ExportTable.genres: GenreModel,
+    ExportTable.media_types: MediaTypeModel,
+    ExportTable.playlists: PlaylistModel,
+    ExportTable.playlist_tracks: PlaylistTrackModel,
+    ExportTable.customers: CustomerModel,
+    ExportTable.employees: EmployeeModel,
+    ExportTable.invoices: InvoiceModel,
+    ExportTable.invoice_lines: InvoiceLineModel,
+}
+
+# Filter parameters accepted per table, named as on the list endpoints
+EXPORT_FILTERS = {
+    ExportTable.albums: {"artist_id": AlbumModel.ArtistId},
+    ExportTable.tracks: {
+        "album_id": TrackModel.AlbumId,
+        "genre_id": TrackModel.GenreId,
+        "media_type_id": TrackModel.MediaTypeId,
+    },
+    ExportTable.playlist_tracks: {"playlist_id": PlaylistTrackModel.PlaylistId},
+    ExportTable.customers: {"support_rep_id": CustomerModel.SupportRepId},
+    ExportTable.employees: {"reports_to": EmployeeModel.ReportsTo},
+    ExportTable.invoices: {"customer_id": InvoiceModel.CustomerId},
+    ExportTable.invoice_lines: {"invoice_id": InvoiceLineModel.InvoiceId},
+}
+
+def _converter(column):
+    # Match the API's JSON output: NUMERIC columns can hold integers in
+    # SQLite but are floats in the schemas, and datetimes are ISO 8601.
+    if isinstance(column.type, Float):
+        return lambda value: None if value is None else float(value)
+    if isinstance(column.type, DateTime):
+        return lambda value: None if value is None else value.isoformat()
+    return lambda value: value
+
+def _stream_rows(db, statement, columns, export_format: ExportFormat):
+    """Yield the export in chunks, reading rows with a streaming cursor.
+
+    `db` is a session of its own, closed at the end, because the response
+    body is produced after the request handler (and its dependencies) have
+    returned.
+    """
+    names = [column.key for column in columns]
+    converters = [_converter(column) for column in columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if export_format == ExportFormat.csv else None
+    if writer is not None:
+        writer.writerow(names)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    try:
+        result = db.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for rows in result.partitions():
+            for row in rows:
+                values = [convert(value) for convert, value in zip(converters, row)]
+                if writer is not None:
+                    writer.writerow(values)
+                else:
+                    buffer.write(json.dumps(dict(zip(names, values)), ensure_ascii=False))
+                    buffer.write("\n")
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    finally:
+        db.close()
+
+@router.get("/{table}")
+def export_table(
+    request: Request,
+    table: ExportTable,
+    format: ExportFormat = ExportFormat.ndjson,
+    artist_id: Optional[int] = None,
+    album_id: Optional[int] = None,
+    genre_id: Optional[int] = None,
+    media_type_id: Optional[int] = None,
+    playlist_id: Optional[int] = None,
+    support_rep_id: Optional[int] = None,
+    reports_to: Optional[int] = None,
+    customer_id: Optional[int] = None,
+    invoice_id: Optional[int] = None,
+):
+    model = EXPORT_MODELS[table]
+    columns = list(model.__table__.columns)
+    statement = select(*columns).order_by(*model.__table__.primary_key.columns)
+
+    requested = {
+        "artist_id": artist_id, "album_id": album_id, "genre_id": genre_id,
+        "media_type_id": media_type_id, "playlist_id": playlist_id,
+        "support_rep_id": support_rep_id, "reports_to": reports_to,
+        "customer_id": customer_id, "invoice_id": invoice_id,
+    }
+    filters = EXPORT_FILTERS.get(table, {})
+    for name, value in requested.items():
+        if value is None:
+            continue
+        if name not in filters:
+            raise HTTPException(status_code=400, detail=f"Filter '{name}' is not supported for {table.value}")
+        statement = statement.where(filters[name] == value)
+
+    # From the export pool, so slow downloads never hold the connections of
+    # other GETs; taken before the response starts, so a busy pool is a 503
+    # rather than a stream that breaks off
+    db = ExportSessionLocal()
+    try:
+        # Conditional GET: skip the export if the client's copy is still
+        # current. Read in the export's own transaction, so the ETag is that
+        # of the rows streamed.
+        etag = versions.current_etag(db, [model])
+        versions.check_not_modified(request, etag)
+    except PoolTimeoutError:
+        db.close()
+        raise HTTPException(
+            status_code=503, detail="Too many exports in progress", headers={"Retry-After": "5"}
+        )
+    except BaseException:
+        db.close()
+        raise
+
+    if format == ExportFormat.csv:
+        media_type = "text/csv; charset=utf-8"
+    else:
+        media_type = "application/x-ndjson"
+    return StreamingResponse(
+        _stream_rows(db, statement, columns, format),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{table.value}.{format.value}"',
+            "ETag": etag,
+        },
+        # Also closes the session if the stream never started
+        background=BackgroundTask(db.close),
+    )
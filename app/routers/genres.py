@@ -5,38 +5,61 @@
 
 
 
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 
+from app import cache, fast_json, fieldsets, rollups, versions
 from app.database import get_db
+from app.metrics import TimedRoute
+from app.pagination import paginate_items, parse_ids, pick_ids
 from app.models.models import Genre as GenreModel, Track as TrackModel
 from app.schemas.schemas import Genre, GenreCreate, Track
 
 router = APIRouter(
     prefix="/genres",
     tags=["genres"],
+    route_class=TimedRoute,
     responses={404: {"description": "Not found"}},
 )
 
-@router.get("/", response_model=List[Genre])
-def read_genres(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    genres = db.query(GenreModel).offset(skip).limit(limit).all()
-    return genres
-
-@router.get("/{genre_id}", response_model=Genre)
-def read_genre(genre_id: int, db: Session = Depends(get_db)):
-    db_genre = db.query(GenreModel).filter(GenreModel.GenreId == genre_id).first()
+@router.get("/", response_model=List[Genre], dependencies=[versions.conditional_get(GenreModel)])
+def read_genres(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    ids: Optional[list] = Depends(parse_ids),
+    fieldset: Optional[tuple] = fieldsets.select(Genre),
+    db: Session = Depends(get_db)
+):
+    genres_by_id = cache.all_genres(db)
+    if ids is not None:
+        genres = pick_ids(genres_by_id, response, ids)
+    else:
+        genres = paginate_items(list(genres_by_id.values()), response, ["GenreId"], skip, limit, cursor)
+    return fieldsets.render(genres, Genre, fieldset, response)
+
+@router.get("/{genre_id}", response_model=Genre, dependencies=[versions.conditional_get(GenreModel)])
+def read_genre(
+    genre_id: int,
+    response: Response,
+    fieldset: Optional[tuple] = fieldsets.select(Genre),
+    db: Session = Depends(get_db)
+):
+    db_genre = cache.all_genres(db).get(genre_id)
     if db_genre is None:
         raise HTTPException(status_code=404, detail="Genre not found")
-    return db_genre
+    return fieldsets.render(db_genre, Genre, fieldset, response)
 
 @router.post("/", response_model=Genre)
 def create_genre(genre: GenreCreate, db: Session = Depends(get_db)):
     db_genre = GenreModel(Name=genre.Name)
     db.add(db_genre)
+    versions.bump(db, GenreModel)
     db.commit()
     db.refresh(db_genre)
+    cache.genre_cache.invalidate()
     return db_genre
 
 @router.put("/{genre_id}", response_model=Genre)
@@ -46,8 +69,10 @@ def update_genre(genre_id: int, genre: GenreCreate, db: Session = Depends(get_db
         raise HTTPException(status_code=404, detail="Genre not found")
     
     db_genre.Name = genre.Name
+    versions.bump(db, GenreModel)
     db.commit()
     db.refresh(db_genre)
+    cache.genre_cache.invalidate()
     return db_genre
 
 @router.delete("/{genre_id}", response_model=Genre)
@@ -64,19 +89,32 @@ def delete_genre(genre_id: int, db: Session = Depends(get_db)):
             detail="Cannot delete genre with associated tracks. Update or delete tracks first."
         )
     
+    rollups.remove_genre(db, genre_id)
     db.delete(db_genre)
+    versions.bump(db, GenreModel)
     db.commit()
+    cache.genre_cache.invalidate()
     return db_genre
 
-@router.get("/{genre_id}/tracks", response_model=List[Track])
-def read_genre_tracks(genre_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@router.get("/{genre_id}/tracks", response_model=List[Track], dependencies=[versions.conditional_get(GenreModel, TrackModel)])
+def read_genre_tracks(
+    genre_id: int,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    fieldset: Optional[tuple] = fieldsets.select(Track),
+    db: Session = Depends(get_db)
+):
     # Check if genre exists
-    genre = db.query(GenreModel).filter(GenreModel.GenreId == genre_id).first()
-    if not genre:
+    if genre_id not in cache.all_genres(db):
         raise HTTPException(status_code=404, detail="Genre not found")
     
-    tracks = db.query(TrackModel).filter(TrackModel.GenreId == genre_id).offset(skip).limit(limit).all()
-    return tracks
+    tracks = fast_json.paginate(
+        db.query(TrackModel).filter(TrackModel.GenreId == genre_id), Track,
+        response, [TrackModel.TrackId], skip, limit, cursor, fieldset
+    )
+    return fieldsets.render(tracks, Track, fieldset, response)
 
 
 
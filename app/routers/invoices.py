@@ -1,31 +1,69 @@
 
 
 
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session, joinedload, selectinload
 
+from app import fast_json, fieldsets, group_commit, includes, rollups, versions
+from app.bulk import chunked, existing_ids, insert_rows
 from app.database import get_db
-from app.models.models import Invoice as InvoiceModel, Customer as CustomerModel, InvoiceLine as InvoiceLineModel
-from app.schemas.schemas import Invoice, InvoiceCreate, InvoiceWithLines, InvoiceLine, InvoiceLineCreate
+from app.metrics import TimedRoute
+from app.pagination import parse_ids
+from app.models.models import Invoice as InvoiceModel, Customer as CustomerModel, InvoiceLine as InvoiceLineModel, Track as TrackModel
+from app.schemas.schemas import Invoice, InvoiceCreate, InvoiceWithLines, InvoiceLine, InvoiceLineCreate, BulkItemResult, CheckoutCreate
 
 router = APIRouter(
     prefix="/invoices",
     tags=["invoices"],
+    route_class=TimedRoute,
     responses={404: {"description": "Not found"}},
 )
 
-@router.get("/", response_model=List[Invoice])
-def read_invoices(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    invoices = db.query(InvoiceModel).offset(skip).limit(limit).all()
-    return invoices
+def update_invoice_total(db: Session, invoice_id: int):
+    """Set Invoice.Total to the sum of its lines, computed by SQLite."""
+    line_total = select(
+        func.coalesce(func.sum(InvoiceLineModel.UnitPrice * InvoiceLineModel.Quantity), 0)
+    ).where(InvoiceLineModel.InvoiceId == invoice_id).scalar_subquery()
+    db.execute(
+        update(InvoiceModel).where(InvoiceModel.InvoiceId == invoice_id).values(Total=line_total)
+    )
 
-@router.get("/{invoice_id}", response_model=InvoiceWithLines)
-def read_invoice(invoice_id: int, db: Session = Depends(get_db)):
-    db_invoice = db.query(InvoiceModel).filter(InvoiceModel.InvoiceId == invoice_id).first()
+@router.get("/", response_model=List[Invoice], dependencies=[versions.conditional_get(InvoiceModel)])
+def read_invoices(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    ids: Optional[list] = Depends(parse_ids),
+    fieldset: Optional[tuple] = fieldsets.select(Invoice),
+    include: Optional[tuple] = includes.select(InvoiceModel),
+    db: Session = Depends(get_db)
+):
+    invoices = fast_json.paginate(
+        db.query(InvoiceModel), Invoice, response, [InvoiceModel.InvoiceId], skip, limit, cursor, fieldset, include, ids
+    )
+    return includes.render(invoices, Invoice, fieldset, include, response)
+
+@router.get("/{invoice_id}", response_model=InvoiceWithLines, dependencies=[versions.conditional_get(InvoiceModel, CustomerModel, InvoiceLineModel)])
+def read_invoice(
+    invoice_id: int,
+    response: Response,
+    fieldset: Optional[tuple] = fieldsets.select(InvoiceWithLines),
+    include: Optional[tuple] = includes.select(InvoiceModel),
+    db: Session = Depends(get_db)
+):
+    # InvoiceWithLines nests the customer and all lines: two queries in total
+    db_invoice = includes.project(db.query(InvoiceModel), fieldset, include, {
+        InvoiceModel.customer: joinedload,
+        InvoiceModel.invoice_lines: selectinload,
+    }).filter(InvoiceModel.InvoiceId == invoice_id).first()
     if db_invoice is None:
         raise HTTPException(status_code=404, detail="Invoice not found")
-    return db_invoice
+    return includes.render(db_invoice, InvoiceWithLines, fieldset, include, response)
 
 @router.post("/", response_model=Invoice)
 def create_invoice(invoice: InvoiceCreate, db: Session = Depends(get_db)):
@@ -36,10 +74,56 @@ def create_invoice(invoice: InvoiceCreate, db: Session = Depends(get_db)):
     
     db_invoice = InvoiceModel(**invoice.model_dump())
     db.add(db_invoice)
+    versions.bump(db, InvoiceModel)
     db.commit()
     db.refresh(db_invoice)
     return db_invoice
 
+@router.post("/checkout", response_model=InvoiceWithLines)
+def checkout(order: CheckoutCreate, db: Session = Depends(get_db)):
+    # Validate customer
+    customer = db.query(CustomerModel).filter(CustomerModel.CustomerId == order.CustomerId).first()
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    
+    if not order.TrackIds:
+        raise HTTPException(status_code=400, detail="Checkout requires at least one track")
+    
+    # Snapshot the current price of every ordered track
+    prices = {}
+    for chunk in chunked(set(order.TrackIds)):
+        prices.update(db.query(TrackModel.TrackId, TrackModel.UnitPrice).filter(TrackModel.TrackId.in_(chunk)))
+    missing = sorted(set(order.TrackIds) - prices.keys())
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Tracks not found: {', '.join(map(str, missing))}")
+    
+    db_invoice = InvoiceModel(
+        **order.model_dump(exclude={"InvoiceDate", "TrackIds"}),
+        InvoiceDate=order.InvoiceDate or datetime.now(),
+        Total=0
+    )
+    db.add(db_invoice)
+    db.flush()
+    
+    # One line per distinct track; repeated tracks add to its quantity
+    quantities = Counter(order.TrackIds)
+    insert_rows(db, InvoiceLineModel, InvoiceLineModel.InvoiceLineId, [
+        {"InvoiceId": db_invoice.InvoiceId, "TrackId": track_id, "UnitPrice": prices[track_id], "Quantity": quantity}
+        for track_id, quantity in quantities.items()
+    ])
+    update_invoice_total(db, db_invoice.InvoiceId)
+    rollups.apply_lines(db, [
+        (track_id, db_invoice.InvoiceDate, prices[track_id], quantity)
+        for track_id, quantity in quantities.items()
+    ])
+    versions.bump(db, InvoiceModel, InvoiceLineModel)
+    db.commit()
+    
+    return db.query(InvoiceModel).options(
+        joinedload(InvoiceModel.customer),
+        selectinload(InvoiceModel.invoice_lines)
+    ).filter(InvoiceModel.InvoiceId == db_invoice.InvoiceId).first()
+
 @router.put("/{invoice_id}", response_model=Invoice)
 def update_invoice(invoice_id: int, invoice: InvoiceCreate, db: Session = Depends(get_db)):
     db_invoice = db.query(InvoiceModel).filter(InvoiceModel.InvoiceId == invoice_id).first()
@@ -51,10 +135,19 @@ def update_invoice(invoice_id: int, invoice: InvoiceCreate, db: Session = Depend
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
+    # Moving the invoice to another day moves its sales in the daily rollup
+    date_changed = db_invoice.InvoiceDate != invoice.InvoiceDate
+    if date_changed:
+        rollups.apply_invoice(db, invoice_id, -1)
+    
     # Update invoice attributes
     for key, value in invoice.model_dump().items():
         setattr(db_invoice, key, value)
     
+    if date_changed:
+        db.flush()
+        rollups.apply_invoice(db, invoice_id)
+    versions.bump(db, InvoiceModel)
     db.commit()
     db.refresh(db_invoice)
     return db_invoice
@@ -65,23 +158,40 @@ def delete_invoice(invoice_id: int, db: Session = Depends(get_db)):
     if db_invoice is None:
         raise HTTPException(status_code=404, detail="Invoice not found")
     
+    # Delete the invoice lines with it, taking their sales out of the rollups
+    rollups.apply_invoice(db, invoice_id, -1)
+    db.query(InvoiceLineModel).filter(InvoiceLineModel.InvoiceId == invoice_id).delete()
     db.delete(db_invoice)
+    versions.bump(db, InvoiceModel, InvoiceLineModel)
     db.commit()
     return db_invoice
 
 # Invoice Lines endpoints
-@router.get("/{invoice_id}/lines", response_model=List[InvoiceLine])
-def read_invoice_lines(invoice_id: int, db: Session = Depends(get_db)):
+@router.get("/{invoice_id}/lines", response_model=List[InvoiceLine], dependencies=[versions.conditional_get(InvoiceModel, InvoiceLineModel)])
+def read_invoice_lines(
+    invoice_id: int,
+    response: Response,
+    fieldset: Optional[tuple] = fieldsets.select(InvoiceLine),
+    db: Session = Depends(get_db)
+):
     # Check if invoice exists
     invoice = db.query(InvoiceModel).filter(InvoiceModel.InvoiceId == invoice_id).first()
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
     
-    lines = db.query(InvoiceLineModel).filter(InvoiceLineModel.InvoiceId == invoice_id).all()
-    return lines
+    lines = fast_json.list_all(
+        db.query(InvoiceLineModel).filter(InvoiceLineModel.InvoiceId == invoice_id), InvoiceLine, response, fieldset
+    )
+    return fieldsets.render(lines, InvoiceLine, fieldset, response)
 
-@router.post("/{invoice_id}/lines", response_model=InvoiceLine)
-def create_invoice_line(invoice_id: int, line: InvoiceLineCreate, db: Session = Depends(get_db)):
+def _update_invoice_totals(db: Session, *invoice_ids: int):
+    for invoice_id in sorted(set(invoice_ids)):
+        update_invoice_total(db, invoice_id)
+
+def _add_to_rollups(db: Session, *lines):
+    rollups.apply_lines(db, lines)
+
+def _create_line(db: Session, invoice_id: int, line: InvoiceLineCreate) -> InvoiceLine:
     # Check if invoice exists
     invoice = db.query(InvoiceModel).filter(InvoiceModel.InvoiceId == invoice_id).first()
     if not invoice:
@@ -93,25 +203,121 @@ def create_invoice_line(invoice_id: int, line: InvoiceLineCreate, db: Session =
     
     db_line = InvoiceLineModel(**line.model_dump())
     db.add(db_line)
+    db.flush()
+    
+    # Update invoice total and sales rollups in the same transaction
+    group_commit.defer(db, _update_invoice_totals, invoice_id)
+    group_commit.defer(db, _add_to_rollups, (line.TrackId, invoice.InvoiceDate, line.UnitPrice, line.Quantity))
+    group_commit.defer(db, versions.bump, InvoiceLineModel, InvoiceModel)
+    
+    return InvoiceLine.model_validate(db_line)
+
+@router.post("/{invoice_id}/lines", response_model=InvoiceLine)
+@group_commit.batched
+def create_invoice_line(invoice_id: int, line: InvoiceLineCreate, db: Session = Depends(get_db)):
+    return group_commit.run(db, lambda session: _create_line(session, invoice_id, line))
+
+@router.put("/{invoice_id}/lines/{line_id}", response_model=InvoiceLine)
+def update_invoice_line(invoice_id: int, line_id: int, line: InvoiceLineCreate, db: Session = Depends(get_db)):
+    db_line = db.query(InvoiceLineModel).filter(
+        InvoiceLineModel.InvoiceLineId == line_id,
+        InvoiceLineModel.InvoiceId == invoice_id
+    ).first()
+    if db_line is None:
+        raise HTTPException(status_code=404, detail="Invoice line not found")
+    
+    # Ensure the invoice ID in the path matches the one in the request body
+    if line.InvoiceId != invoice_id:
+        raise HTTPException(status_code=400, detail="Invoice ID in path does not match Invoice ID in request body")
+    
+    # Check if track exists
+    track = db.query(TrackModel).filter(TrackModel.TrackId == line.TrackId).first()
+    if not track:
+        raise HTTPException(status_code=404, detail="Track not found")
+    
+    # Swap the old line values for the new ones in the rollups
+    invoice_date = db_line.invoice.InvoiceDate
+    rollups.apply_lines(db, [(db_line.TrackId, invoice_date, db_line.UnitPrice, db_line.Quantity)], -1)
+    for key, value in line.model_dump().items():
+        setattr(db_line, key, value)
+    db.flush()
+    rollups.apply_lines(db, [(line.TrackId, invoice_date, line.UnitPrice, line.Quantity)])
+    
+    update_invoice_total(db, invoice_id)
+    versions.bump(db, InvoiceLineModel, InvoiceModel)
     db.commit()
     db.refresh(db_line)
+    return db_line
+
+@router.delete("/{invoice_id}/lines/{line_id}", response_model=InvoiceLine)
+def delete_invoice_line(invoice_id: int, line_id: int, db: Session = Depends(get_db)):
+    db_line = db.query(InvoiceLineModel).filter(
+        InvoiceLineModel.InvoiceLineId == line_id,
+        InvoiceLineModel.InvoiceId == invoice_id
+    ).first()
+    if db_line is None:
+        raise HTTPException(status_code=404, detail="Invoice line not found")
     
-    # Update invoice total
-    invoice_lines = db.query(InvoiceLineModel).filter(InvoiceLineModel.InvoiceId == invoice_id).all()
-    total = sum(line.UnitPrice * line.Quantity for line in invoice_lines)
-    invoice.Total = total
+    rollups.apply_lines(db, [(db_line.TrackId, db_line.invoice.InvoiceDate, db_line.UnitPrice, db_line.Quantity)], -1)
+    db.delete(db_line)
+    db.flush()
+    update_invoice_total(db, invoice_id)
+    versions.bump(db, InvoiceLineModel, InvoiceModel)
     db.commit()
-    
     return db_line
 
-@router.get("/customer/{customer_id}", response_model=List[Invoice])
-def read_customer_invoices(customer_id: int, db: Session = Depends(get_db)):
+@router.post("/{invoice_id}/lines/bulk", response_model=List[BulkItemResult])
+def create_invoice_lines_bulk(invoice_id: int, lines: List[InvoiceLineCreate], db: Session = Depends(get_db)):
+    # Check if invoice exists
+    invoice = db.query(InvoiceModel).filter(InvoiceModel.InvoiceId == invoice_id).first()
+    if not invoice:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    
+    # Validate every track of the batch with one query
+    track_ids = existing_ids(db, TrackModel.TrackId, {line.TrackId for line in lines})
+    
+    results = []
+    rows = []
+    for index, line in enumerate(lines):
+        error = None
+        if line.InvoiceId != invoice_id:
+            error = "Invoice ID in path does not match Invoice ID in request body"
+        elif line.TrackId not in track_ids:
+            error = "Track not found"
+        
+        result = BulkItemResult(index=index, success=error is None, error=error)
+        results.append(result)
+        if error is None:
+            rows.append((result, line.model_dump()))
+    
+    # Insert all valid lines in one executemany, then recompute the total in SQL
+    ids = insert_rows(db, InvoiceLineModel, InvoiceLineModel.InvoiceLineId, [row for _, row in rows])
+    update_invoice_total(db, invoice_id)
+    rollups.apply_lines(db, [
+        (row["TrackId"], invoice.InvoiceDate, row["UnitPrice"], row["Quantity"]) for _, row in rows
+    ])
+    versions.bump(db, InvoiceLineModel, InvoiceModel)
+    db.commit()
+    for (result, _), line_id in zip(rows, ids):
+        result.id = line_id
+    
+    return results
+
+@router.get("/customer/{customer_id}", response_model=List[Invoice], dependencies=[versions.conditional_get(CustomerModel, InvoiceModel)])
+def read_customer_invoices(
+    customer_id: int,
+    response: Response,
+    fieldset: Optional[tuple] = fieldsets.select(Invoice),
+    db: Session = Depends(get_db)
+):
     # Check if customer exists
     customer = db.query(CustomerModel).filter(CustomerModel.CustomerId == customer_id).first()
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
-    invoices = db.query(InvoiceModel).filter(InvoiceModel.CustomerId == customer_id).all()
-    return invoices
+    invoices = fast_json.list_all(
+        db.query(InvoiceModel).filter(InvoiceModel.CustomerId == customer_id), Invoice, response, fieldset
+    )
+    return fieldsets.render(invoices, Invoice, fieldset, response)
 
 
@@ -7,38 +7,61 @@
 
 
 
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 
+from app import cache, fast_json, fieldsets, versions
 from app.database import get_db
+from app.metrics import TimedRoute
+from app.pagination import paginate_items, parse_ids, pick_ids
 from app.models.models import MediaType as MediaTypeModel, Track as TrackModel
 from app.schemas.schemas import MediaType, MediaTypeCreate, Track
 
 router = APIRouter(
     prefix="/media-types",
     tags=["media-types"],
+    route_class=TimedRoute,
     responses={404: {"description": "Not found"}},
 )
 
-@router.get("/", response_model=List[MediaType])
-def read_media_types(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    media_types = db.query(MediaTypeModel).offset(skip).limit(limit).all()
-    return media_types
-
-@router.get("/{media_type_id}", response_model=MediaType)
-def read_media_type(media_type_id: int, db: Session = Depends(get_db)):
-    db_media_type = db.query(MediaTypeModel).filter(MediaTypeModel.MediaTypeId == media_type_id).first()
+@router.get("/", response_model=List[MediaType], dependencies=[versions.conditional_get(MediaTypeModel)])
+def read_media_types(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    ids: Optional[list] = Depends(parse_ids),
+    fieldset: Optional[tuple] = fieldsets.select(MediaType),
+    db: Session = Depends(get_db)
+):
+    media_types_by_id = cache.all_media_types(db)
+    if ids is not None:
+        media_types = pick_ids(media_types_by_id, response, ids)
+    else:
+        media_types = paginate_items(list(media_types_by_id.values()), response, ["MediaTypeId"], skip, limit, cursor)
+    return fieldsets.render(media_types, MediaType, fieldset, response)
+
+@router.get("/{media_type_id}", response_model=MediaType, dependencies=[versions.conditional_get(MediaTypeModel)])
+def read_media_type(
+    media_type_id: int,
+    response: Response,
+    fieldset: Optional[tuple] = fieldsets.select(MediaType),
+    db: Session = Depends(get_db)
+):
+    db_media_type = cache.all_media_types(db).get(media_type_id)
     if db_media_type is None:
         raise HTTPException(status_code=404, detail="MediaType not found")
-    return db_media_type
+    return fieldsets.render(db_media_type, MediaType, fieldset, response)
 
 @router.post("/", response_model=MediaType)
 def create_media_type(media_type: MediaTypeCreate, db: Session = Depends(get_db)):
     db_media_type = MediaTypeModel(Name=media_type.Name)
     db.add(db_media_type)
+    versions.bump(db, MediaTypeModel)
     db.commit()
     db.refresh(db_media_type)
+    cache.media_type_cache.invalidate()
     return db_media_type
 
 @router.put("/{media_type_id}", response_model=MediaType)
@@ -48,8 +71,10 @@ def update_media_type(media_type_id: int, media_type: MediaTypeCreate, db: Sessi
         raise HTTPException(status_code=404, detail="MediaType not found")
     
     db_media_type.Name = media_type.Name
+    versions.bump(db, MediaTypeModel)
     db.commit()
     db.refresh(db_media_type)
+    cache.media_type_cache.invalidate()
     return db_media_type
 
 @router.delete("/{media_type_id}", response_model=MediaType)
@@ -67,18 +92,30 @@ def delete_media_type(media_type_id: int, db: Session = Depends(get_db)):
         )
     
     db.delete(db_media_type)
+    versions.bump(db, MediaTypeModel)
     db.commit()
+    cache.media_type_cache.invalidate()
     return db_media_type
 
-@router.get("/{media_type_id}/tracks", response_model=List[Track])
-def read_media_type_tracks(media_type_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@router.get("/{media_type_id}/tracks", response_model=List[Track], dependencies=[versions.conditional_get(MediaTypeModel, TrackModel)])
+def read_media_type_tracks(
+    media_type_id: int,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    fieldset: Optional[tuple] = fieldsets.select(Track),
+    db: Session = Depends(get_db)
+):
     # Check if media type exists
-    media_type = db.query(MediaTypeModel).filter(MediaTypeModel.MediaTypeId == media_type_id).first()
-    if not media_type:
+    if media_type_id not in cache.all_media_types(db):
         raise HTTPException(status_code=404, detail="MediaType not found")
     
-    tracks = db.query(TrackModel).filter(TrackModel.MediaTypeId == media_type_id).offset(skip).limit(limit).all()
-    return tracks
+    tracks = fast_json.paginate(
+        db.query(TrackModel).filter(TrackModel.MediaTypeId == media_type_id), Track,
+        response, [TrackModel.TrackId], skip, limit, cursor, fieldset
+    )
+    return fieldsets.render(tracks, Track, fieldset, response)
 
 
 
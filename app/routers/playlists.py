@@ -2,36 +2,76 @@
 
 
 
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-
+from enum import Enum
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import func, insert, literal_column
+from sqlalchemy.orm import Session, with_expression
+
+from app import fast_json, fieldsets, group_commit, includes, versions
+from app.bulk import chunked, existing_ids
 from app.database import get_db
+from app.metrics import TimedRoute
+from app.pagination import TOTAL_COUNT_HEADER, parse_ids
 from app.models.models import Playlist as PlaylistModel, Track as TrackModel, PlaylistTrack as PlaylistTrackModel
-from app.schemas.schemas import Playlist, PlaylistCreate, PlaylistWithTracks, Track, PlaylistTrackCreate
+from app.schemas.schemas import Playlist, PlaylistCreate, PlaylistWithTracks, Track, PlaylistTrackCreate, PlaylistTracksBulkCreate, BulkItemResult
 
 router = APIRouter(
     prefix="/playlists",
     tags=["playlists"],
+    route_class=TimedRoute,
     responses={404: {"description": "Not found"}},
 )
 
-@router.get("/", response_model=List[Playlist])
-def read_playlists(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    playlists = db.query(PlaylistModel).offset(skip).limit(limit).all()
-    return playlists
-
-@router.get("/{playlist_id}", response_model=Playlist)
-def read_playlist(playlist_id: int, db: Session = Depends(get_db)):
-    db_playlist = db.query(PlaylistModel).filter(PlaylistModel.PlaylistId == playlist_id).first()
+class PlaylistTrackSort(str, Enum):
+    position = "position"
+    name = "name"
+    duration = "duration"
+
+# A track's position is the order it was added in: the PlaylistTrack rowid
+POSITION = literal_column('"PlaylistTrack".rowid').label("Position")
+
+# Keyset columns per sort order, ending with a unique key
+PLAYLIST_TRACK_ORDER = {
+    PlaylistTrackSort.position: [POSITION],
+    PlaylistTrackSort.name: [TrackModel.Name, TrackModel.TrackId],
+    PlaylistTrackSort.duration: [TrackModel.Milliseconds, TrackModel.TrackId],
+}
+
+@router.get("/", response_model=List[Playlist], dependencies=[versions.conditional_get(PlaylistModel)])
+def read_playlists(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    ids: Optional[list] = Depends(parse_ids),
+    fieldset: Optional[tuple] = fieldsets.select(Playlist),
+    include: Optional[tuple] = includes.select(PlaylistModel),
+    db: Session = Depends(get_db)
+):
+    playlists = fast_json.paginate(
+        db.query(PlaylistModel), Playlist, response, [PlaylistModel.PlaylistId], skip, limit, cursor, fieldset, include, ids
+    )
+    return includes.render(playlists, Playlist, fieldset, include, response)
+
+@router.get("/{playlist_id}", response_model=Playlist, dependencies=[versions.conditional_get(PlaylistModel)])
+def read_playlist(
+    playlist_id: int,
+    response: Response,
+    fieldset: Optional[tuple] = fieldsets.select(Playlist),
+    include: Optional[tuple] = includes.select(PlaylistModel),
+    db: Session = Depends(get_db)
+):
+    db_playlist = includes.project(db.query(PlaylistModel), fieldset, include).filter(PlaylistModel.PlaylistId == playlist_id).first()
     if db_playlist is None:
         raise HTTPException(status_code=404, detail="Playlist not found")
-    return db_playlist
+    return includes.render(db_playlist, Playlist, fieldset, include, response)
 
 @router.post("/", response_model=Playlist)
 def create_playlist(playlist: PlaylistCreate, db: Session = Depends(get_db)):
     db_playlist = PlaylistModel(Name=playlist.Name)
     db.add(db_playlist)
+    versions.bump(db, PlaylistModel)
     db.commit()
     db.refresh(db_playlist)
     return db_playlist
@@ -43,6 +83,7 @@ def update_playlist(playlist_id: int, playlist: PlaylistCreate, db: Session = De
         raise HTTPException(status_code=404, detail="Playlist not found")
     
     db_playlist.Name = playlist.Name
+    versions.bump(db, PlaylistModel)
     db.commit()
     db.refresh(db_playlist)
     return db_playlist
@@ -54,28 +95,43 @@ def delete_playlist(playlist_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Playlist not found")
     
     db.delete(db_playlist)
+    versions.bump(db, PlaylistModel, PlaylistTrackModel)
     db.commit()
     return db_playlist
 
-@router.get("/{playlist_id}/tracks", response_model=List[Track])
-def read_playlist_tracks(playlist_id: int, db: Session = Depends(get_db)):
-    # Check if playlist exists
-    playlist = db.query(PlaylistModel).filter(PlaylistModel.PlaylistId == playlist_id).first()
-    if not playlist:
+@router.get("/{playlist_id}/tracks", response_model=List[Track], dependencies=[versions.conditional_get(PlaylistModel, PlaylistTrackModel, TrackModel)])
+def read_playlist_tracks(
+    playlist_id: int,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    sort: PlaylistTrackSort = PlaylistTrackSort.position,
+    fieldset: Optional[tuple] = fieldsets.select(Track),
+    db: Session = Depends(get_db)
+):
+    # Counted from the primary key index alone; the playlist itself is only
+    # looked up when the count leaves it in doubt
+    total = db.query(func.count()).select_from(PlaylistTrackModel).filter(
+        PlaylistTrackModel.PlaylistId == playlist_id
+    ).scalar()
+    if not total and db.query(PlaylistModel.PlaylistId).filter(PlaylistModel.PlaylistId == playlist_id).first() is None:
         raise HTTPException(status_code=404, detail="Playlist not found")
+    response.headers[TOTAL_COUNT_HEADER] = str(total)
     
-    # Get all tracks in the playlist
-    tracks = db.query(TrackModel).join(
+    query = db.query(TrackModel).join(
         PlaylistTrackModel, 
         PlaylistTrackModel.TrackId == TrackModel.TrackId
     ).filter(
         PlaylistTrackModel.PlaylistId == playlist_id
-    ).all()
+    )
+    if sort is PlaylistTrackSort.position:
+        query = query.options(with_expression(TrackModel.Position, POSITION))
     
-    return tracks
+    tracks = fast_json.paginate(query, Track, response, PLAYLIST_TRACK_ORDER[sort], skip, limit, cursor, fieldset)
+    return fieldsets.render(tracks, Track, fieldset, response)
 
-@router.post("/{playlist_id}/tracks", response_model=dict)
-def add_track_to_playlist(playlist_id: int, track_id: int, db: Session = Depends(get_db)):
+def _add_track(db: Session, playlist_id: int, track_id: int) -> dict:
     # Check if playlist exists
     playlist = db.query(PlaylistModel).filter(PlaylistModel.PlaylistId == playlist_id).first()
     if not playlist:
@@ -98,12 +154,54 @@ def add_track_to_playlist(playlist_id: int, track_id: int, db: Session = Depends
     # Add track to playlist
     playlist_track = PlaylistTrackModel(PlaylistId=playlist_id, TrackId=track_id)
     db.add(playlist_track)
-    db.commit()
+    group_commit.defer(db, versions.bump, PlaylistTrackModel)
     
     return {"message": "Track added to playlist successfully"}
 
-@router.delete("/{playlist_id}/tracks/{track_id}", response_model=dict)
-def remove_track_from_playlist(playlist_id: int, track_id: int, db: Session = Depends(get_db)):
+@router.post("/{playlist_id}/tracks", response_model=dict)
+@group_commit.batched
+def add_track_to_playlist(playlist_id: int, track_id: int, db: Session = Depends(get_db)):
+    return group_commit.run(db, lambda session: _add_track(session, playlist_id, track_id))
+
+@router.post("/{playlist_id}/tracks/bulk", response_model=List[BulkItemResult])
+def add_tracks_to_playlist_bulk(playlist_id: int, tracks: PlaylistTracksBulkCreate, db: Session = Depends(get_db)):
+    # Check if playlist exists
+    playlist = db.query(PlaylistModel).filter(PlaylistModel.PlaylistId == playlist_id).first()
+    if not playlist:
+        raise HTTPException(status_code=404, detail="Playlist not found")
+    
+    # Validate the whole batch with one query per table
+    track_ids = existing_ids(db, TrackModel.TrackId, tracks.TrackIds)
+    in_playlist = set()
+    for chunk in chunked(set(tracks.TrackIds)):
+        in_playlist.update(track_id for (track_id,) in db.query(PlaylistTrackModel.TrackId).filter(
+            PlaylistTrackModel.PlaylistId == playlist_id,
+            PlaylistTrackModel.TrackId.in_(chunk)
+        ))
+    
+    results = []
+    rows = []
+    for index, track_id in enumerate(tracks.TrackIds):
+        error = None
+        if track_id not in track_ids:
+            error = "Track not found"
+        elif track_id in in_playlist:
+            error = "Track already in playlist"
+        
+        results.append(BulkItemResult(index=index, success=error is None, id=track_id, error=error))
+        if error is None:
+            in_playlist.add(track_id)
+            rows.append({"PlaylistId": playlist_id, "TrackId": track_id})
+    
+    # Add all valid tracks in one executemany and one commit
+    if rows:
+        db.execute(insert(PlaylistTrackModel), rows)
+    versions.bump(db, PlaylistTrackModel)
+    db.commit()
+    
+    return results
+
+def _remove_track(db: Session, playlist_id: int, track_id: int) -> dict:
     # Check if playlist exists
     playlist = db.query(PlaylistModel).filter(PlaylistModel.PlaylistId == playlist_id).first()
     if not playlist:
@@ -125,9 +223,14 @@ def remove_track_from_playlist(playlist_id: int, track_id: int, db: Session = De
     
     # Remove track from playlist
     db.delete(playlist_track)
-    db.commit()
+    group_commit.defer(db, versions.bump, PlaylistTrackModel)
     
     return {"message": "Track removed from playlist successfully"}
 
+@router.delete("/{playlist_id}/tracks/{track_id}", response_model=dict)
+@group_commit.batched
+def remove_track_from_playlist(playlist_id: int, track_id: int, db: Session = Depends(get_db)):
+    return group_commit.run(db, lambda session: _remove_track(session, playlist_id, track_id))
+
 
 
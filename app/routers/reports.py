@@ -0,0 +1,98 @@
+from datetime import date
+from enum import Enum
+from typing import List, Optional
+from fastapi import APIRouter, Depends
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app import versions
+from app.database import get_db
+from app.metrics import TimedRoute
+from app.models.models import (
+    Album as AlbumModel, Artist as ArtistModel, Genre as GenreModel, Track as TrackModel,
+    SalesByTrack, SalesByAlbum, SalesByArtist, SalesByGenre, SalesByDay
+)
+from app.schemas.schemas import TrackSales, AlbumSales, ArtistSales, GenreSales, RevenueByPeriod
+
+# Every report reads from the sales rollups maintained by app.rollups, never
+# from InvoiceLine, so its cost doesn't grow with the sales history.
+router = APIRouter(
+    prefix="/reports",
+    tags=["reports"],
+    route_class=TimedRoute,
+    responses={404: {"description": "Not found"}},
+)
+
+class Granularity(str, Enum):
+    day = "day"
+    month = "month"
+    year = "year"
+
+PERIOD_FORMATS = {
+    Granularity.day: "%Y-%m-%d",
+    Granularity.month: "%Y-%m",
+    Granularity.year: "%Y",
+}
+
+def _round(revenue: float) -> float:
+    # Incremental updates accumulate float error; report whole cents
+    return round(revenue, 2)
+
+@router.get("/sales/genres", response_model=List[GenreSales], dependencies=[versions.conditional_get(SalesByGenre, GenreModel)])
+def read_sales_by_genre(limit: int = 100, db: Session = Depends(get_db)):
+    rows = db.query(SalesByGenre, GenreModel.Name).outerjoin(
+        GenreModel, GenreModel.GenreId == SalesByGenre.GenreId
+    ).order_by(SalesByGenre.Revenue.desc()).limit(limit).all()
+    return [
+        GenreSales(GenreId=sales.GenreId, Name=name, Revenue=_round(sales.Revenue), Units=sales.Units)
+        for sales, name in rows
+    ]
+
+@router.get("/sales/artists", response_model=List[ArtistSales], dependencies=[versions.conditional_get(SalesByArtist, ArtistModel)])
+def read_top_artists(limit: int = 10, db: Session = Depends(get_db)):
+    rows = db.query(SalesByArtist, ArtistModel.Name).outerjoin(
+        ArtistModel, ArtistModel.ArtistId == SalesByArtist.ArtistId
+    ).order_by(SalesByArtist.Revenue.desc()).limit(limit).all()
+    return [
+        ArtistSales(ArtistId=sales.ArtistId, Name=name, Revenue=_round(sales.Revenue), Units=sales.Units)
+        for sales, name in rows
+    ]
+
+@router.get("/sales/albums", response_model=List[AlbumSales], dependencies=[versions.conditional_get(SalesByAlbum, AlbumModel)])
+def read_top_albums(limit: int = 10, db: Session = Depends(get_db)):
+    rows = db.query(SalesByAlbum, AlbumModel.Title).outerjoin(
+        AlbumModel, AlbumModel.AlbumId == SalesByAlbum.AlbumId
+    ).order_by(SalesByAlbum.Revenue.desc()).limit(limit).all()
+    return [
+        AlbumSales(AlbumId=sales.AlbumId, Title=title, Revenue=_round(sales.Revenue), Units=sales.Units)
+        for sales, title in rows
+    ]
+
+@router.get("/sales/tracks", response_model=List[TrackSales], dependencies=[versions.conditional_get(SalesByTrack, TrackModel)])
+def read_top_tracks(limit: int = 10, db: Session = Depends(get_db)):
+    rows = db.query(SalesByTrack, TrackModel.Name).outerjoin(
+        TrackModel, TrackModel.TrackId == SalesByTrack.TrackId
+    ).order_by(SalesByTrack.Revenue.desc()).limit(limit).all()
+    return [
+        TrackSales(TrackId=sales.TrackId, Name=name, Revenue=_round(sales.Revenue), Units=sales.Units)
+        for sales, name in rows
+    ]
+
+@router.get("/revenue", response_model=List[RevenueByPeriod], dependencies=[versions.conditional_get(SalesByDay)])
+def read_revenue(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    granularity: Granularity = Granularity.month,
+    db: Session = Depends(get_db)
+):
+    period = func.strftime(PERIOD_FORMATS[granularity], SalesByDay.Day).label("Period")
+    query = db.query(period, func.sum(SalesByDay.Revenue), func.sum(SalesByDay.Units))
+    if start:
+        query = query.filter(SalesByDay.Day >= start)
+    if end:
+        query = query.filter(SalesByDay.Day <= end)
+    rows = query.group_by(period).order_by(period).all()
+    return [
+        RevenueByPeriod(Period=name, Revenue=_round(revenue), Units=units)
+        for name, revenue, units in rows
+    ]
@@ -1,26 +1,39 @@
 
 
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.orm import Session, joinedload
 
+from app import autocomplete, cache, fast_json, fieldsets, includes, rollups, search, versions
+from app.bulk import existing_ids, insert_rows
 from app.database import get_db
-from app.models.models import Track as TrackModel, Album as AlbumModel, Genre as GenreModel, MediaType as MediaTypeModel
-from app.schemas.schemas import Track, TrackCreate, TrackDetail
+from app.metrics import TimedRoute
+from app.pagination import parse_ids
+from app.models.models import (
+    Track as TrackModel, Album as AlbumModel, Artist as ArtistModel, Genre as GenreModel,
+    MediaType as MediaTypeModel, InvoiceLine as InvoiceLineModel, PlaylistTrack as PlaylistTrackModel
+)
+from app.schemas.schemas import BulkItemResult, Track, TrackCreate, TrackDetail
 
 router = APIRouter(
     prefix="/tracks",
     tags=["tracks"],
+    route_class=TimedRoute,
     responses={404: {"description": "Not found"}},
 )
 
-@router.get("/", response_model=List[Track])
+@router.get("/", response_model=List[Track], dependencies=[versions.conditional_get(TrackModel)])
 def read_tracks(
+    response: Response,
     skip: int = 0, 
     limit: int = 100, 
+    cursor: Optional[str] = None,
+    ids: Optional[list] = Depends(parse_ids),
     album_id: Optional[int] = None,
     genre_id: Optional[int] = None,
     media_type_id: Optional[int] = None,
+    fieldset: Optional[tuple] = fieldsets.select(Track),
+    include: Optional[tuple] = includes.select(TrackModel),
     db: Session = Depends(get_db)
 ):
     query = db.query(TrackModel)
@@ -32,15 +45,26 @@ def read_tracks(
     if media_type_id:
         query = query.filter(TrackModel.MediaTypeId == media_type_id)
     
-    tracks = query.offset(skip).limit(limit).all()
-    return tracks
+    tracks = fast_json.paginate(query, Track, response, [TrackModel.TrackId], skip, limit, cursor, fieldset, include, ids)
+    return includes.render(tracks, Track, fieldset, include, response)
 
-@router.get("/{track_id}", response_model=TrackDetail)
-def read_track(track_id: int, db: Session = Depends(get_db)):
-    db_track = db.query(TrackModel).filter(TrackModel.TrackId == track_id).first()
+@router.get("/{track_id}", response_model=TrackDetail, dependencies=[versions.conditional_get(TrackModel, AlbumModel, GenreModel, MediaTypeModel)])
+def read_track(
+    track_id: int,
+    response: Response,
+    fieldset: Optional[tuple] = fieldsets.select(TrackDetail),
+    include: Optional[tuple] = includes.select(TrackModel),
+    db: Session = Depends(get_db)
+):
+    # TrackDetail nests album, genre and media_type: load them in the same query
+    db_track = includes.project(db.query(TrackModel), fieldset, include, {
+        TrackModel.album: joinedload,
+        TrackModel.genre: joinedload,
+        TrackModel.media_type: joinedload,
+    }).filter(TrackModel.TrackId == track_id).first()
     if db_track is None:
         raise HTTPException(status_code=404, detail="Track not found")
-    return db_track
+    return includes.render(db_track, TrackDetail, fieldset, include, response)
 
 @router.post("/", response_model=Track)
 def create_track(track: TrackCreate, db: Session = Depends(get_db)):
@@ -51,12 +75,10 @@ def create_track(track: TrackCreate, db: Session = Depends(get_db)):
             raise HTTPException(status_code=404, detail="Album not found")
     
     if track.GenreId:
-        genre = db.query(GenreModel).filter(GenreModel.GenreId == track.GenreId).first()
-        if not genre:
+        if track.GenreId not in cache.all_genres(db):
             raise HTTPException(status_code=404, detail="Genre not found")
     
-    media_type = db.query(MediaTypeModel).filter(MediaTypeModel.MediaTypeId == track.MediaTypeId).first()
-    if not media_type:
+    if track.MediaTypeId not in cache.all_media_types(db):
         raise HTTPException(status_code=404, detail="MediaType not found")
     
     db_track = TrackModel(
@@ -70,10 +92,44 @@ def create_track(track: TrackCreate, db: Session = Depends(get_db)):
         UnitPrice=track.UnitPrice
     )
     db.add(db_track)
+    versions.bump(db, TrackModel)
     db.commit()
     db.refresh(db_track)
+    autocomplete.index.add(db, "track", {db_track.TrackId: db_track.Name})
     return db_track
 
+@router.post("/bulk", response_model=List[BulkItemResult])
+def create_tracks_bulk(tracks: List[TrackCreate], db: Session = Depends(get_db)):
+    # Validate foreign keys for the whole batch with one query per table
+    album_ids = existing_ids(db, AlbumModel.AlbumId, {track.AlbumId for track in tracks if track.AlbumId})
+    genres = cache.all_genres(db)
+    media_types = cache.all_media_types(db)
+
+    results = []
+    rows = []
+    for index, track in enumerate(tracks):
+        error = None
+        if track.AlbumId and track.AlbumId not in album_ids:
+            error = "Album not found"
+        elif track.GenreId and track.GenreId not in genres:
+            error = "Genre not found"
+        elif track.MediaTypeId not in media_types:
+            error = "MediaType not found"
+
+        result = BulkItemResult(index=index, success=error is None, error=error)
+        results.append(result)
+        if error is None:
+            rows.append((result, track.model_dump()))
+
+    # Insert every valid track in one executemany and one commit
+    ids = insert_rows(db, TrackModel, TrackModel.TrackId, [row for _, row in rows])
+    versions.bump(db, TrackModel)
+    db.commit()
+    for (result, _), track_id in zip(rows, ids):
+        result.id = track_id
+    autocomplete.index.add(db, "track", {track_id: row["Name"] for (_, row), track_id in zip(rows, ids)})
+    return results
+
 @router.put("/{track_id}", response_model=Track)
 def update_track(track_id: int, track: TrackCreate, db: Session = Depends(get_db)):
     db_track = db.query(TrackModel).filter(TrackModel.TrackId == track_id).first()
@@ -87,20 +143,23 @@ def update_track(track_id: int, track: TrackCreate, db: Session = Depends(get_db
             raise HTTPException(status_code=404, detail="Album not found")
     
     if track.GenreId:
-        genre = db.query(GenreModel).filter(GenreModel.GenreId == track.GenreId).first()
-        if not genre:
+        if track.GenreId not in cache.all_genres(db):
             raise HTTPException(status_code=404, detail="Genre not found")
     
-    media_type = db.query(MediaTypeModel).filter(MediaTypeModel.MediaTypeId == track.MediaTypeId).first()
-    if not media_type:
+    if track.MediaTypeId not in cache.all_media_types(db):
         raise HTTPException(status_code=404, detail="MediaType not found")
     
+    # Keep album/artist/genre sales in step when the track is reassigned
+    rollups.move_track(db, track_id, db_track.AlbumId, db_track.GenreId, track.AlbumId, track.GenreId)
+    
     # Update track attributes
     for key, value in track.model_dump().items():
         setattr(db_track, key, value)
     
+    versions.bump(db, TrackModel)
     db.commit()
     db.refresh(db_track)
+    autocomplete.index.add(db, "track", {db_track.TrackId: db_track.Name})
     return db_track
 
 @router.delete("/{track_id}", response_model=Track)
@@ -109,18 +168,23 @@ def delete_track(track_id: int, db: Session = Depends(get_db)):
     if db_track is None:
         raise HTTPException(status_code=404, detail="Track not found")
     
+    rollups.remove_track(db, track_id, db_track.AlbumId, db_track.GenreId)
+    
     db.delete(db_track)
+    versions.bump(db, TrackModel, PlaylistTrackModel, InvoiceLineModel)
     db.commit()
+    autocomplete.index.remove(db, "track", [track_id])
     return db_track
 
-@router.get("/search/", response_model=List[Track])
+@router.get("/search/", response_model=List[Track], dependencies=[versions.conditional_get(TrackModel, AlbumModel, ArtistModel)])
 def search_tracks(
-    query: str = Query(..., min_length=1, description="Search query for track name or composer"),
+    response: Response,
+    query: str = Query(..., min_length=1, description="Search query for track name, composer, album or artist"),
+    skip: int = 0,
+    limit: int = 100,
+    fieldset: Optional[tuple] = fieldsets.select(Track),
     db: Session = Depends(get_db)
 ):
-    tracks = db.query(TrackModel).filter(
-        (TrackModel.Name.like(f"%{query}%")) | 
-        (TrackModel.Composer.like(f"%{query}%"))
-    ).all()
-    return tracks
+    tracks = search.search_tracks(db, query, skip=skip, limit=limit)
+    return fieldsets.render(tracks, Track, fieldset, response)
 
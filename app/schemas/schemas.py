@@ -205,3 +205,80 @@ class InvoiceWithLines(Invoice):
 
 class CustomerWithInvoices(Customer):
     invoices: List[Invoice] = []
+
+# Checkout schemas
+class CheckoutCreate(BaseModel):
+    CustomerId: int
+    InvoiceDate: Optional[datetime] = None
+    BillingAddress: Optional[str] = None
+    BillingCity: Optional[str] = None
+    BillingState: Optional[str] = None
+    BillingCountry: Optional[str] = None
+    BillingPostalCode: Optional[str] = None
+    TrackIds: List[int]
+
+# Bulk write schemas
+class PlaylistTracksBulkCreate(BaseModel):
+    TrackIds: List[int]
+
+class BulkItemResult(BaseModel):
+    index: int
+    success: bool
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+# Sales report schemas
+class TrackSales(BaseModel):
+    TrackId: int
+    Name: Optional[str] = None
+    Revenue: float
+    Units: int
+
+class AlbumSales(BaseModel):
+    AlbumId: int
+    Title: Optional[str] = None
+    Revenue: float
+    Units: int
+
+class ArtistSales(BaseModel):
+    ArtistId: int
+    Name: Optional[str] = None
+    Revenue: float
+    Units: int
+
+class GenreSales(BaseModel):
+    GenreId: int
+    Name: Optional[str] = None
+    Revenue: float
+    Units: int
+
+class RevenueByPeriod(BaseModel):
+    Period: str
+    Revenue: float
+    Units: int
+
+# Support agent portfolio schemas
+class PortfolioCustomer(BaseModel):
+    CustomerId: int
+    FirstName: str
+    LastName: str
+    Company: Optional[str] = None
+    Country: Optional[str] = None
+    Email: str
+    Phone: Optional[str] = None
+    InvoiceCount: int
+    Spend: float
+    LastPurchase: Optional[datetime] = None
+    TopGenreId: Optional[int] = None
+    TopGenre: Optional[str] = None
+
+# Autocomplete schemas
+class AutocompleteMatch(BaseModel):
+    Id: int
+    Name: str
+    Popularity: int
+
+class Autocomplete(BaseModel):
+    Artists: List[AutocompleteMatch] = []
+    Albums: List[AutocompleteMatch] = []
+    Tracks: List[AutocompleteMatch] = []
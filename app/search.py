@@ -0,0 +1,201 @@
+import re
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.models.models import Track as TrackModel, Customer as CustomerModel
+
+# Set by setup_search() once the FTS5 tables and triggers are in place.
+# While False every search falls back to LIKE scans.
+fts_enabled = False
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Tracks are indexed together with their album title and artist name, so the
+# index is a standalone FTS5 table keyed by TrackId (rowid) rather than an
+# external-content table over Track.
+_TRACK_SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE TrackSearch USING fts5(
+        Name, Composer, AlbumTitle, ArtistName,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO TrackSearch (rowid, Name, Composer, AlbumTitle, ArtistName)
+    SELECT Track.TrackId, Track.Name, Track.Composer, Album.Title, Artist.Name
+    FROM Track
+    LEFT JOIN Album ON Album.AlbumId = Track.AlbumId
+    LEFT JOIN Artist ON Artist.ArtistId = Album.ArtistId
+    """,
+    """
+    CREATE TRIGGER TrackSearch_ai AFTER INSERT ON Track BEGIN
+        INSERT INTO TrackSearch (rowid, Name, Composer, AlbumTitle, ArtistName)
+        SELECT new.TrackId, new.Name, new.Composer, Album.Title, Artist.Name
+        FROM (SELECT 1)
+        LEFT JOIN Album ON Album.AlbumId = new.AlbumId
+        LEFT JOIN Artist ON Artist.ArtistId = Album.ArtistId;
+    END
+    """,
+    """
+    CREATE TRIGGER TrackSearch_ad AFTER DELETE ON Track BEGIN
+        DELETE FROM TrackSearch WHERE rowid = old.TrackId;
+    END
+    """,
+    """
+    CREATE TRIGGER TrackSearch_au AFTER UPDATE OF TrackId, Name, Composer, AlbumId ON Track BEGIN
+        DELETE FROM TrackSearch WHERE rowid = old.TrackId;
+        INSERT INTO TrackSearch (rowid, Name, Composer, AlbumTitle, ArtistName)
+        SELECT new.TrackId, new.Name, new.Composer, Album.Title, Artist.Name
+        FROM (SELECT 1)
+        LEFT JOIN Album ON Album.AlbumId = new.AlbumId
+        LEFT JOIN Artist ON Artist.ArtistId = Album.ArtistId;
+    END
+    """,
+    """
+    CREATE TRIGGER TrackSearch_album_au AFTER UPDATE OF Title, ArtistId ON Album BEGIN
+        UPDATE TrackSearch
+        SET AlbumTitle = new.Title,
+            ArtistName = (SELECT Name FROM Artist WHERE ArtistId = new.ArtistId)
+        WHERE rowid IN (SELECT TrackId FROM Track WHERE AlbumId = new.AlbumId);
+    END
+    """,
+    """
+    CREATE TRIGGER TrackSearch_album_ad AFTER DELETE ON Album BEGIN
+        UPDATE TrackSearch SET AlbumTitle = NULL, ArtistName = NULL
+        WHERE rowid IN (SELECT TrackId FROM Track WHERE AlbumId = old.AlbumId);
+    END
+    """,
+    """
+    CREATE TRIGGER TrackSearch_artist_au AFTER UPDATE OF Name ON Artist BEGIN
+        UPDATE TrackSearch SET ArtistName = new.Name
+        WHERE rowid IN (
+            SELECT Track.TrackId FROM Track
+            JOIN Album ON Album.AlbumId = Track.AlbumId
+            WHERE Album.ArtistId = new.ArtistId
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER TrackSearch_artist_ad AFTER DELETE ON Artist BEGIN
+        UPDATE TrackSearch SET ArtistName = NULL
+        WHERE rowid IN (
+            SELECT Track.TrackId FROM Track
+            JOIN Album ON Album.AlbumId = Track.AlbumId
+            WHERE Album.ArtistId = old.ArtistId
+        );
+    END
+    """,
+]
+
+# Customers only need their own columns, so an external-content table over
+# Customer avoids storing a second copy of the text.
+_CUSTOMER_SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE CustomerSearch USING fts5(
+        FirstName, LastName, Email, Company,
+        content = 'Customer', content_rowid = 'CustomerId',
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    "INSERT INTO CustomerSearch (CustomerSearch) VALUES ('rebuild')",
+    """
+    CREATE TRIGGER CustomerSearch_ai AFTER INSERT ON Customer BEGIN
+        INSERT INTO CustomerSearch (rowid, FirstName, LastName, Email, Company)
+        VALUES (new.CustomerId, new.FirstName, new.LastName, new.Email, new.Company);
+    END
+    """,
+    """
+    CREATE TRIGGER CustomerSearch_ad AFTER DELETE ON Customer BEGIN
+        INSERT INTO CustomerSearch (CustomerSearch, rowid, FirstName, LastName, Email, Company)
+        VALUES ('delete', old.CustomerId, old.FirstName, old.LastName, old.Email, old.Company);
+    END
+    """,
+    """
+    CREATE TRIGGER CustomerSearch_au AFTER UPDATE ON Customer BEGIN
+        INSERT INTO CustomerSearch (CustomerSearch, rowid, FirstName, LastName, Email, Company)
+        VALUES ('delete', old.CustomerId, old.FirstName, old.LastName, old.Email, old.Company);
+        INSERT INTO CustomerSearch (rowid, FirstName, LastName, Email, Company)
+        VALUES (new.CustomerId, new.FirstName, new.LastName, new.Email, new.Company);
+    END
+    """,
+]
+
+# bm25() column weights, in the column order of each FTS table
+_TRACK_WEIGHTS = "10.0, 4.0, 2.0, 3.0"
+_CUSTOMER_WEIGHTS = "5.0, 5.0, 3.0, 1.0"
+
+
+def setup_search(engine):
+    """Create the FTS5 indexes and their sync triggers if they don't exist yet.
+
+    Leaves search on the LIKE fallback when the SQLite build has no FTS5.
+    """
+    global fts_enabled
+    try:
+        with engine.begin() as conn:
+            existing = {
+                row[0] for row in conn.execute(
+                    text("SELECT name FROM sqlite_master WHERE name IN ('TrackSearch', 'CustomerSearch')")
+                )
+            }
+            if "TrackSearch" not in existing:
+                for statement in _TRACK_SEARCH_DDL:
+                    conn.execute(text(statement))
+            if "CustomerSearch" not in existing:
+                for statement in _CUSTOMER_SEARCH_DDL:
+                    conn.execute(text(statement))
+    except OperationalError:
+        # "no such module: fts5"
+        fts_enabled = False
+    else:
+        fts_enabled = True
+
+
+def _match_expression(query: str) -> str:
+    # Quote every token so user input can't inject FTS5 syntax, and make each
+    # one a prefix match so results show up while the user is still typing.
+    return " ".join(f'"{token}"*' for token in _TOKEN_RE.findall(query))
+
+
+def search_tracks(db: Session, query: str, skip: int = 0, limit: int = 100):
+    match = _match_expression(query)
+    if fts_enabled and match:
+        statement = text(
+            "SELECT Track.* FROM TrackSearch "
+            "JOIN Track ON Track.TrackId = TrackSearch.rowid "
+            "WHERE TrackSearch MATCH :match "
+            f"ORDER BY bm25(TrackSearch, {_TRACK_WEIGHTS}), Track.TrackId "
+            "LIMIT :limit OFFSET :skip"
+        )
+        return db.query(TrackModel).from_statement(statement).params(
+            match=match, limit=limit, skip=skip
+        ).all()
+
+    return db.query(TrackModel).filter(
+        (TrackModel.Name.like(f"%{query}%")) |
+        (TrackModel.Composer.like(f"%{query}%"))
+    ).order_by(TrackModel.TrackId).offset(skip).limit(limit).all()
+
+
+def search_customers(db: Session, query: str, skip: int = 0, limit: int = 100):
+    match = _match_expression(query)
+    if fts_enabled and match:
+        statement = text(
+            "SELECT Customer.* FROM CustomerSearch "
+            "JOIN Customer ON Customer.CustomerId = CustomerSearch.rowid "
+            "WHERE CustomerSearch MATCH :match "
+            f"ORDER BY bm25(CustomerSearch, {_CUSTOMER_WEIGHTS}), Customer.CustomerId "
+            "LIMIT :limit OFFSET :skip"
+        )
+        return db.query(CustomerModel).from_statement(statement).params(
+            match=match, limit=limit, skip=skip
+        ).all()
+
+    return db.query(CustomerModel).filter(
+        (CustomerModel.FirstName.like(f"%{query}%")) |
+        (CustomerModel.LastName.like(f"%{query}%")) |
+        (CustomerModel.Email.like(f"%{query}%")) |
+        (CustomerModel.Company.like(f"%{query}%"))
+    ).order_by(CustomerModel.CustomerId).offset(skip).limit(limit).all()
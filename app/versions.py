@@ -0,0 +1,92 @@
+from fastapi import Depends, HTTPException, Request, Response
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.models.models import TableVersion
+
+
+def setup_versions(engine):
+    """Create the TableVersion table on first start."""
+    TableVersion.__table__.create(engine, checkfirst=True)
+
+
+def _table_names(models) -> list:
+    return sorted({getattr(model, "__tablename__", model) for model in models})
+
+
+def bump(db: Session, *models):
+    """Record a change to the tables of `models`.
+
+    Call in the write transaction, before the commit, so the new version
+    becomes visible together with the data.
+    """
+    statement = sqlite_insert(TableVersion).values([
+        {"Name": name, "Version": 1} for name in _table_names(models)
+    ])
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[TableVersion.Name],
+        set_={"Version": TableVersion.Version + 1},
+    ))
+
+
+def current_version(db: Session, model) -> int:
+    """Current version of the table of `model`; 0 before its first change."""
+    return db.query(TableVersion.Version).filter(
+        TableVersion.Name == getattr(model, "__tablename__", model)
+    ).scalar() or 0
+
+
+def current_etag(db: Session, models) -> str:
+    """Weak ETag built from the current versions of the tables of `models`."""
+    names = _table_names(models)
+    versions = dict(
+        db.query(TableVersion.Name, TableVersion.Version).filter(TableVersion.Name.in_(names))
+    )
+    return 'W/"' + ".".join(str(versions.get(name, 0)) for name in names) + '"'
+
+
+def _opaque_tag(tag: str) -> str:
+    # If-None-Match uses the weak comparison: W/"x" matches "x"
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def check_not_modified(request: Request, etag: str):
+    """Raise a 304 if the request's If-None-Match matches `etag`."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return
+    candidates = {_opaque_tag(tag) for tag in if_none_match.split(",")}
+    if "*" in candidates or _opaque_tag(etag) in candidates:
+        raise HTTPException(status_code=304, headers={"ETag": etag})
+
+
+def extend_etag(request: Request, response: Response, db: Session, models):
+    """Add the versions of `models` to the ETag set by conditional_get().
+
+    For responses that read more tables than the route declares, such as
+    embedded relationships. The longer tag never matches the route's own.
+    """
+    etag = response.headers.get("ETag")
+    if etag is None:
+        return
+    etag = etag[:-1] + "." + current_etag(db, models)[3:]
+    check_not_modified(request, etag)
+    response.headers["ETag"] = etag
+
+
+def conditional_get(*models):
+    """Route dependency for GET endpoints that read the tables of `models`.
+
+    Answers a matching If-None-Match with 304 Not Modified before the
+    endpoint runs, and otherwise adds the ETag to the response:
+
+        @router.get("/{album_id}", dependencies=[versions.conditional_get(AlbumModel, ArtistModel)])
+    """
+    def check_etag(request: Request, response: Response, db: Session = Depends(get_db)):
+        etag = current_etag(db, models)
+        check_not_modified(request, etag)
+        response.headers["ETag"] = etag
+
+    return Depends(check_etag)
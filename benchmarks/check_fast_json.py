@@ -0,0 +1,152 @@
+# Check that the CHINOOK_FAST_JSON path returns byte-for-byte the same
+# responses as the default response_model serialization.
+#
+#     python -m benchmarks.check_fast_json [--db chinook.db]
+#
+# Requests every fast-path list endpoint twice against a temporary copy of
+# the database, once with the fast path off and once with it on, and compares
+# status, body and the X-Next-Cursor/X-Total-Count/X-Missing-Ids/ETag headers. Exits with
+# status 1 on any difference.
+import argparse
+import asyncio
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+DEFAULT_DB = Path(__file__).resolve().parent.parent / "chinook.db"
+
+COMPARED_HEADERS = ("content-type", "x-next-cursor", "x-total-count", "x-missing-ids", "etag")
+
+URLS = [
+    "/tracks/",
+    "/tracks/?limit=1000",
+    "/tracks/?skip=3400&limit=500",
+    "/tracks/?album_id=1",
+    "/tracks/?genre_id=1&media_type_id=1&limit=50",
+    "/albums/?limit=1000",
+    "/albums/by-artist/90",
+    "/customers/",
+    "/employees/",
+    "/employees/2/subordinates",
+    "/employees/1/reports?depth=all",
+    "/employees/1/customers?recursive=true&limit=10",
+    "/employees/3/portfolio?limit=5",
+    "/invoices/?limit=1000",
+    "/invoices/1/lines",
+    "/invoices/customer/1",
+    "/playlists/",
+    "/playlists/1/tracks",
+    "/playlists/2/tracks",
+    "/playlists/1/tracks?sort=name&limit=1000",
+    "/playlists/1/tracks?sort=duration",
+    "/genres/1/tracks?limit=1000",
+    "/media-types/2/tracks",
+    # Sparse fieldsets
+    "/tracks/?fields=TrackId,Name,UnitPrice&limit=1000",
+    "/customers/?fields=CustomerId,Email",
+    "/employees/2/subordinates?fields=LastName,HireDate",
+    "/invoices/?fields=InvoiceDate,Total&limit=500",
+    "/playlists/1/tracks?fields=Name",
+    # Multi-get
+    "/tracks/?ids=5,3,99999,1,3",
+    "/invoices/?ids=412,1,0&fields=InvoiceId,Total",
+]
+
+
+def prepare_database(path: Path):
+    """Add the edge cases the fast path has to encode like Pydantic does."""
+    conn = sqlite3.connect(path)
+    with conn:
+        # NUMERIC columns holding integers must still come out as floats
+        conn.execute("UPDATE Track SET UnitPrice = 1 WHERE TrackId = 1")
+        conn.execute("UPDATE Invoice SET Total = 2 WHERE InvoiceId = 1")
+        # NULLs in optional columns, non-ASCII text and JSON escapes
+        conn.execute("UPDATE Track SET Composer = NULL, Bytes = NULL WHERE TrackId = 2")
+        conn.execute("UPDATE Track SET Name = 'Ünïcødé \"quoted\" \\ back\\slash\ttab' WHERE TrackId = 3")
+    conn.close()
+
+
+async def fetch_all(app, settings, enabled: bool) -> dict:
+    import httpx
+
+    settings.fast_json = enabled
+    responses = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+        for url in URLS:
+            response = await client.get(url)
+            # Follow the cursor once, so keyset pages are compared too
+            next_cursor = response.headers.get("x-next-cursor")
+            responses[url] = response
+            if next_cursor is not None:
+                separator = "&" if "?" in url else "?"
+                cursor_url = f"{url}{separator}cursor={next_cursor}"
+                responses[cursor_url] = await client.get(cursor_url)
+    return responses
+
+
+async def compare(app, settings) -> list:
+    async with app.router.lifespan_context(app):
+        expected = await fetch_all(app, settings, enabled=False)
+        actual = await fetch_all(app, settings, enabled=True)
+
+    failures = []
+    for url, reference in expected.items():
+        known_failures = len(failures)
+        fast = actual.get(url)
+        if fast is None:
+            failures.append(f"{url}: no fast-path response")
+            continue
+        if fast.status_code != reference.status_code:
+            failures.append(f"{url}: status {fast.status_code} != {reference.status_code}")
+        for header in COMPARED_HEADERS:
+            if fast.headers.get(header) != reference.headers.get(header):
+                failures.append(
+                    f"{url}: {header} {fast.headers.get(header)!r} != {reference.headers.get(header)!r}"
+                )
+        if fast.content != reference.content:
+            offset = next(
+                (i for i, (a, b) in enumerate(zip(fast.content, reference.content)) if a != b),
+                min(len(fast.content), len(reference.content)),
+            )
+            failures.append(
+                f"{url}: body differs at byte {offset}: "
+                f"{fast.content[offset:offset + 60]!r} != {reference.content[offset:offset + 60]!r}"
+            )
+        status = "ok  " if len(failures) == known_failures else "FAIL"
+        print(f"{status} {url} ({len(reference.content):,} bytes)")
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare fast JSON output with response_model output")
+    parser.add_argument("--db", default=str(DEFAULT_DB), help="database to copy and check against")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="chinook-fast-json-") as directory:
+        db_path = Path(directory) / "chinook.db"
+        shutil.copyfile(args.db, db_path)
+        prepare_database(db_path)
+        os.environ["CHINOOK_DB_PATH"] = str(db_path)
+        # Turned on for the import, so orjson is loaded; toggled per run below
+        os.environ["CHINOOK_FAST_JSON"] = "1"
+
+        from app.config import settings
+        from app.main import app
+
+        failures = asyncio.run(compare(app, settings))
+
+    if failures:
+        print(f"\n{len(failures)} difference(s):")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print("\nFast JSON output is byte-for-byte identical")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
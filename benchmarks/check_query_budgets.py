@@ -0,0 +1,85 @@
+# Check that endpoints run no more SQL statements than they are budgeted.
+#
+#     python -m benchmarks.check_query_budgets [--db chinook.db]
+#
+# Sends each request in BUDGETS against a temporary copy of the database
+# through app.query_counter.assert_max_queries and exits with status 1 when
+# one runs more statements than its budget, listing them. The budgets are
+# what the endpoints run today; a new N+1 (a lazy load per row) or an extra
+# round trip shows up as a higher count.
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+DEFAULT_DB = Path(__file__).resolve().parent.parent / "chinook.db"
+
+# Most SQL statements per request, table versions for conditional GET
+# included. The list endpoints with ?include= load each relation in one
+# statement per page, however many rows it holds.
+BUDGETS = {
+    "/tracks/1": 2,
+    "/albums/1": 2,
+    "/invoices/1": 3,
+    "/customers/1/with-invoices": 3,
+    "/tracks/": 2,
+    "/tracks/?ids=1,2,3": 2,
+    "/playlists/1/tracks": 3,
+    "/playlists/1?include=tracks.album": 5,
+    "/albums/?include=artist,tracks": 5,
+    "/invoices/?include=customer.support_rep,invoice_lines.track": 8,
+    "/employees/3/portfolio": 3,
+    "/autocomplete?q=lo": 0,
+}
+
+
+async def check(app) -> list:
+    """The error of every request over its budget."""
+    import httpx
+
+    from app.query_counter import assert_max_queries
+
+    failures = []
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://budgets") as client:
+            for path, budget in BUDGETS.items():
+                try:
+                    with assert_max_queries(budget):
+                        response = await client.get(path)
+                except AssertionError as error:
+                    failures.append(f"GET {path}: {error}")
+                    continue
+                if response.status_code != 200:
+                    failures.append(f"GET {path} returned {response.status_code}")
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check the SQL statement budget of each endpoint")
+    parser.add_argument("--db", default=str(DEFAULT_DB), help="database to copy and check against")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="chinook-budgets-") as directory:
+        db_path = Path(directory) / "chinook.db"
+        shutil.copyfile(args.db, db_path)
+        os.environ["CHINOOK_DB_PATH"] = str(db_path)
+
+        from app.main import app
+
+        failures = asyncio.run(check(app))
+
+    if failures:
+        print(f"{len(failures)} request(s) over their query budget:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print(f"All {len(BUDGETS)} requests within their query budgets")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
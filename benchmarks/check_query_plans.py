@@ -0,0 +1,177 @@
+# Check the query plan of every SQL statement the API runs.
+#
+#     python -m benchmarks.check_query_plans [--db chinook.db] [--min-rows 1000] [--verbose]
+#
+# Sends each benchmark scenario, plus the filter variants below, once against
+# a temporary copy of the database, captures every statement with its
+# parameters and runs EXPLAIN QUERY PLAN on it. Exits with status 1 when a
+# plan scans a table holding at least --min-rows rows, unless that scan is
+# listed in EXPECTED_SCANS. Run it against a scaled database
+# (benchmarks.scale_db) to hold the smaller tables to the same rule.
+import argparse
+import asyncio
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+from benchmarks.scenarios import SCENARIOS, Scenario, prepare
+
+DEFAULT_DB = Path(__file__).resolve().parent.parent / "chinook.db"
+
+# Requests that only matter for their query plans: every foreign key filter
+# the routers offer
+PLAN_SCENARIOS = [
+    Scenario("tracks.list_by_album", "GET", "/tracks/?album_id=1"),
+    Scenario("tracks.list_by_media_type", "GET", "/tracks/?media_type_id=2"),
+    Scenario("tracks.list_cursor", "GET", "/tracks/?cursor=WzEwMDBd"),
+    Scenario("customers.detail_sparse", "GET", "/customers/1?fields=CustomerId,Email"),
+    Scenario("invoices.list_cursor", "GET", "/invoices/?cursor=WzIwMF0"),
+    Scenario("playlists.tracks_cursor", "GET", "/playlists/1/tracks?cursor=WzEwMF0"),
+    Scenario("playlists.tracks_by_duration", "GET", "/playlists/1/tracks?sort=duration"),
+    Scenario("employees.reports_depth", "GET", "/employees/1/reports?depth=2"),
+    Scenario("employees.customers", "GET", "/employees/3/customers"),
+    Scenario("employees.portfolio_cursor", "GET", "/employees/3/portfolio?cursor=WzM3LjYyLDQwXQ"),
+    Scenario("tracks.list_ids", "GET", "/tracks/?ids=" + ",".join(str(i) for i in range(2000, 0, -2))),
+    Scenario("invoices.list_include", "GET", "/invoices/?include=customer.support_rep,invoice_lines.track"),
+    Scenario("playlists.detail_include", "GET", "/playlists/1?include=tracks.album"),
+    Scenario("artists.delete_missing", "DELETE", "/artists/999999"),
+    Scenario("tracks.update", "PUT", "/tracks/5", {
+        "Name": "Plan check", "AlbumId": 2, "MediaTypeId": 1, "GenreId": 2,
+        "Milliseconds": 200000, "Bytes": 6000000, "UnitPrice": 0.99,
+    }),
+    Scenario("invoices.delete", "DELETE", "/invoices/412"),
+]
+
+_FIRST_PAGE = "first page in primary key order; the scan stops after LIMIT rows"
+
+# Scans that are fine, per scenario and table, with the reason
+EXPECTED_SCANS = {
+    "artists.list": {"Artist": _FIRST_PAGE},
+    "albums.list": {"Album": _FIRST_PAGE},
+    "tracks.list": {"Track": _FIRST_PAGE},
+    "tracks.list_sparse": {"Track": _FIRST_PAGE},
+    "tracks.list_offset": {"Track": "OFFSET steps over the skipped rows; X-Next-Cursor avoids that"},
+    "customers.list": {"Customer": _FIRST_PAGE},
+    "customers.list_sparse": {"Customer": _FIRST_PAGE},
+    "employees.list": {"Employee": _FIRST_PAGE},
+    "invoices.list": {"Invoice": _FIRST_PAGE},
+    "invoices.list_include": {"Invoice": _FIRST_PAGE},
+    "playlists.list": {"Playlist": _FIRST_PAGE},
+    "reports.revenue_month": {"SalesByDay": "sums every day of the requested range"},
+    "export.invoices": {"Invoice": "streams the whole table"},
+}
+
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\S+)")
+_EXPLAINED = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+def table_sizes(path: Path, names) -> dict:
+    conn = sqlite3.connect(path)
+    sizes = {name: conn.execute(f'SELECT count(*) FROM "{name}"').fetchone()[0] for name in names}
+    conn.close()
+    return sizes
+
+
+def scanned_tables(plan, sizes: dict) -> set:
+    """Tables the plan rows scan; aliases like Genre_1 map back to their table."""
+    tables = set()
+    for detail in plan:
+        match = _SCAN.match(detail)
+        if match is None:
+            continue
+        name = match.group(1)
+        if name not in sizes:
+            name = re.sub(r"_\d+$", "", name)
+        if name in sizes:
+            tables.add(name)
+    return tables
+
+
+async def capture(app, engines, scenarios) -> dict:
+    """SQL statements (with the parameters of their first run) per scenario."""
+    import httpx
+    from sqlalchemy import event
+
+    statements = defaultdict(dict)
+    current = {"scenario": None}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if current["scenario"] is None or not statement.lstrip().upper().startswith(_EXPLAINED):
+            return
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        statements[current["scenario"]].setdefault(statement, parameters)
+
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", record)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://plans") as client:
+            context = await prepare(client)
+            for scenario in scenarios:
+                method, path, body = scenario.request(0, context)
+                current["scenario"] = scenario.name
+                response = await client.request(method, path, json=body)
+                current["scenario"] = None
+                if response.status_code >= 500:
+                    raise RuntimeError(f"{scenario.name}: {method} {path} returned {response.status_code}")
+    return statements
+
+
+def check(statements: dict, db_path: Path, sizes: dict, min_rows: int, verbose: bool) -> list:
+    conn = sqlite3.connect(db_path)
+    failures = []
+    for scenario, scenario_statements in statements.items():
+        expected = EXPECTED_SCANS.get(scenario, {})
+        for statement, parameters in scenario_statements.items():
+            plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+            large_scans = {table for table in scanned_tables(plan, sizes) if sizes[table] >= min_rows}
+            unexpected = large_scans - set(expected)
+            status = "FAIL" if unexpected else "ok  "
+            if unexpected or verbose:
+                print(f"{status} {scenario}: {' '.join(statement.split())[:160]}")
+                for detail in plan:
+                    print(f"       {detail}")
+            for table in sorted(unexpected):
+                failures.append(f"{scenario}: SCAN {table} ({sizes[table]:,} rows)")
+    conn.close()
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN every statement the API runs")
+    parser.add_argument("--db", default=str(DEFAULT_DB), help="database to copy and check against")
+    parser.add_argument("--min-rows", type=int, default=1000, help="tables at least this large must not be scanned")
+    parser.add_argument("--verbose", action="store_true", help="print every statement and its plan")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="chinook-plans-") as directory:
+        db_path = Path(directory) / "chinook.db"
+        shutil.copyfile(args.db, db_path)
+        os.environ["CHINOOK_DB_PATH"] = str(db_path)
+
+        from app.database import Base, sync_engines
+        from app.main import app
+
+        statements = asyncio.run(capture(app, sync_engines(), SCENARIOS + PLAN_SCENARIOS))
+        sizes = table_sizes(db_path, [table.name for table in Base.metadata.sorted_tables])
+        failures = check(statements, db_path, sizes, args.min_rows, args.verbose)
+
+    checked = sum(len(scenario_statements) for scenario_statements in statements.values())
+    if failures:
+        print(f"\n{len(failures)} unexpected scan(s) in {checked} statements:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print(f"\nNo unexpected scans in {checked} statements")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
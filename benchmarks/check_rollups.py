@@ -0,0 +1,129 @@
+# Check that the incremental rollup updates agree with a full rebuild.
+#
+#     python -m benchmarks.check_rollups [--db chinook.db]
+#
+# Sends every kind of write that touches sales (invoice lines, checkout,
+# reassigned tracks and albums, deleted tracks, albums, genres and artists)
+# against a temporary copy of the database, then compares each Sales* table
+# with what app.rollups.rebuild() computes from the base tables. Exits with
+# status 1 on any difference.
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+DEFAULT_DB = Path(__file__).resolve().parent.parent / "chinook.db"
+
+_TRACK = {"MediaTypeId": 1, "Milliseconds": 200000, "Bytes": 6000000, "UnitPrice": 0.99}
+
+
+async def _send(client, method: str, path: str, body=None):
+    response = await client.request(method, path, json=body)
+    if response.status_code >= 400:
+        raise RuntimeError(f"{method} {path} returned {response.status_code}: {response.text}")
+    return response.json()
+
+
+async def write(app):
+    """Every write path that moves sales between rollup rows."""
+    import httpx
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://rollups") as client:
+            # Lines added, changed and removed
+            line = await _send(client, "POST", "/invoices/1/lines", {
+                "InvoiceId": 1, "TrackId": 5, "UnitPrice": 0.99, "Quantity": 2,
+            })
+            await _send(client, "PUT", f"/invoices/1/lines/{line['InvoiceLineId']}", {
+                "InvoiceId": 1, "TrackId": 20, "UnitPrice": 1.99, "Quantity": 3,
+            })
+            await _send(client, "POST", "/invoices/2/lines/bulk", [
+                {"InvoiceId": 2, "TrackId": track_id, "UnitPrice": 0.99, "Quantity": 1} for track_id in (30, 31, 32)
+            ])
+            await _send(client, "DELETE", f"/invoices/2/lines/{(await _send(client, 'GET', '/invoices/2/lines'))[0]['InvoiceLineId']}")
+            await _send(client, "POST", "/invoices/checkout", {"CustomerId": 3, "TrackIds": [40, 41, 41]})
+            await _send(client, "DELETE", "/invoices/5")
+
+            # A track moved to another album and genre, an album to another artist
+            track = await _send(client, "GET", "/tracks/1")
+            await _send(client, "PUT", "/tracks/1", {**track, "AlbumId": 3, "GenreId": 2})
+            await _send(client, "PUT", "/albums/4", {"Title": "Moved", "ArtistId": 2})
+
+            # Deletes: an album with sales, and a track, genre and artist
+            # whose sales moved elsewhere first
+            await _send(client, "DELETE", "/albums/1")
+            genre = await _send(client, "POST", "/genres/", {"Name": "Short-lived"})
+            artist = await _send(client, "POST", "/artists/", {"Name": "Short-lived"})
+            album = await _send(client, "POST", "/albums/", {"Title": "Short-lived", "ArtistId": artist["ArtistId"]})
+            track = await _send(client, "POST", "/tracks/", {
+                **_TRACK, "Name": "Short-lived", "AlbumId": album["AlbumId"], "GenreId": genre["GenreId"],
+            })
+            line = await _send(client, "POST", "/invoices/3/lines", {
+                "InvoiceId": 3, "TrackId": track["TrackId"], "UnitPrice": 0.99, "Quantity": 4,
+            })
+            await _send(client, "DELETE", f"/invoices/3/lines/{line['InvoiceLineId']}")
+            await _send(client, "DELETE", f"/tracks/{track['TrackId']}")
+            await _send(client, "DELETE", f"/genres/{genre['GenreId']}")
+            await _send(client, "DELETE", f"/albums/{album['AlbumId']}")
+            await _send(client, "DELETE", f"/artists/{artist['ArtistId']}")
+
+
+def snapshot(db, models) -> dict:
+    """Non-empty rollup rows per table, {key: (revenue, units)}."""
+    tables = {}
+    for model in models:
+        (column,) = model.__table__.primary_key.columns
+        tables[model.__tablename__] = {
+            str(key): (round(revenue, 2), units)
+            for key, revenue, units in db.query(column, model.Revenue, model.Units)
+            if round(revenue, 2) or units
+        }
+    return tables
+
+
+def compare(incremental: dict, rebuilt: dict) -> list:
+    differences = []
+    for table, rows in rebuilt.items():
+        for key in sorted(set(rows) | set(incremental[table])):
+            if incremental[table].get(key) != rows.get(key):
+                differences.append(f"{table}[{key}]: incremental {incremental[table].get(key)}, rebuilt {rows.get(key)}")
+    return differences
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare the incrementally maintained rollups with a rebuild")
+    parser.add_argument("--db", default=str(DEFAULT_DB), help="database to copy and check against")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="chinook-rollups-") as directory:
+        db_path = Path(directory) / "chinook.db"
+        shutil.copyfile(args.db, db_path)
+        os.environ["CHINOOK_DB_PATH"] = str(db_path)
+
+        from app.database import SessionLocal
+        from app.main import app
+        from app.rollups import ROLLUP_MODELS, rebuild
+
+        asyncio.run(write(app))
+        with SessionLocal() as db:
+            incremental = snapshot(db, ROLLUP_MODELS)
+            rebuild(db)
+            rebuilt = snapshot(db, ROLLUP_MODELS)
+            db.rollback()
+
+    differences = compare(incremental, rebuilt)
+    if differences:
+        print(f"{len(differences)} rollup row(s) differ from a rebuild:")
+        for difference in differences:
+            print(f"  {difference}")
+        return 1
+    print(f"Rollups match a rebuild ({sum(len(rows) for rows in rebuilt.values())} rows)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
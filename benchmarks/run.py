@@ -0,0 +1,191 @@
+# Benchmark the API in-process and compare the results against a baseline.
+#
+# Drives app.main:app through httpx's ASGI transport (no sockets, no server)
+# against a temporary copy of the database, so writes never touch the
+# original. Examples:
+#
+#     python -m benchmarks.run                       # run, write results, compare to baseline
+#     python -m benchmarks.run --save-baseline       # run and store the results as the new baseline
+#     python -m benchmarks.run --only tracks --only invoices.detail
+#     python -m benchmarks.run --db big.db --concurrency 8 --async
+#
+# Exits with status 1 when a scenario's latency regressed past the threshold.
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.scenarios import SCENARIOS, prepare
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+DEFAULT_DB = BENCHMARKS_DIR.parent / "chinook.db"
+DEFAULT_OUTPUT = BENCHMARKS_DIR / "results.json"
+DEFAULT_BASELINE = BENCHMARKS_DIR / "baseline.json"
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: list, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "throughput": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+async def run_scenario(client, scenario, context: dict, requests: int, warmup: int, concurrency: int) -> dict:
+    async def send(i: int):
+        method, path, body = scenario.request(i, context)
+        response = await client.request(method, path, json=body)
+        await response.aread()
+        if response.status_code >= 400:
+            raise RuntimeError(f"{scenario.name}: {method} {path} returned {response.status_code}: {response.text}")
+
+    for i in range(warmup):
+        await send(i)
+
+    counter = itertools.count(warmup)
+    end = warmup + requests
+    latencies = []
+
+    async def worker():
+        for i in counter:
+            if i >= end:
+                return
+            start = time.perf_counter()
+            await send(i)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+async def run(scenarios, requests: int, warmup: int, concurrency: int) -> dict:
+    # Imported here: the app reads its configuration (database path, async
+    # mode) from the environment at import time.
+    import httpx
+    from app.main import app
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            context = await prepare(client)
+            for scenario in scenarios:
+                results[scenario.name] = await run_scenario(
+                    client, scenario, context, requests, warmup, concurrency
+                )
+                print(_format_result(scenario.name, results[scenario.name]), flush=True)
+    return results
+
+
+def compare(results: dict, baseline: dict, metric: str, threshold: float, min_delta_ms: float) -> list:
+    """Names of the scenarios whose `metric` got slower than the baseline allows."""
+    regressions = []
+    print(f"\nComparison on {metric} (threshold +{threshold:.0%}, ignoring changes under {min_delta_ms} ms)")
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"  {name:<28} new scenario, no baseline")
+            continue
+        before = baseline[name][metric]
+        after = result[metric]
+        change = (after - before) / before if before else 0.0
+        regressed = after > before * (1 + threshold) and after - before > min_delta_ms
+        marker = "REGRESSION" if regressed else "ok"
+        print(f"  {name:<28} {before:>9.3f} -> {after:>9.3f} ms  {change:>+7.1%}  {marker}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def _format_result(name: str, result: dict) -> str:
+    return (
+        f"{name:<28} {result['throughput']:>9.1f} req/s  "
+        f"p50 {result['p50_ms']:>8.3f} ms  p95 {result['p95_ms']:>8.3f} ms  p99 {result['p99_ms']:>8.3f} ms"
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="In-process benchmark of the Chinook API")
+    parser.add_argument("--db", default=str(DEFAULT_DB), help="database to copy and benchmark against")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=1, help="requests in flight per scenario")
+    parser.add_argument("--only", action="append", default=[], help="run scenarios whose name contains this")
+    parser.add_argument("--async", dest="async_db", action="store_true", help="run the app in async mode")
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT), help="where to write the results JSON")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="results JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--metric", choices=["p50_ms", "p95_ms", "p99_ms", "mean_ms"], default="p50_ms")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="ignore absolute changes below this")
+    args = parser.parse_args(argv)
+
+    scenarios = [
+        scenario for scenario in SCENARIOS
+        if not args.only or any(part in scenario.name for part in args.only)
+    ]
+    if not scenarios:
+        parser.error("no scenario matches --only")
+
+    with tempfile.TemporaryDirectory(prefix="chinook-bench-") as directory:
+        db_path = Path(directory) / "chinook.db"
+        shutil.copyfile(args.db, db_path)
+        os.environ["CHINOOK_DB_PATH"] = str(db_path)
+        if args.async_db:
+            os.environ["CHINOOK_ASYNC_DB"] = "1"
+        results = asyncio.run(run(scenarios, args.requests, args.warmup, args.concurrency))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "database": os.path.basename(args.db),
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "async": args.async_db,
+        },
+        "results": results,
+    }
+    output = Path(args.baseline if args.save_baseline else args.output)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"\nResults written to {output}")
+    if args.save_baseline:
+        return 0
+
+    baseline_path = Path(args.baseline)
+    if not baseline_path.exists():
+        print(f"No baseline at {baseline_path}; run with --save-baseline to create one")
+        return 0
+    baseline = json.loads(baseline_path.read_text())["results"]
+    regressions = compare(results, baseline, args.metric, args.threshold, args.min_delta_ms)
+    if regressions:
+        print(f"\n{len(regressions)} scenario(s) regressed: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
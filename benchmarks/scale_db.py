@@ -0,0 +1,263 @@
+# Build a synthetic Chinook database N times the size of the bundled one.
+#
+#     python -m benchmarks.scale_db --scale 100 --output chinook-100x.db
+#     python -m benchmarks.run --db chinook-100x.db
+#
+# Tables come from app/models/models.py. Vocabulary (track words, composers,
+# names, addresses) and the shape of the data (album sizes, genre and media
+# type mix, lines per invoice, prices, durations) are sampled from the source
+# database. On top of that:
+#
+# - track popularity in InvoiceLine is Zipf-distributed,
+# - album counts per artist are Zipf-distributed,
+# - playlist sizes follow a Pareto distribution (a few huge playlists, many small ones),
+# - employees form a 4-ary reporting tree several levels deep; customers are
+#   assigned to the leaves (the sales support agents).
+#
+# Rows are bulk-loaded with sqlite3 executemany in one transaction with
+# journaling off; secondary indexes, full-text search and the sales rollups
+# are built afterwards.
+import argparse
+import itertools
+import random
+import re
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.schema import CreateTable
+
+from app import rollups
+from app.database import Base, create_sqlite_engine
+from app.indexes import setup_indexes
+from app.search import setup_search
+
+DEFAULT_SOURCE = Path(__file__).resolve().parent.parent / "chinook.db"
+
+# Zipf exponents of track popularity and artist productivity
+TRACK_ZIPF_S = 1.07
+ARTIST_ZIPF_S = 1.0
+PLAYLIST_PARETO_ALPHA = 1.1
+PLAYLIST_PARETO_SCALE = 10
+EMPLOYEE_BRANCHING = 4
+
+INVOICE_START = date(2009, 1, 1)
+INVOICE_DAYS = 5 * 365
+
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z']+")
+
+
+def zipf_cum_weights(n: int, s: float) -> list:
+    return list(itertools.accumulate(1.0 / rank ** s for rank in range(1, n + 1)))
+
+
+class Source:
+    """Vocabulary and distributions sampled from an existing Chinook database."""
+
+    def __init__(self, path: str):
+        conn = sqlite3.connect(path)
+        self.genres = conn.execute("SELECT GenreId, Name FROM Genre ORDER BY GenreId").fetchall()
+        self.media_types = conn.execute("SELECT MediaTypeId, Name FROM MediaType ORDER BY MediaTypeId").fetchall()
+        self.tracks = conn.execute(
+            "SELECT GenreId, MediaTypeId, Composer, Milliseconds, Bytes, UnitPrice FROM Track"
+        ).fetchall()
+        self.album_sizes = [n for (n,) in conn.execute("SELECT COUNT(*) FROM Track GROUP BY AlbumId")]
+        self.invoice_sizes = [n for (n,) in conn.execute("SELECT COUNT(*) FROM InvoiceLine GROUP BY InvoiceId")]
+        self.words = sorted({
+            word for (name,) in conn.execute("SELECT Name FROM Track UNION ALL SELECT Title FROM Album")
+            for word in _WORD_RE.findall(name or "")
+        })
+        self.first_names = [n for (n,) in conn.execute("SELECT FirstName FROM Customer UNION SELECT FirstName FROM Employee")]
+        self.last_names = [n for (n,) in conn.execute("SELECT LastName FROM Customer UNION SELECT LastName FROM Employee")]
+        self.companies = [n for (n,) in conn.execute("SELECT Company FROM Customer")]
+        self.addresses = conn.execute(
+            "SELECT Address, City, State, Country, PostalCode, Phone, Fax FROM Customer"
+        ).fetchall()
+        conn.close()
+
+
+def title(rng: random.Random, words: list, low: int, high: int) -> str:
+    return " ".join(rng.choice(words).capitalize() for _ in range(rng.randint(low, high)))
+
+
+def email(first: str, last: str, number: int) -> str:
+    local = re.sub(r"[^a-z]", "", f"{first}.{last}".lower().encode("ascii", "ignore").decode()) or "user"
+    return f"{local}{number}@example.com"
+
+
+def generate(conn: sqlite3.Connection, source: Source, scale: int, rng: random.Random) -> dict:
+    counts = {}
+
+    def load(table: str, columns: tuple, rows):
+        rows = list(rows)
+        placeholders = ", ".join("?" * len(columns))
+        conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+        counts[table] = len(rows)
+        return rows
+
+    load("Genre", ("GenreId", "Name"), source.genres)
+    load("MediaType", ("MediaTypeId", "Name"), source.media_types)
+
+    # Artists and albums; a few artists release most of the albums
+    artist_count = 275 * scale
+    album_count = 347 * scale
+    load("Artist", ("ArtistId", "Name"), (
+        (artist_id, title(rng, source.words, 1, 3)) for artist_id in range(1, artist_count + 1)
+    ))
+    artist_ranks = list(range(1, artist_count + 1))
+    rng.shuffle(artist_ranks)
+    album_artists = rng.choices(artist_ranks, cum_weights=zipf_cum_weights(artist_count, ARTIST_ZIPF_S), k=album_count)
+    load("Album", ("AlbumId", "Title", "ArtistId"), (
+        (album_id, title(rng, source.words, 1, 4), artist_id)
+        for album_id, artist_id in enumerate(album_artists, start=1)
+    ))
+
+    # Tracks, album by album, each modelled on a random source track
+    tracks = []
+    for album_id in range(1, album_count + 1):
+        for _ in range(rng.choice(source.album_sizes)):
+            genre_id, media_type_id, composer, milliseconds, size, unit_price = rng.choice(source.tracks)
+            jitter = rng.uniform(0.8, 1.2)
+            tracks.append((
+                len(tracks) + 1, title(rng, source.words, 1, 5), album_id, media_type_id, genre_id,
+                composer, int(milliseconds * jitter), int(size * jitter) if size else size, unit_price,
+            ))
+    load("Track", (
+        "TrackId", "Name", "AlbumId", "MediaTypeId", "GenreId", "Composer", "Milliseconds", "Bytes", "UnitPrice"
+    ), tracks)
+    track_count = len(tracks)
+    prices = [track[8] for track in tracks]
+
+    # Employees: a complete EMPLOYEE_BRANCHING-ary tree under the general manager
+    employee_count = 8 * scale
+    employees = []
+    for employee_id in range(1, employee_count + 1):
+        manager_id = (employee_id - 2) // EMPLOYEE_BRANCHING + 1 if employee_id > 1 else None
+        is_leaf = (employee_id - 1) * EMPLOYEE_BRANCHING + 2 > employee_count
+        job = "General Manager" if manager_id is None else "Sales Support Agent" if is_leaf else "Sales Manager"
+        first, last = rng.choice(source.first_names), rng.choice(source.last_names)
+        address = rng.choice(source.addresses)
+        birth = date(1950, 1, 1) + timedelta(days=rng.randrange(30 * 365))
+        hired = date(2000, 1, 1) + timedelta(days=rng.randrange(8 * 365))
+        employees.append((
+            employee_id, last, first, job, manager_id,
+            f"{birth} 00:00:00", f"{hired} 00:00:00", *address, email(first, last, employee_id),
+        ))
+    load("Employee", (
+        "EmployeeId", "LastName", "FirstName", "Title", "ReportsTo", "BirthDate", "HireDate",
+        "Address", "City", "State", "Country", "PostalCode", "Phone", "Fax", "Email",
+    ), employees)
+    support_reps = [employee[0] for employee in employees if employee[3] == "Sales Support Agent"]
+
+    # Customers
+    customer_count = 59 * scale
+    customers = []
+    for customer_id in range(1, customer_count + 1):
+        first, last = rng.choice(source.first_names), rng.choice(source.last_names)
+        customers.append((
+            customer_id, first, last, rng.choice(source.companies), *rng.choice(source.addresses),
+            email(first, last, customer_id), rng.choice(support_reps),
+        ))
+    load("Customer", (
+        "CustomerId", "FirstName", "LastName", "Company", "Address", "City", "State", "Country",
+        "PostalCode", "Phone", "Fax", "Email", "SupportRepId",
+    ), customers)
+
+    # Invoices in date order; the tracks on them follow a Zipf popularity curve
+    invoice_count = 412 * scale
+    track_ranks = list(range(1, track_count + 1))
+    rng.shuffle(track_ranks)
+    track_weights = zipf_cum_weights(track_count, TRACK_ZIPF_S)
+    days = sorted(rng.randrange(INVOICE_DAYS) for _ in range(invoice_count))
+    invoices = []
+    lines = []
+    for invoice_id, day in enumerate(days, start=1):
+        customer = customers[rng.randrange(customer_count)]
+        total = 0.0
+        size = rng.choice(source.invoice_sizes)
+        for track_id in dict.fromkeys(rng.choices(track_ranks, cum_weights=track_weights, k=size)):
+            lines.append((len(lines) + 1, invoice_id, track_id, prices[track_id - 1], 1))
+            total += prices[track_id - 1]
+        invoices.append((
+            invoice_id, customer[0], f"{INVOICE_START + timedelta(days=day)} 00:00:00",
+            customer[4], customer[5], customer[6], customer[7], customer[8], round(total, 2),
+        ))
+    load("Invoice", (
+        "InvoiceId", "CustomerId", "InvoiceDate", "BillingAddress", "BillingCity", "BillingState",
+        "BillingCountry", "BillingPostalCode", "Total",
+    ), invoices)
+    load("InvoiceLine", ("InvoiceLineId", "InvoiceId", "TrackId", "UnitPrice", "Quantity"), lines)
+
+    # Playlists: Pareto-distributed sizes, capped at the whole catalogue
+    playlist_count = 18 * scale
+    load("Playlist", ("PlaylistId", "Name"), (
+        (playlist_id, title(rng, source.words, 1, 3)) for playlist_id in range(1, playlist_count + 1)
+    ))
+    load("PlaylistTrack", ("PlaylistId", "TrackId"), (
+        (playlist_id, track_id)
+        for playlist_id in range(1, playlist_count + 1)
+        for track_id in rng.sample(
+            range(1, track_count + 1),
+            min(track_count, int(rng.paretovariate(PLAYLIST_PARETO_ALPHA) * PLAYLIST_PARETO_SCALE)),
+        )
+    ))
+    return counts
+
+
+def build(output: Path, source_path: str, scale: int, seed: int) -> dict:
+    # Tables as declared by the models, without their secondary indexes. The
+    # rollups are created and filled by setup_rollups() once the sales
+    # history is loaded.
+    metadata_engine = create_engine(f"sqlite:///{output}")
+    with metadata_engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not table.name.startswith("SalesBy"):
+                conn.execute(CreateTable(table))
+    metadata_engine.dispose()
+
+    conn = sqlite3.connect(output)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    with conn:
+        counts = generate(conn, Source(source_path), scale, random.Random(seed))
+    conn.close()
+
+    # Full-text search, sales rollups, indexes and planner statistics (ANALYZE
+    # runs in setup_indexes()), as the app would have them. Indexes are
+    # cheaper to build once than to maintain per row.
+    engine = create_sqlite_engine(f"sqlite:///{output}")
+    setup_search(engine)
+    rollups.setup_rollups(engine)
+    setup_indexes(engine)
+    engine.dispose()
+    return counts
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate a scaled synthetic Chinook database")
+    parser.add_argument("--scale", type=int, default=10, help="size multiplier, e.g. 10, 100, 1000")
+    parser.add_argument("--output", required=True, help="path of the database to create")
+    parser.add_argument("--source", default=str(DEFAULT_SOURCE), help="database to sample vocabulary from")
+    parser.add_argument("--seed", type=int, default=42, help="random seed, for reproducible databases")
+    parser.add_argument("--force", action="store_true", help="overwrite the output if it exists")
+    args = parser.parse_args(argv)
+
+    output = Path(args.output)
+    if output.exists():
+        if not args.force:
+            parser.error(f"{output} exists; use --force to overwrite it")
+        output.unlink()
+
+    start = time.perf_counter()
+    counts = build(output, args.source, args.scale, args.seed)
+    for table, count in counts.items():
+        print(f"{table:<14} {count:>10,}")
+    print(f"Built {output} ({output.stat().st_size / 2**20:,.0f} MiB) in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+class Scenario:
+    """One benchmarked request.
+
+    `path` and `body` are either fixed values or callables of (i, context),
+    where `i` counts the scenario's requests (warmup included) and `context`
+    holds the ids created by prepare(). Write scenarios use them to send
+    fresh data on every request.
+    """
+
+    def __init__(self, name: str, method: str, path, body=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.body = body
+
+    def request(self, i: int, context: dict):
+        path = self.path(i, context) if callable(self.path) else self.path
+        body = self.body(i, context) if callable(self.body) else self.body
+        return self.method, path, body
+
+
+async def prepare(client) -> dict:
+    """Create the rows the write scenarios work on."""
+    response = await client.post("/playlists/", json={"Name": "Benchmark playlist"})
+    response.raise_for_status()
+    return {"playlist_id": response.json()["PlaylistId"]}
+
+
+def _track_id(i: int) -> int:
+    # Stays within the bundled database's 3503 tracks
+    return i % 3000 + 1
+
+
+SCENARIOS = [
+    # Artists
+    Scenario("artists.list", "GET", "/artists/?limit=100"),
+    Scenario("artists.detail", "GET", "/artists/90"),
+    Scenario("artists.create", "POST", "/artists/", lambda i, ctx: {"Name": f"Benchmark Artist {i}"}),
+
+    # Albums
+    Scenario("albums.list", "GET", "/albums/?limit=100"),
+    Scenario("albums.detail", "GET", "/albums/1"),
+    Scenario("albums.by_artist", "GET", "/albums/by-artist/90"),
+    Scenario("albums.detail_include", "GET", "/albums/1?include=artist,tracks.genre"),
+
+    # Tracks
+    Scenario("tracks.list", "GET", "/tracks/?limit=100"),
+    Scenario("tracks.list_offset", "GET", "/tracks/?skip=3000&limit=100"),
+    Scenario("tracks.list_by_genre", "GET", "/tracks/?genre_id=1&limit=100"),
+    Scenario("tracks.list_sparse", "GET", "/tracks/?limit=100&fields=TrackId,Name,UnitPrice"),
+    Scenario("tracks.detail", "GET", "/tracks/1"),
+    Scenario("tracks.ids", "GET", "/tracks/?ids=" + ",".join(str(i) for i in range(1, 3000, 30))),
+    Scenario("tracks.search", "GET", "/tracks/search/?query=love"),
+    Scenario("autocomplete", "GET", "/autocomplete?q=lo"),
+    Scenario("tracks.create", "POST", "/tracks/", lambda i, ctx: {
+        "Name": f"Benchmark Track {i}", "AlbumId": 1, "MediaTypeId": 1, "GenreId": 1,
+        "Milliseconds": 200000, "Bytes": 6000000, "UnitPrice": 0.99,
+    }),
+
+    # Genres and media types
+    Scenario("genres.list", "GET", "/genres/"),
+    Scenario("genres.tracks", "GET", "/genres/1/tracks?limit=100"),
+    Scenario("media_types.list", "GET", "/media-types/"),
+    Scenario("media_types.tracks", "GET", "/media-types/1/tracks?limit=100"),
+
+    # Customers
+    Scenario("customers.list", "GET", "/customers/?limit=100"),
+    Scenario("customers.list_sparse", "GET", "/customers/?limit=100&fields=CustomerId,Email"),
+    Scenario("customers.detail", "GET", "/customers/1"),
+    Scenario("customers.with_invoices", "GET", "/customers/1/with-invoices"),
+    Scenario("customers.search", "GET", "/customers/search/an"),
+
+    # Employees
+    Scenario("employees.list", "GET", "/employees/"),
+    Scenario("employees.detail", "GET", "/employees/1"),
+    Scenario("employees.subordinates", "GET", "/employees/2/subordinates"),
+    Scenario("employees.reports_all", "GET", "/employees/1/reports?depth=all"),
+    Scenario("employees.customers_recursive", "GET", "/employees/1/customers?recursive=true"),
+    Scenario("employees.portfolio", "GET", "/employees/3/portfolio"),
+
+    # Invoices and invoice lines
+    Scenario("invoices.list", "GET", "/invoices/?limit=100"),
+    Scenario("invoices.detail", "GET", "/invoices/1"),
+    Scenario("invoices.lines", "GET", "/invoices/1/lines"),
+    Scenario("invoices.by_customer", "GET", "/invoices/customer/1"),
+    Scenario("invoices.create_line", "POST", "/invoices/1/lines", lambda i, ctx: {
+        "InvoiceId": 1, "TrackId": _track_id(i), "UnitPrice": 0.99, "Quantity": 1,
+    }),
+    Scenario("invoices.checkout", "POST", "/invoices/checkout", lambda i, ctx: {
+        "CustomerId": i % 59 + 1, "TrackIds": [_track_id(i), _track_id(i + 1), _track_id(i + 2)],
+    }),
+
+    # Playlists and playlist tracks; add and remove work on the same tracks
+    Scenario("playlists.list", "GET", "/playlists/"),
+    Scenario("playlists.detail", "GET", "/playlists/3"),
+    Scenario("playlists.tracks", "GET", "/playlists/1/tracks"),
+    Scenario("playlists.tracks_by_name", "GET", "/playlists/1/tracks?sort=name"),
+    Scenario(
+        "playlists.add_track", "POST",
+        lambda i, ctx: f"/playlists/{ctx['playlist_id']}/tracks?track_id={_track_id(i)}",
+    ),
+    Scenario(
+        "playlists.remove_track", "DELETE",
+        lambda i, ctx: f"/playlists/{ctx['playlist_id']}/tracks/{_track_id(i)}",
+    ),
+
+    # Reports and export
+    Scenario("reports.sales_genres", "GET", "/reports/sales/genres"),
+    Scenario("reports.revenue_month", "GET", "/reports/revenue?granularity=month"),
+    Scenario("export.invoices", "GET", "/export/invoices"),
+]
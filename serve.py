@@ -0,0 +1,163 @@
+import argparse
+import logging
+import os
+import signal
+import sys
+import time
+
+import uvicorn
+
+# Production entry point: several uvicorn worker processes accept connections
+# on one shared socket and share the SQLite database in WAL mode. Reads run in
+# parallel across the workers; writes take the cross-process write lock in
+# app.database, so only one worker at a time holds the SQLite write lock.
+#
+#     python serve.py --workers 4 --preload
+#
+# SIGTERM or SIGINT shuts the workers down gracefully: they stop accepting
+# connections and finish the requests in flight for up to --graceful-timeout
+# seconds. Workers that die are restarted, after a delay that doubles each
+# time the same worker dies again within MIN_UPTIME seconds of starting; when
+# one does that MAX_QUICK_EXITS times in a row, e.g. because the app fails to
+# import, the supervisor shuts down with status 1 instead.
+
+logger = logging.getLogger("uvicorn.error")
+
+MIN_UPTIME = 10  # seconds
+MAX_QUICK_EXITS = 5
+FIRST_RESTART_DELAY = 0.5  # seconds
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Chinook API with several worker processes")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=56313)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: the number of CPU cores)")
+    parser.add_argument("--preload", action="store_true",
+                        help="import the app and prepare the database before forking the workers")
+    parser.add_argument("--graceful-timeout", type=int, default=30,
+                        help="seconds the workers get to finish their requests on shutdown")
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args(argv)
+
+
+def spawn_worker(config: uvicorn.Config, sock) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    # uvicorn installs its own SIGINT/SIGTERM handlers for the graceful shutdown
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    status = 0
+    try:
+        uvicorn.Server(config).run(sockets=[sock])
+    except BaseException:
+        logger.exception("Worker %d failed", os.getpid())
+        status = 1
+    finally:
+        # Skip the interpreter shutdown inherited from the supervisor
+        logging.shutdown()
+        os._exit(status)
+
+
+def reap(workers: set) -> list:
+    """Collect the workers that exited, without blocking."""
+    exited = []
+    while workers:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            break
+        if pid in workers:
+            workers.discard(pid)
+            exited.append((pid, os.waitstatus_to_exitcode(status)))
+    return exited
+
+
+def stop_workers(workers: set, timeout: float):
+    for pid in workers:
+        os.kill(pid, signal.SIGTERM)
+    deadline = time.monotonic() + timeout
+    while workers and time.monotonic() < deadline:
+        reap(workers)
+        time.sleep(0.1)
+    for pid in workers:
+        logger.warning("Killing worker %d after the graceful timeout", pid)
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+    workers.clear()
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.workers < 1:
+        sys.exit("--workers must be at least 1")
+    # Read by app.config, so it has to be set before the app is imported
+    os.environ["CHINOOK_WORKERS"] = str(args.workers)
+
+    config = uvicorn.Config(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        log_level=args.log_level,
+        timeout_graceful_shutdown=args.graceful_timeout,
+    )
+    if args.preload:
+        # The workers inherit the imported app and an up-to-date database
+        # instead of each importing and migrating it
+        config.load()
+        from app.main import setup_database
+        setup_database()
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.append(signum))
+
+    sock = config.bind_socket()
+    workers = set()
+    slots = {}  # pid: (slot, start time)
+    quick_exits = [0] * args.workers  # per slot, in a row
+    restarts = {slot: time.monotonic() for slot in range(args.workers)}  # slot: when to (re)start
+    failed = False
+
+    def start_due():
+        now = time.monotonic()
+        for slot, due in list(restarts.items()):
+            if due <= now:
+                del restarts[slot]
+                pid = spawn_worker(config, sock)
+                workers.add(pid)
+                slots[pid] = (slot, now)
+
+    start_due()
+    logger.info("Started %d workers (supervisor pid %d)", len(workers), os.getpid())
+
+    while not stopping and not failed:
+        for pid, status in reap(workers):
+            slot, started = slots.pop(pid)
+            if time.monotonic() - started < MIN_UPTIME:
+                quick_exits[slot] += 1
+            else:
+                quick_exits[slot] = 0
+            if quick_exits[slot] >= MAX_QUICK_EXITS:
+                logger.error(
+                    "Worker %d exited with status %d, %d times in a row within %ds of starting; giving up",
+                    pid, status, quick_exits[slot], MIN_UPTIME,
+                )
+                failed = True
+                break
+            delay = FIRST_RESTART_DELAY * 2 ** quick_exits[slot] if quick_exits[slot] else 0
+            logger.warning("Worker %d exited with status %d, restarting it in %.1fs", pid, status, delay)
+            restarts[slot] = time.monotonic() + delay
+        start_due()
+        time.sleep(0.5)
+
+    logger.info("Shutting down %d workers", len(workers))
+    # Allow for the lifespan shutdown on top of the request timeout
+    stop_workers(workers, args.graceful_timeout + 5)
+    sock.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())